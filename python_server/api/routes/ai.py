@@ -1,14 +1,40 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import sqlite3
 import os
+import json
+import asyncio
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
 from services.memory_manager import memory_manager
+from services.context_svc import build_ai_context, get_recent_logs
+from services.retrieval_svc import retrieval_index
+from services.memory_sync_svc import memory_sync
+from services.llm_client import llm_client, LLMError
+from services.llm_cache import llm_cache
+from services.llm_scheduler import llm_scheduler, INTERACTIVE, BACKGROUND
 
 router = APIRouter()
 
 class AIContextRequest(BaseModel):
     project_path: str
     limit: int = 20
+    token_budget: Optional[int] = None
+    query: Optional[str] = None  # 提供時附上全文檢索找到的相關記錄 (relevant)
+
+class SearchRequest(BaseModel):
+    query: str
+    kinds: Optional[List[str]] = None       # interaction / event / snapshot
+    project_path: Optional[str] = None      # 只搜尋此專案 (互動記錄不分專案，一律包含)
+    limit: int = 10
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    system: Optional[str] = None
+    stream: bool = True
+    options: Optional[dict] = None  # Ollama options, e.g. {"temperature": 0.2}
+    use_cache: bool = True
+    background: bool = False  # 批次工作：排在互動請求之後
 
 class InteractionLogRequest(BaseModel):
     user_query: str
@@ -16,31 +42,111 @@ class InteractionLogRequest(BaseModel):
 
 @router.post("/context")
 async def get_ai_context(request: AIContextRequest):
-    # 1. Get Memory OS System Prompt
-    system_prompt = memory_manager.get_system_context()
+    # token_budget: 依預算挑選並截斷各區塊，回傳 token_usage
+    if request.token_budget:
+        context = build_ai_context(request.project_path, request.token_budget, request.limit)
+    else:
+        # 1. Get Memory OS System Prompt
+        system_prompt = memory_manager.get_system_context()
+
+        # 2. Get Recent Logs from SQLite (Legacy/DB logs)
+        logs = get_recent_logs(request.project_path, request.limit)
+
+        context = {
+            "system_prompt": system_prompt,
+            "recent_logs": logs
+        }
 
-    # 2. Get Recent Logs from SQLite (Legacy/DB logs)
-    db_path = os.path.join(request.project_path, "codesynth_history.db")
-    logs = []
-    if os.path.exists(db_path):
+    # 3. Relevant past items from the retrieval index
+    if request.query:
+        context["relevant"] = await run_in_threadpool(
+            _search, request.query, None, request.project_path, 5)
+    return context
+
+def _search(query, kinds, project_path, limit):
+    # 緩衝中的互動先寫入 (寫入後會自動加入索引)
+    memory_manager.log_writer.flush()
+    retrieval_index.sync_logs(memory_manager.root_path / "logs")
+    project = os.path.realpath(project_path) if project_path else None
+    return retrieval_index.search(query, kinds, project, limit)
+
+@router.post("/search")
+async def search_memory(request: SearchRequest):
+    """
+    Full-text search over interaction logs, ai_friendly_log events and snapshots
+    """
+    results = await run_in_threadpool(
+        _search, request.query, request.kinds, request.project_path, request.limit)
+    return {"status": "success", "results": results}
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """執行 coro；HTTP client 斷線時取消 (排隊中的請求不會送到模型)"""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=0.5)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
+@router.post("/generate")
+async def generate(request: GenerateRequest, http_request: Request):
+    """
+    Generate with the local model. stream=true returns NDJSON lines
+    ({"response": "...", "done": false} ... {"done": true, ...}) as tokens arrive
+    """
+    priority = BACKGROUND if request.background else INTERACTIVE
+    if not request.stream:
+        text = await _cancel_on_disconnect(http_request, llm_client.generate_async(
+            request.prompt, system=request.system, options=request.options,
+            use_cache=request.use_cache, priority=priority))
+        return {"status": "success" if text else "error", "response": text}
+
+    async def ndjson():
+        # 斷線時 StreamingResponse 會取消此 generator，釋放排程名額
         try:
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM ai_friendly_log 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            """, (request.limit,))
-            logs = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-        except Exception as e:
-            print(f"Error reading sqlite logs: {e}")
-
-    return {
-        "system_prompt": system_prompt,
-        "recent_logs": logs
-    }
+            async for chunk in llm_client.stream_async(request.prompt, system=request.system,
+                                                       options=request.options, use_cache=request.use_cache,
+                                                       priority=priority):
+                yield json.dumps(chunk, ensure_ascii=False) + "\n"
+        except LLMError as e:
+            yield json.dumps({"error": str(e), "done": True}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.get("/llm_queue")
+async def get_llm_queue():
+    """
+    LLM scheduler state: in-flight requests, queue depth and wait times per priority
+    """
+    return llm_scheduler.stats()
+
+@router.get("/llm_status")
+async def get_llm_status():
+    """
+    Model residency, warm-up result and load vs generation time per call
+    """
+    return await llm_client.status()
+
+@router.post("/keepalive")
+async def llm_keepalive():
+    """
+    Heartbeat from the cockpit: keeps the local model loaded while the panel is open
+    """
+    return await llm_client.ping()
+
+@router.get("/llm_cache")
+async def get_llm_cache_stats():
+    """
+    LLM response cache size and hit/miss counters
+    """
+    return await run_in_threadpool(llm_cache.stats)
+
+@router.post("/llm_cache/clear")
+async def clear_llm_cache():
+    await run_in_threadpool(llm_cache.clear)
+    return {"status": "cleared"}
 
 @router.post("/log_interaction")
 async def log_interaction(request: InteractionLogRequest):
@@ -50,9 +156,8 @@ async def log_interaction(request: InteractionLogRequest):
     try:
         memory_manager.log_interaction(request.user_query, request.ai_response)
         
-        # Trigger background sync (fire and forget logic or await if fast)
-        # For now we await it to ensure safety, or we could use BackgroundTasks
-        await memory_manager.sync_memory()
+        # Git sync is debounced and coalesced in the background
+        memory_sync.notify()
         
         return {"status": "success"}
     except Exception as e:
@@ -70,13 +175,20 @@ async def trigger_condense():
     """
     Triggers memory condensation (LLM Summarization)
     """
-    await memory_manager.condense_memory()
-    return {"status": "condensed"}
+    result = await memory_manager.condense_memory()
+    return {"status": "condensed", **result}
 
 @router.post("/sync_memory")
 async def trigger_sync():
     """
     Manually trigger memory sync
     """
-    await memory_manager.sync_memory()
-    return {"status": "synced"}
+    status = await memory_manager.sync_memory()
+    return {"status": "synced" if status["last_error"] is None else "error", "sync": status}
+
+@router.get("/sync_status")
+async def get_sync_status():
+    """
+    Background memory sync state (pending changes, failures, next attempt)
+    """
+    return memory_sync.status()
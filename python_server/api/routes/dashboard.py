@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from services.query_svc import (
@@ -9,7 +9,10 @@ from services.query_svc import (
     batch_update_tags_logic,
     get_tags_logic,
     get_versions_by_tag_logic,
-    get_screenshots_logic
+    get_screenshots_logic,
+    search_history_logic,
+    SEARCH_MAX_LIMIT,
+    SEARCH_MAX_MATCHES
 )
 
 router = APIRouter()
@@ -45,6 +48,20 @@ class ScreenshotsRequest(BaseModel):
     project_path: str
     version_id: int
 
+class SearchHistoryRequest(BaseModel):
+    project_path: str
+    query: str
+    mode: str = "literal"  # literal / prefix / regex
+    file_path: Optional[str] = None  # glob，例如 "src/*.py"
+    feature_tag: Optional[str] = None
+    status: Optional[str] = None
+    since: Optional[float] = None
+    until: Optional[float] = None
+    case_sensitive: bool = False
+    before_id: Optional[int] = None
+    limit: int = 50
+    max_matches: int = 10
+
 
 @router.post("/dashboard")
 async def api_get_dashboard(req: ProjectPathRequest):
@@ -77,3 +94,18 @@ async def api_get_versions_by_tag(req: GetVersionsByTagRequest):
 @router.post("/screenshots")
 async def api_get_screenshots(req: ScreenshotsRequest):
     return get_screenshots_logic(req.project_path, req.version_id)
+
+@router.post("/search_history")
+def api_search_history(req: SearchHistoryRequest):
+    # 同步 def：FastAPI 會在 threadpool 執行，大量歷史的掃描不會阻塞 event loop
+    try:
+        return search_history_logic(
+            req.project_path, req.query, req.mode,
+            file_path=req.file_path, feature_tag=req.feature_tag, status=req.status,
+            since=req.since, until=req.until, case_sensitive=req.case_sensitive,
+            before_id=req.before_id,
+            limit=max(1, min(req.limit, SEARCH_MAX_LIMIT)),
+            max_matches=max(1, min(req.max_matches, SEARCH_MAX_MATCHES)),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
 from services.preview_svc import PreviewService
+from services.preview_watch_svc import preview_watch_service
 
 router = APIRouter()
 svc = PreviewService()
@@ -22,24 +25,47 @@ class PreviewUpdateRequest(BaseModel):
     file_path: str
     original_text: str
     new_text: str
+    cs_id: Optional[int] = None          # 注入時的 data-cs-id，缺少時使用文字比對
+    base_version: Optional[str] = None   # 頁面載入時的檔案版本，不符時回傳 409
 
 @router.post("/preview/{session_id}/update")
 async def api_update_preview_file(session_id: str, req: PreviewUpdateRequest):
-    """視覺化編輯更新"""
+    """視覺化編輯更新 (檔案寫入與快照在 threadpool 執行)"""
     try:
-        return svc.update_file_content(session_id, req.file_path, req.original_text, req.new_text)
+        return await run_in_threadpool(svc.update_file_content, session_id, req.file_path,
+                                       req.original_text, req.new_text, req.cs_id, req.base_version)
     except Exception as e:
         # Check specific http exception
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+class PreviewBatchUpdateRequest(BaseModel):
+    edits: List[PreviewUpdateRequest]
+
+@router.post("/preview/{session_id}/batch_update")
+async def api_batch_update_preview(session_id: str, req: PreviewBatchUpdateRequest):
+    """批次視覺化編輯：同一檔案的多筆修改合併為一次讀寫"""
+    edits = [edit.model_dump() for edit in req.edits]
+    return await run_in_threadpool(svc.batch_update, session_id, edits)
+
+@router.get("/preview/{session_id}/_codesynth/events")
+async def api_preview_events(session_id: str, request: Request):
+    """即時預覽：以 Server-Sent Events 推送專案檔案變更 (需註冊在檔案路由之前)"""
+    project_path = svc.get_session_path(session_id)
+    return StreamingResponse(
+        preview_watch_service.event_stream(project_path, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/preview/{session_id}/{file_path:path}")
-async def api_get_preview_file(session_id: str, file_path: str):
-    """取得預覽檔案"""
+async def api_get_preview_file(session_id: str, file_path: str, request: Request):
+    """取得預覽檔案 (支援 ETag / Last-Modified 條件式請求)"""
     if not file_path or file_path == "":
         file_path = "index.html"
     elif file_path.endswith("/"):
         file_path += "index.html"
         
-    return svc.get_file_response(session_id, file_path)
+    # 讀檔與 gzip / brotli 壓縮在 threadpool 執行，避免阻塞 event loop (即時預覽的 SSE 串流)
+    return await run_in_threadpool(svc.get_file_response, session_id, file_path, request.headers)
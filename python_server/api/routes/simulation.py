@@ -1,14 +1,40 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List, Optional
 from services.simulation_svc import start_simulation_logic
+from services.matrix_svc import run_simulation_matrix_logic
 
 router = APIRouter()
 
+class SimulationLimits(BaseModel):
+    # 未指定的欄位使用伺服器預設值；0 代表不限制
+    cpu_seconds: Optional[int] = None
+    memory_mb: Optional[int] = None
+    open_files: Optional[int] = None
+    file_size_mb: Optional[int] = None
+
 class SimulationRequest(BaseModel):
     project_path: str
     selection: Dict[str, int] = {}
+    limits: Optional[SimulationLimits] = None
+
+class SimulationMatrixRequest(BaseModel):
+    project_path: str
+    candidates: Dict[str, List[int]]
+    mode: str = "cartesian"  # "cartesian" | "pairwise"
+    max_workers: Optional[int] = None
+    timeout: int = 30
+    limits: Optional[SimulationLimits] = None
 
 @router.post("/simulation/start")
 async def api_start_simulation(req: SimulationRequest):
-    return start_simulation_logic(req.model_dump())
+    return start_simulation_logic(req.model_dump(exclude_none=True))
+
+@router.post("/simulation/matrix")
+async def api_simulation_matrix(req: SimulationMatrixRequest):
+    """版本矩陣測試：執行多個檔案候選版本的組合"""
+    try:
+        return await run_in_threadpool(run_simulation_matrix_logic, req.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from fastapi.concurrency import run_in_threadpool
 from services.skill_svc import SkillService
 
 router = APIRouter()
@@ -9,6 +10,13 @@ class InstallSkillRequest(BaseModel):
     project_path: str
     skill_id: str
     params: Dict[str, Any] = {}
+    overwrite: bool = False
+
+class InstallSkillsRequest(BaseModel):
+    project_path: str
+    skill_ids: List[str]
+    params: Dict[str, Dict[str, Any]] = {}  # skill_id -> 參數
+    overwrite: bool = False
 
 @router.get("/list")
 async def list_skills(request: Request):
@@ -22,11 +30,22 @@ async def install_skill(req: InstallSkillRequest, request: Request):
     """安裝指定的技能包到專案"""
     try:
         svc = SkillService(request.app.state.server_root)
-        result = svc.install_skill(req.skill_id, req.project_path, req.params)
+        result = svc.install_skill(req.skill_id, req.project_path, req.params, req.overwrite)
         
         if result.get("status") == "error":
             raise HTTPException(status_code=400, detail=result.get("message"))
             
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/install_batch")
+async def install_skills(req: InstallSkillsRequest, request: Request):
+    """一次安裝多個技能包 (全部成功或全部不套用)"""
+    svc = SkillService(request.app.state.server_root)
+    result = await run_in_threadpool(svc.install_skills, req.skill_ids, req.project_path, req.params, req.overwrite)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=400, detail=result.get("message"))
+    return result
@@ -1,5 +1,6 @@
 import sqlite3
 import os
+from pathlib import Path
 
 
 def _get_existing_columns(cursor, table_name: str) -> set:
@@ -18,6 +19,57 @@ def _ensure_column(cursor, table_name: str, column_name: str, column_def: str, e
             print(f"[WARNING] Failed to add {column_name} column: {e}")
 
 
+_HISTORY_FTS_UNAVAILABLE = False
+# 已確認建立 history_fts 的資料庫 (路徑, inode)，每個資料庫每個行程只檢查一次
+_HISTORY_FTS_READY = set()
+
+
+def history_fts_available(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='history_fts'")
+    return cursor.fetchone() is not None
+
+
+def _ensure_history_fts(cursor):
+    """
+    history.content 的 FTS5 trigram 索引 (external content，不重複儲存內容)
+    由觸發器同步維護；首次建立時對既有資料 rebuild 一次
+    """
+    global _HISTORY_FTS_UNAVAILABLE
+    if _HISTORY_FTS_UNAVAILABLE or history_fts_available(cursor):
+        return
+    try:
+        cursor.execute("""CREATE VIRTUAL TABLE history_fts USING fts5(
+                              content, content='history', content_rowid='id', tokenize='trigram')""")
+    except sqlite3.OperationalError as e:
+        # SQLite 未編譯 FTS5 或版本過舊 (trigram 需 3.34+)，搜尋改用全表掃描
+        _HISTORY_FTS_UNAVAILABLE = True
+        print(f"[WARNING] FTS5 trigram unavailable, snapshot search will scan history: {e}")
+        return
+
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS history_fts_ai AFTER INSERT ON history BEGIN
+                          INSERT INTO history_fts(rowid, content) VALUES (new.id, new.content);
+                      END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS history_fts_ad AFTER DELETE ON history BEGIN
+                          INSERT INTO history_fts(history_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                      END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS history_fts_au AFTER UPDATE OF content ON history BEGIN
+                          INSERT INTO history_fts(history_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                          INSERT INTO history_fts(rowid, content) VALUES (new.id, new.content);
+                      END""")
+    cursor.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+    print("[INFO] DB Schema Updated: Built 'history_fts' search index.")
+
+
+def get_read_db(project_path):
+    """
+    以唯讀模式開啟既有的資料庫，回傳 (connection, db_path)
+    不執行 Schema 初始化，供頻繁的讀取路徑使用；資料庫不存在時拋出 sqlite3.OperationalError
+    """
+    db_path = os.path.join(project_path, "codesynth_history.db")
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    return conn, db_path
+
+
 def get_db(project_path):
     """
     建立並回傳 (connection, db_path)
@@ -41,6 +93,15 @@ def get_db(project_path):
     existing_cols = _get_existing_columns(c, "history")
     _ensure_column(c, "history", "status", "TEXT DEFAULT 'pending'", existing_cols)
     _ensure_column(c, "history", "feature_tag", "TEXT", existing_cols)
+    # FTS 索引與觸發器只需在此資料庫第一次開啟時檢查
+    try:
+        db_key = (os.path.realpath(db_path), os.stat(db_path).st_ino)
+    except OSError:
+        db_key = None
+    if db_key not in _HISTORY_FTS_READY:
+        _ensure_history_fts(c)
+        if db_key is not None:
+            _HISTORY_FTS_READY.add(db_key)
 
     # 表 2: components (Blueprint Mode - 舊版相容)
     c.execute('''CREATE TABLE IF NOT EXISTS components
@@ -59,6 +120,9 @@ def get_db(project_path):
                   test_status TEXT,
                   FOREIGN KEY (version_id) REFERENCES history(id))''')
 
+    existing_cols = _get_existing_columns(c, "screenshots")
+    _ensure_column(c, "screenshots", "thumbnail_path", "TEXT", existing_cols)
+
     # 表 4: ai_friendly_log (AI 友好的歷程記錄)
     c.execute('''CREATE TABLE IF NOT EXISTS ai_friendly_log
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -74,6 +138,9 @@ def get_db(project_path):
                   ai_summary TEXT,
                   next_action TEXT)''')
 
+    existing_cols = _get_existing_columns(c, "ai_friendly_log")
+    _ensure_column(c, "ai_friendly_log", "resource_usage", "TEXT", existing_cols)
+
     # 表 5: stages (階段定義)
     c.execute('''CREATE TABLE IF NOT EXISTS stages
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -2,11 +2,17 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
+import asyncio
 import sys
 # Add current directory to sys.path to allow absolute imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from api.routes import snapshot, dashboard, simulation, ai, health, stage, skill, wizard, preview
+from utils.screenshot import screenshot_worker
+from services.memory_manager import memory_manager
+from services.memory_sync_svc import memory_sync
+from services.llm_client import llm_client, WARMUP_ON_START
+from services.llm_cache import llm_cache
 
 # 統一版本號管理
 APP_VERSION = "2.0.0"
@@ -46,6 +52,26 @@ app.include_router(wizard.router, prefix="/api/wizard", tags=["Wizard"])
 app.include_router(ai.router, prefix="/api/ai", tags=["AI"])
 app.include_router(preview.router, prefix="/api", tags=["Preview"]) # PREVIEW-03: 註冊預覽路由 (包含 /api/preview/init 和 /api/preview/{session_id})
 
+@app.on_event("startup")
+async def on_startup():
+    # 背景載入本機模型，不延遲伺服器啟動
+    if WARMUP_ON_START:
+        app.state.llm_warmup = asyncio.create_task(llm_client.warm_up())
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # 等待背景截圖寫入完成
+    screenshot_worker.stop()
+    # 寫入緩衝中的互動記錄，再送出尚未同步的 memory 變更
+    memory_manager.log_writer.close()
+    memory_sync.stop()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    # 關閉 Ollama 連線池
+    await llm_client.aclose()
+    llm_cache.close()
+
 # [Phase 9] Live Preview Infrastructure
 # 注意：不再掛載 "." (python_server 自身)，改為只提供使用者預覽端點
 # 實際掛載路徑會在 API 呼叫時動態指定使用者專案目錄
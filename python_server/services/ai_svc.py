@@ -1,5 +1,8 @@
 from database.connection import get_db
 from utils.logger import server_logger as logger
+from services.retrieval_svc import retrieval_index
+import os
+import json
 import time
 import uuid
 
@@ -8,21 +11,33 @@ _session_id = str(uuid.uuid4())[:8]
 
 def log_ai_event(project_path, what_happened="", current_status="", 
                  test_result="", error_message="", screenshot_path="",
-                 ai_summary="", next_action=""):
-    """記錄 AI 友好事件到資料庫"""
+                 ai_summary="", next_action="", resource_usage=None, related_files=""):
+    """
+    記錄 AI 友好事件到資料庫
+    resource_usage: 模擬執行的資源使用量 (user/sys time, max RSS)，以 JSON 字串保存
+    """
     conn = None
     try:
+        timestamp = time.time()
         conn, _ = get_db(project_path)
         c = conn.cursor()
         c.execute('''INSERT INTO ai_friendly_log 
                      (session_id, timestamp, what_happened, current_status,
                       related_files, related_versions, test_result, 
-                      error_message, screenshot_path, ai_summary, next_action)
-                     VALUES (?,?,?,?,?,?,?,?,?,?,?)''',
-                 (_session_id, time.time(), what_happened, current_status,
-                  "", "", test_result, error_message, screenshot_path,
-                  ai_summary, next_action))
+                      error_message, screenshot_path, ai_summary, next_action,
+                      resource_usage)
+                     VALUES (?,?,?,?,?,?,?,?,?,?,?,?)''',
+                 (_session_id, timestamp, what_happened, current_status,
+                  related_files, "", test_result, error_message, screenshot_path,
+                  ai_summary, next_action,
+                  json.dumps(resource_usage) if resource_usage else None))
         conn.commit()
+
+        # 同步加入全文檢索索引
+        text = "\n".join(t for t in (what_happened, current_status, related_files, test_result,
+                                      error_message, ai_summary, next_action) if t)
+        retrieval_index.add("event", text, source="ai_friendly_log", ref=c.lastrowid,
+                            project=os.path.realpath(project_path), timestamp=timestamp)
     except Exception as e:
         logger.error(f"AI Log 記錄失敗: {e}")
     finally:
@@ -0,0 +1,180 @@
+import os
+import re
+import copy
+import json
+import sqlite3
+from utils.cache import LRUCache
+from utils.logger import server_logger as logger
+from database.connection import get_read_db
+from services.memory_manager import memory_manager
+
+# 粗估 token 數：CJK 字元約 1 token/字，其餘約 4 字元/token
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_LEARNED_RE = re.compile(r"^### Learned from .*$", re.M)
+
+# 保留必要區塊 (SOUL / IDENTITY / 使用者基本資料) 後，剩餘預算的分配比例；
+# 某區塊用不完的額度會依此順序讓給下一個區塊
+SECTION_SHARES = (("learned", 0.4), ("memory", 0.3), ("logs", 0.3))
+TRUNCATED_MARK = "... (truncated)"
+
+# (memory 檔案狀態, 專案路徑, 資料庫狀態, token_budget, limit) -> 結果
+CONTEXT_CACHE = LRUCache(max_entries=32)
+
+LOG_FIELDS = ("what_happened", "current_status", "related_files", "test_result",
+              "error_message", "ai_summary", "next_action")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _trim_lines(text: str, budget: int):
+    """保留開頭的行直到用完預算，回傳 (文字, token 數)"""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text, tokens
+    kept, used = [], estimate_tokens(TRUNCATED_MARK)
+    for line in text.split("\n"):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if not kept:
+        return "", 0
+    return "\n".join(kept) + "\n" + TRUNCATED_MARK, used
+
+
+def _split_user_profile(user: str):
+    """USER.md = 基本資料 + 多個 condense_memory 附加的 "### Learned from" 區塊 (舊到新)"""
+    matches = list(_LEARNED_RE.finditer(user))
+    if not matches:
+        return user, []
+    base = user[:matches[0].start()].strip()
+    blocks = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(user)
+        blocks.append(user[m.start():end].strip())
+    return base, blocks
+
+
+def _format_log(row: dict) -> str:
+    fields = {k: row[k] for k in LOG_FIELDS if row.get(k)}
+    return json.dumps({"timestamp": row.get("timestamp"), **fields}, ensure_ascii=False)
+
+
+def _db_key(project_path: str):
+    db_path = os.path.join(project_path, "codesynth_history.db")
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_recent_logs(project_path: str, limit: int) -> list:
+    """最新的 ai_friendly_log；使用唯讀連線，不觸發 get_db 的 Schema 初始化"""
+    if not os.path.exists(os.path.join(project_path, "codesynth_history.db")):
+        return []
+    conn = None
+    try:
+        conn, _ = get_read_db(project_path)
+        c = conn.cursor()
+        c.execute("SELECT * FROM ai_friendly_log ORDER BY timestamp DESC LIMIT ?", (limit,))
+        columns = [desc[0] for desc in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+    except sqlite3.Error as e:
+        # 舊資料庫可能尚未建立 ai_friendly_log
+        logger.warning(f"取得 AI Log 失敗: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+
+def build_ai_context(project_path: str, token_budget: int, limit: int = 20) -> dict:
+    """
+    依 token 預算組合 system prompt 與近期事件：
+    SOUL / IDENTITY / 使用者基本資料必定保留 (超出預算時截斷)，
+    其餘預算依序分給最新的 Learned 區塊、MEMORY.md 開頭、最新的 ai_friendly_log。
+    結果依檔案與資料庫的狀態快取；回傳的是副本，呼叫端可自由修改。
+    """
+    file_keys, files = memory_manager.read_context_files()
+    cache_key = (file_keys, os.path.realpath(project_path), _db_key(project_path), token_budget, limit)
+    cached = CONTEXT_CACHE.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    usage = {}
+    remaining = token_budget
+
+    def take(name, text):
+        nonlocal remaining
+        text, tokens = _trim_lines(text, remaining)
+        usage[name] = tokens
+        remaining -= tokens
+        return text
+
+    # 1. 必要區塊
+    soul = take("soul", files["SOUL.md"])
+    identity = take("identity", files["IDENTITY.md"])
+    user_base, learned_blocks = _split_user_profile(files["USER.md"])
+    user_base = take("user", user_base)
+
+    # 2. 依比例分配剩餘預算，未用完的額度留給後面的區塊
+    rows = get_recent_logs(project_path, limit)
+    shares = {name: int(remaining * ratio) for name, ratio in SECTION_SHARES}
+    selected_learned, selected_logs, memory = [], [], ""
+    carry = 0
+    for name, _ in SECTION_SHARES:
+        budget = shares[name] + carry
+        used = 0
+        if name == "learned":
+            # 最新的優先，整段保留或捨棄
+            for block in reversed(learned_blocks):
+                cost = estimate_tokens(block)
+                if used + cost > budget:
+                    break
+                selected_learned.insert(0, block)
+                used += cost
+        elif name == "memory":
+            memory, used = _trim_lines(files["MEMORY.md"], budget)
+        else:
+            for row in rows:
+                cost = estimate_tokens(_format_log(row))
+                if used + cost > budget:
+                    break
+                selected_logs.append(row)
+                used += cost
+        usage[name] = used
+        carry = budget - used
+
+    # 3. 依原本順序組合：SOUL -> IDENTITY -> MEMORY -> USER
+    parts = []
+    if soul:
+        parts.append(f"[SOUL - CORE INSTRUCTIONS]\n{soul}")
+    if identity:
+        parts.append(f"[IDENTITY - PERSONA]\n{identity}")
+    if memory:
+        parts.append(f"[PROJECT KNOWLEDGE]\n{memory}")
+    user = "\n\n".join(p for p in [user_base] + selected_learned if p)
+    if user:
+        parts.append(f"[USER PROFILE]\n{user}")
+
+    result = {
+        "system_prompt": "\n\n".join(parts),
+        "recent_logs": selected_logs,
+        "token_usage": {
+            "budget": token_budget,
+            "total": sum(usage.values()),
+            "sections": usage,
+            "learned_kept": len(selected_learned),
+            "learned_total": len(learned_blocks),
+            "logs_kept": len(selected_logs),
+        },
+    }
+    CONTEXT_CACHE.put(cache_key, copy.deepcopy(result))
+    return result
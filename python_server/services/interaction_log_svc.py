@@ -0,0 +1,253 @@
+import os
+import re
+import gzip
+import time
+import struct
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from utils.logger import server_logger as logger
+
+# 互動記錄檔：每天一個或多個分段
+#   2026-01-31.md (第 0 段，與舊版檔名相同)、2026-01-31.1.md、2026-01-31.2.md ...
+#   超過 COMPRESS_AFTER_DAYS 天的分段壓縮為 .md.gz
+LOG_NAME_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.md(\.gz)?$")
+
+FLUSH_BYTES = int(os.getenv("CODESYNTH_LOG_FLUSH_BYTES", str(64 * 1024)))
+FLUSH_INTERVAL = float(os.getenv("CODESYNTH_LOG_FLUSH_INTERVAL", "2"))
+SEGMENT_BYTES = int(os.getenv("CODESYNTH_LOG_SEGMENT_BYTES", str(1024 * 1024)))
+COMPRESS_AFTER_DAYS = int(os.getenv("CODESYNTH_LOG_COMPRESS_AFTER_DAYS", "7"))  # 0 = 不壓縮
+
+
+def segment_name(day: str, segment: int) -> str:
+    return f"{day}.md" if segment == 0 else f"{day}.{segment}.md"
+
+
+def log_key(path: Path) -> str:
+    """不含 .gz 的分段名稱；壓縮前後相同，用於記錄已處理的位置"""
+    name = Path(path).name
+    return name[:-3] if name.endswith(".gz") else name
+
+
+def _sort_key(path: Path):
+    m = LOG_NAME_RE.match(path.name)
+    return (m.group(1), int(m.group(2) or 0))
+
+
+def iter_log_files(logs_dir: Path) -> list:
+    """依日期與分段順序列出互動記錄檔 (含已壓縮的)"""
+    logs_dir = Path(logs_dir)
+    if not logs_dir.exists():
+        return []
+    files = [p for p in logs_dir.iterdir() if LOG_NAME_RE.match(p.name)]
+    return sorted(files, key=_sort_key)
+
+
+def log_size(path: Path) -> int:
+    """未壓縮的大小；.gz 讀取 gzip 尾端的 ISIZE 欄位 (單一 member、小於 4GB)"""
+    path = Path(path)
+    if not path.name.endswith(".gz"):
+        return path.stat().st_size
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", f.read(4))[0]
+
+
+def read_log(path: Path, offset: int = 0, end: int = None) -> bytes:
+    """讀取 [offset, end) 的原始內容；.gz 透明解壓縮"""
+    path = Path(path)
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        f.seek(offset)
+        return f.read() if end is None else f.read(max(0, end - offset))
+
+
+class InteractionLogWriter:
+    """
+    互動記錄的緩衝寫入器。
+    append() 只放入記憶體緩衝；累積 FLUSH_BYTES 或 FLUSH_INTERVAL 秒後由背景執行緒寫入，
+    關閉時 close() 寫入剩餘內容。分段超過 SEGMENT_BYTES 時輪替到下一段，
+    並在 index_dir/<day>.idx 記錄每筆互動的 (分段, offset, 時間)，之後讀取可直接 seek。
+    """
+
+    def __init__(self, logs_dir: Path, index_dir: Path, on_flush=None):
+        self.logs_dir = Path(logs_dir)
+        self.index_dir = Path(index_dir)
+        self.on_flush = on_flush  # on_flush([寫入的 Path])
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._buffer = []  # [(day, time, bytes)]
+        self._buffered_bytes = 0
+        self._first_buffered_at = None
+        self._segments = {}  # day -> 目前的分段編號
+        self._compressed_through = None  # 已檢查壓縮的日期
+        self._thread = None
+        self._closed = False
+
+    def append(self, user_query: str, ai_response: str):
+        now = datetime.now()
+        timestamp = now.strftime("%H:%M:%S")
+        entry = f"\n\n## [{timestamp}] User\n{user_query}\n\n## [{timestamp}] Assistant\n{ai_response}\n"
+        data = entry.encode("utf-8")
+        with self._cond:
+            self._buffer.append((now.strftime("%Y-%m-%d"), timestamp, data))
+            self._buffered_bytes += len(data)
+            if self._first_buffered_at is None:
+                self._first_buffered_at = time.monotonic()
+            flush_now = self._closed or self._buffered_bytes >= FLUSH_BYTES
+            if not flush_now:
+                self._ensure_started()
+                self._cond.notify()
+        if flush_now:
+            self.flush()
+
+    def _ensure_started(self):
+        # 呼叫端已持有 self._cond
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._first_buffered_at is not None:
+                        wait = self._first_buffered_at + FLUSH_INTERVAL - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            self.flush()
+
+    def _current_segment(self, day: str) -> int:
+        segment = self._segments.get(day)
+        if segment is None:
+            existing = [int(m.group(2) or 0) for m in map(LOG_NAME_RE.match, os.listdir(self.logs_dir))
+                        if m and m.group(1) == day and not m.group(3)]
+            segment = max(existing, default=0)
+        return segment
+
+    def flush(self) -> list:
+        """寫入緩衝內容，回傳寫入的檔案"""
+        with self._write_lock:
+            with self._cond:
+                batch = self._buffer
+                self._buffer = []
+                self._buffered_bytes = 0
+                self._first_buffered_at = None
+            if not batch:
+                return []
+            try:
+                written = self._write(batch)
+            except Exception as e:
+                logger.error(f"寫入互動記錄失敗: {e}")
+                with self._cond:
+                    # 放回緩衝，下次再寫
+                    self._buffer[:0] = batch
+                    self._buffered_bytes += sum(len(data) for _, _, data in batch)
+                    if self._first_buffered_at is None:
+                        self._first_buffered_at = time.monotonic()
+                return []
+            self._compress_old_days(batch[-1][0])
+
+        if self.on_flush:
+            try:
+                self.on_flush(written)
+            except Exception as e:
+                logger.warning(f"互動記錄寫入後處理失敗: {e}")
+        return written
+
+    def _write(self, batch: list) -> list:
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        gitignore = self.index_dir.parent / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text("*\n", encoding="utf-8")
+
+        # 依日期與分段分組，每個檔案只開啟一次
+        writes = {}  # segment path -> [bytes]
+        index_lines = {}  # day -> [str]
+        sizes = {}
+        for day, timestamp, data in batch:
+            segment = self._current_segment(day)
+            path = self.logs_dir / segment_name(day, segment)
+            if path not in sizes:
+                sizes[path] = path.stat().st_size if path.exists() else 0
+            if sizes[path] and sizes[path] + len(data) > SEGMENT_BYTES:
+                segment += 1
+                path = self.logs_dir / segment_name(day, segment)
+                sizes[path] = path.stat().st_size if path.exists() else 0
+            self._segments[day] = segment
+            index_lines.setdefault(day, []).append(f"{segment}\t{sizes[path]}\t{timestamp}\n")
+            writes.setdefault(path, []).append(data)
+            sizes[path] += len(data)
+
+        for path, chunks in writes.items():
+            with open(path, "ab") as f:
+                f.write(b"".join(chunks))
+        for day, lines in index_lines.items():
+            with open(self.index_dir / f"{day}.idx", "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        return list(writes)
+
+    def _compress_old_days(self, today: str):
+        """壓縮超過 COMPRESS_AFTER_DAYS 天的記錄 (每天檢查一次)"""
+        if COMPRESS_AFTER_DAYS <= 0 or self._compressed_through == today:
+            return
+        self._compressed_through = today
+        cutoff = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=COMPRESS_AFTER_DAYS)).strftime("%Y-%m-%d")
+        for path in iter_log_files(self.logs_dir):
+            m = LOG_NAME_RE.match(path.name)
+            if m.group(3) or m.group(1) >= cutoff:
+                continue
+            target = path.with_name(path.name + ".gz")
+            tmp = path.with_name(path.name + ".gz.tmp")
+            try:
+                with open(path, "rb") as src, gzip.open(tmp, "wb") as dst:
+                    while True:
+                        chunk = src.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                st = path.stat()
+                os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+                os.replace(tmp, target)
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"壓縮互動記錄失敗 ({path.name}): {e}")
+                if tmp.exists():
+                    tmp.unlink()
+
+    def entry_offsets(self, name: str):
+        """
+        分段中每筆互動的起始 offset (依索引)。
+        索引需涵蓋整個分段 (第一筆 offset 為 0)，否則 (例如升級前寫入的舊記錄) 回傳 None
+        """
+        m = LOG_NAME_RE.match(name)
+        if not m:
+            return None
+        day, segment = m.group(1), int(m.group(2) or 0)
+        try:
+            with open(self.index_dir / f"{day}.idx", "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        offsets = []
+        for line in lines:
+            parts = line.split("\t")
+            if len(parts) == 3 and int(parts[0]) == segment:
+                offsets.append(int(parts[1]))
+        return offsets if offsets and offsets[0] == 0 else None
+
+    def close(self):
+        """關閉前寫入緩衝中的內容；之後的 append 直接寫入"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(5.0)
+        self.flush()
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from utils.logger import server_logger as logger
+from services.memory_manager import memory_manager
+
+# Persistent cache of LLM generations, stored next to the retrieval index
+LLM_CACHE_ENABLED = os.getenv("CODESYNTH_LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL = float(os.getenv("CODESYNTH_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("CODESYNTH_LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("CODESYNTH_LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def cache_key(model: str, system: str, prompt: str, options: dict = None) -> str:
+    """Exact key: any change to model, system prompt, prompt or options is a different entry."""
+    raw = json.dumps([model, system or "", prompt, options or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed generation cache with a TTL and LRU eviction
+    (bounded by entry count and total response size).
+    """
+
+    def __init__(self, db_path: Path, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Cache is disposable; keep it out of the memory repo's git sync
+        gitignore = self.db_path.parent / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text("*\n", encoding="utf-8")
+
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS responses
+                        (key TEXT PRIMARY KEY, model TEXT, response TEXT,
+                         created_at REAL, last_access REAL, size INTEGER)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Returns the cached response, or None on a miss (expired entries count as misses)."""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row and now - row[1] <= self.ttl:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    self.hits += 1
+                    return row[0]
+                if row:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def put(self, key: str, model: str, response: str):
+        if not self.enabled or not response:
+            return
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                now = time.time()
+                conn.execute("INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access, size) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (key, model, response, now, now, size))
+                self._evict(conn, now)
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _evict(self, conn, now: float):
+        expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        removed = 0
+        # Least recently used first
+        while count > self.max_entries or total > self.max_bytes:
+            batch = conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT ?",
+                                 (max(count - self.max_entries, 16),)).fetchall()
+            if not batch:
+                break
+            for key, size in batch:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                count -= 1
+                total -= size
+                removed += 1
+        self.evictions += expired + removed
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = 0, 0
+            if self.enabled:
+                count, total = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": count,
+                "bytes": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+llm_cache = LLMResponseCache(memory_manager.root_path / ".index" / "llm_cache.db")
@@ -1,11 +1,75 @@
 import requests
 import json
 import os
+import asyncio
+import time
+import threading
+from requests.adapters import HTTPAdapter
+from services.llm_cache import llm_cache, cache_key
+from services.llm_scheduler import llm_scheduler, INTERACTIVE, BACKGROUND
+
+# Optional: native async HTTP client; without it async calls run requests in a thread
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    httpx = None
+    HAS_HTTPX = False
+
+# Timeouts (seconds): connect to Ollama, and wait between bytes of a response.
+# Streaming responses can run much longer than READ_TIMEOUT as long as tokens keep arriving.
+CONNECT_TIMEOUT = float(os.getenv("CODESYNTH_LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("CODESYNTH_LLM_READ_TIMEOUT", "120"))
+# Connection pool to the Ollama endpoint
+POOL_SIZE = int(os.getenv("CODESYNTH_LLM_POOL_SIZE", "4"))
+KEEPALIVE_EXPIRY = float(os.getenv("CODESYNTH_LLM_KEEPALIVE_EXPIRY", "60"))
+
+# How long Ollama keeps the model loaded after each request: "30m", "1h", seconds, or -1 (forever)
+KEEP_ALIVE = os.getenv("CODESYNTH_LLM_KEEP_ALIVE", "30m")
+# Load the model when the server starts, so the first request does not pay for it
+WARMUP_ON_START = os.getenv("CODESYNTH_LLM_WARMUP", "1") != "0"
+# Keep-alive pings closer together than this are answered from the last result
+PING_MIN_INTERVAL = 60.0
+# A load_duration above this means the model was not resident
+COLD_LOAD_MS = 1000.0
+
+
+def _keep_alive_value():
+    """Ollama accepts a duration string or a number of seconds."""
+    value = KEEP_ALIVE.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def _timings(result: dict):
+    """Ollama's nanosecond durations as milliseconds, splitting model load from generation."""
+    if "total_duration" not in result:
+        return None
+    ms = lambda name: result.get(name, 0) / 1e6
+    eval_ms = ms("eval_duration")
+    timings = {
+        "load_ms": ms("load_duration"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_ms": eval_ms,
+        "generation_ms": ms("prompt_eval_duration") + eval_ms,
+        "total_ms": ms("total_duration"),
+        "eval_count": result.get("eval_count", 0),
+    }
+    timings["tokens_per_sec"] = timings["eval_count"] / (eval_ms / 1000) if eval_ms else 0.0
+    timings["cold_load"] = timings["load_ms"] >= COLD_LOAD_MS
+    return timings
+
+
+class LLMError(Exception):
+    """Raised by the streaming API when Ollama cannot be reached or fails."""
+    pass
+
 
 class LocalLLMClient:
     """
     Client for interacting with local Ollama instance.
     Defaults to http://localhost:11434
+    Connections are pooled: a requests.Session for the no-httpx fallback and an
+    httpx.AsyncClient (when installed) for async and streaming calls.
     """
     def __init__(self, base_url="http://localhost:11434", model="gpt-oss:20b"):
         self.base_url = base_url
@@ -16,33 +80,234 @@ class LocalLLMClient:
         if os.getenv("OLLAMA_MODEL"):
             self.model = os.getenv("OLLAMA_MODEL")
 
-    async def generate_async(self, prompt: str, system: str = None) -> str:
-        """
-        Async wrapper for generate using asyncio.to_thread to disable blocking.
-        This allows the main event loop to continue while waiting for Ollama.
-        """
-        import asyncio
-        return await asyncio.to_thread(self.generate_sync, prompt, system)
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self._session = None
+        self._session_lock = threading.Lock()
+        # httpx.AsyncClient is bound to the event loop it was created on
+        self._async_client = None
+        self._async_loop = None
 
-    def generate_sync(self, prompt: str, system: str = None) -> str:
-        """
-        Synchronous generation (renamed from generate).
-        """
-        url = f"{self.base_url}/api/generate"
-        
+        # Model residency and timing reports (see status())
+        self.last_timings = None
+        self._totals = {"calls": 0, "cold_loads": 0, "load_ms": 0.0, "generation_ms": 0.0}
+        self._warm_up = {"status": "pending", "at": None, "load_ms": None, "error": None}
+        self._last_ping = 0.0
+
+    def _get_session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    @staticmethod
+    def _close_async_client(client, loop):
+        """Closes a client from another event loop on that loop (its connections belong to it)."""
+        if loop.is_closed():
+            # Nothing can run on a closed loop; its transports went away with it
+            return
+        future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=POOL_SIZE,
+                                    max_keepalive_connections=POOL_SIZE,
+                                    keepalive_expiry=KEEPALIVE_EXPIRY),
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    def _payload(self, prompt: str, system: str = None, stream: bool = False, options: dict = None) -> dict:
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False
+            "stream": stream,
+            "keep_alive": _keep_alive_value()
         }
-        
         if system:
             payload["system"] = system
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def generate_async(self, prompt: str, system: str = None, options: dict = None,
+                             use_cache: bool = True, priority: int = INTERACTIVE) -> str:
+        """
+        Non-blocking generation. Uses the pooled httpx.AsyncClient, so no thread
+        is held while waiting for Ollama; falls back to a worker thread without httpx.
+        Identical requests are answered from llm_cache unless use_cache=False;
+        others wait for a slot in llm_scheduler at the given priority.
+        Cache lookups and writes are SQLite calls, so they run in a worker thread.
+        """
+        key = cache_key(self.model, system, prompt, options)
+        if use_cache:
+            cached = await asyncio.to_thread(llm_cache.get, key)
+            if cached is not None:
+                return cached
+
+        async with llm_scheduler.slot(priority):
+            if HAS_HTTPX:
+                text = await self._post_async(prompt, system, options)
+            else:
+                text = await asyncio.to_thread(self._post_blocking, prompt, system, options)
+        if use_cache:
+            await asyncio.to_thread(llm_cache.put, key, self.model, text)
+        return text
+
+    def _record_timings(self, result: dict):
+        timings = _timings(result)
+        if timings is None:
+            return None
+        self.last_timings = timings
+        self._totals["calls"] += 1
+        self._totals["cold_loads"] += int(timings["cold_load"])
+        self._totals["load_ms"] += timings["load_ms"]
+        self._totals["generation_ms"] += timings["generation_ms"]
+        if timings["cold_load"]:
+            print(f"Ollama loaded {self.model} in {timings['load_ms']:.0f} ms")
+        return timings
+
+    async def _request_async(self, path: str, payload: dict = None) -> dict:
+        """POST (or GET without payload) to Ollama and return the JSON body; raises on failure."""
+        url = f"{self.base_url}{path}"
+        if not HAS_HTTPX:
+            def request():
+                session = self._get_session()
+                if payload is None:
+                    response = session.get(url, timeout=self.timeout)
+                else:
+                    response = session.post(url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+            return await asyncio.to_thread(request)
+        client = self._get_async_client()
+        response = await (client.get(url) if payload is None else client.post(url, json=payload))
+        response.raise_for_status()
+        return response.json()
+
+    async def _post_async(self, prompt: str, system: str = None, options: dict = None) -> str:
+        try:
+            result = await self._request_async("/api/generate", self._payload(prompt, system, options=options))
+            self._record_timings(result)
+            return result.get("response", "")
+        except httpx.ConnectError:
+            print("Error: Could not connect to Ollama. Is it running?")
+            return ""
+        except Exception as e:
+            print(f"Error calling Ollama: {e}")
+            return ""
+
+    async def stream_async(self, prompt: str, system: str = None, options: dict = None,
+                           use_cache: bool = True, priority: int = INTERACTIVE):
+        """
+        Streams Ollama's NDJSON output as an async generator of parsed chunks
+        ({"response": "...", "done": false}, ..., final chunk with "done": true and timings).
+        A cache hit is a single chunk with "done": true and "cached": true.
+        The scheduler slot is held until the stream ends or the consumer stops.
+        Raises LLMError if Ollama is unreachable or returns an error.
+        """
+        key = cache_key(self.model, system, prompt, options)
+        if use_cache:
+            cached = await asyncio.to_thread(llm_cache.get, key)
+            if cached is not None:
+                yield {"model": self.model, "response": cached, "done": True, "cached": True}
+                return
+
+        parts = []
+        async with llm_scheduler.slot(priority):
+            async for chunk in self._stream(prompt, system, options):
+                if use_cache:
+                    # Only complete generations are cached
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        await asyncio.to_thread(llm_cache.put, key, self.model, "".join(parts))
+                yield chunk
 
+    async def _stream(self, prompt: str, system: str = None, options: dict = None):
+        url = f"{self.base_url}/api/generate"
+        payload = self._payload(prompt, system, stream=True, options=options)
+
+        if HAS_HTTPX:
+            try:
+                async with self._get_async_client().stream("POST", url, json=payload) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        raise LLMError(f"Ollama returned {response.status_code}: {response.text}")
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            chunk = json.loads(line)
+                            if "error" in chunk:
+                                raise LLMError(chunk["error"])
+                            if chunk.get("done"):
+                                chunk["timings"] = self._record_timings(chunk)
+                            yield chunk
+            except httpx.ConnectError:
+                raise LLMError("Could not connect to Ollama. Is it running?")
+            except httpx.HTTPError as e:
+                raise LLMError(f"Error calling Ollama: {e}")
+            return
+
+        # Fallback: read the stream in a thread and hand lines to the event loop
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def reader():
+            try:
+                with self._get_session().post(url, json=payload, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if cancelled.is_set():
+                            break
+                        if line:
+                            loop.call_soon_threadsafe(queue.put_nowait, json.loads(line))
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        loop.run_in_executor(None, reader)
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, requests.exceptions.ConnectionError):
+                    raise LLMError("Could not connect to Ollama. Is it running?")
+                if isinstance(item, Exception):
+                    raise LLMError(f"Error calling Ollama: {item}")
+                if "error" in item:
+                    raise LLMError(item["error"])
+                if item.get("done"):
+                    item["timings"] = self._record_timings(item)
+                yield item
+        finally:
+            # Consumer stopped early (e.g. client disconnected): stop reading
+            cancelled.set()
+
+    def _post_blocking(self, prompt: str, system: str = None, options: dict = None) -> str:
+        """
+        Blocking request over the pooled requests.Session; the no-httpx fallback of
+        generate_async runs it in a worker thread while holding a scheduler slot.
+        Not a public entry point: every generation goes through llm_scheduler.
+        """
+        url = f"{self.base_url}/api/generate"
+
+        try:
+            response = self._get_session().post(url, json=self._payload(prompt, system, options=options),
+                                                timeout=self.timeout)
             response.raise_for_status()
             result = response.json()
+            self._record_timings(result)
             return result.get("response", "")
         except requests.exceptions.ConnectionError:
             print("Error: Could not connect to Ollama. Is it running?")
@@ -51,11 +316,76 @@ class LocalLLMClient:
             print(f"Error calling Ollama: {e}")
             return ""
 
-    def generate(self, prompt: str, system: str = None) -> str:
+    async def warm_up(self) -> dict:
+        """
+        Loads the model with an empty prompt (Ollama only loads it and applies keep_alive).
+        Called on server start, and by ping() to keep the model resident.
+        """
+        self._warm_up["status"] = "loading"
+        start = time.monotonic()
+        try:
+            async with llm_scheduler.slot(BACKGROUND):
+                result = await self._request_async(
+                    "/api/generate", {"model": self.model, "keep_alive": _keep_alive_value()})
+            load_ms = result.get("load_duration", 0) / 1e6
+            self._warm_up.update(status="warm", at=time.time(), load_ms=load_ms, error=None)
+            if load_ms >= COLD_LOAD_MS:
+                print(f"Ollama loaded {self.model} in {load_ms:.0f} ms (warm-up)")
+        except Exception as e:
+            self._warm_up.update(status="failed", at=time.time(), error=str(e))
+            print(f"Ollama warm-up failed: {e}")
+        self._warm_up["elapsed_ms"] = (time.monotonic() - start) * 1000
+        return dict(self._warm_up)
+
+    async def ping(self) -> dict:
         """
-        Legacy sync method wrapper.
+        Heartbeat while the cockpit is open: refreshes keep_alive (reloading the model
+        if Ollama evicted it). Skipped when a request is running or a ping was recent.
         """
-        return self.generate_sync(prompt, system)
+        now = time.time()
+        if now - self._last_ping < PING_MIN_INTERVAL or llm_scheduler.stats()["in_flight"]:
+            return {"status": "skipped", "warm_up": dict(self._warm_up)}
+        self._last_ping = now
+        return {"status": "pinged", "warm_up": await self.warm_up()}
+
+    async def status(self) -> dict:
+        """Model residency (from Ollama's /api/ps) and load vs generation time."""
+        resident, expires_at = None, None
+        try:
+            models = (await self._request_async("/api/ps")).get("models", [])
+            loaded = next((m for m in models if m.get("name") == self.model or m.get("model") == self.model), None)
+            resident = loaded is not None
+            expires_at = loaded.get("expires_at") if loaded else None
+        except Exception:
+            # Ollama unreachable: residency unknown
+            pass
+        totals = dict(self._totals)
+        calls = totals["calls"]
+        totals["avg_load_ms"] = totals["load_ms"] / calls if calls else 0.0
+        totals["avg_generation_ms"] = totals["generation_ms"] / calls if calls else 0.0
+        return {
+            "model": self.model,
+            "keep_alive": _keep_alive_value(),
+            "resident": resident,
+            "expires_at": expires_at,
+            "warm_up": dict(self._warm_up),
+            "last_timings": self.last_timings,
+            "totals": totals,
+        }
+
+    async def aclose(self):
+        """Closes pooled connections (called on server shutdown)."""
+        if self._async_client is not None:
+            if self._async_loop is asyncio.get_running_loop():
+                await self._async_client.aclose()
+            else:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = None
+            self._async_loop = None
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
 # Singleton
 llm_client = LocalLLMClient()
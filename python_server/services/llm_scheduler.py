@@ -0,0 +1,110 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+# Priority classes: lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# A local CPU model handles one request at a time well; more only adds contention
+LLM_MAX_IN_FLIGHT = int(os.getenv("CODESYNTH_LLM_MAX_IN_FLIGHT", "1"))
+
+
+class LLMScheduler:
+    """
+    Admission control in front of LocalLLMClient.
+    At most max_in_flight requests reach Ollama at once; waiting requests are
+    served by priority (INTERACTIVE before BACKGROUND), then in arrival order.
+    A request cancelled while queued (e.g. its HTTP client disconnected) leaves
+    the queue without ever reaching the model.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT):
+        self.max_in_flight = max(1, max_in_flight)
+        self._in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._stats = {
+            p: {"queued": 0, "started": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                "total_wait": 0.0, "max_wait": 0.0}
+            for p in PRIORITY_NAMES
+        }
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        stats = self._stats[priority]
+        start = time.monotonic()
+        # release() hands freed slots straight to live waiters, so a free slot
+        # means nobody (except cancelled entries) is queued
+        if self._in_flight < self.max_in_flight:
+            self._in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), future))
+            stats["queued"] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                stats["queued"] -= 1
+                stats["cancelled"] += 1
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self.release()
+                raise
+            stats["queued"] -= 1
+        wait = time.monotonic() - start
+        stats["started"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def release(self):
+        self._in_flight -= 1
+        while self._waiters and self._in_flight < self.max_in_flight:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Cancelled while queued
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # GeneratorExit: a streaming consumer stopped iterating
+            self._stats[priority]["cancelled"] += 1
+            raise
+        except Exception:
+            self._stats[priority]["failed"] += 1
+            raise
+        else:
+            self._stats[priority]["completed"] += 1
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        classes = {}
+        for priority, s in self._stats.items():
+            classes[PRIORITY_NAMES[priority]] = {
+                "queued": s["queued"],
+                "started": s["started"],
+                "completed": s["completed"],
+                "failed": s["failed"],
+                "cancelled": s["cancelled"],
+                "avg_wait": s["total_wait"] / s["started"] if s["started"] else 0.0,
+                "max_wait": s["max_wait"],
+            }
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_depth": sum(1 for _, _, f in self._waiters if not f.done()),
+            "classes": classes,
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,358 @@
+import os
+import sys
+import math
+import time
+import shutil
+import tempfile
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from database.connection import get_db
+from utils.logger import server_logger as logger
+from utils.process_limits import resolve_limits, popen_limited, communicate_with_usage, describe_limit_violation
+from .ai_svc import log_ai_event
+
+# 矩陣測試的安全上限，避免一次排程過多組合拖垮主機
+MAX_COMBINATIONS = 256
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+MAX_TIMEOUT = 120  # 單一組合逾時上限 (秒)
+OUTPUT_LIMIT = 4000  # 每個組合回傳的 stdout/stderr 字數上限
+
+ENTRY_PATTERNS = ['main.py', 'app.py', '3d viewer app.py']
+
+
+def _sim_relative_path(file_path: str, project_path: str) -> str:
+    """將 history 中的檔案路徑轉為工作區內的相對路徑；不在專案內的路徑回傳 None"""
+    try:
+        if os.path.isabs(file_path):
+            rel = os.path.normpath(os.path.relpath(file_path, project_path))
+        else:
+            rel = os.path.normpath(file_path)
+    except ValueError:
+        # Windows 上不同磁碟機的路徑
+        return None
+    if os.path.isabs(rel) or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return rel
+
+
+def _int_param(data: dict, key: str, default: int) -> int:
+    value = data.get(key)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} 必須為整數")
+
+
+def _find_entry(files: List[str]) -> str:
+    """依 main.py → app.py → 3d viewer app.py 的順序找出進入點"""
+    for pattern in ENTRY_PATTERNS:
+        for fp in files:
+            if os.path.basename(fp).lower() == pattern:
+                return fp
+    for pattern in ENTRY_PATTERNS:
+        for fp in files:
+            if pattern in fp.lower():
+                return fp
+    return None
+
+
+def cartesian_order(sizes: List[int]) -> List[Tuple[int, ...]]:
+    """
+    以「反射式混合進位 Gray Code」列舉笛卡兒積。
+    相鄰兩個組合只差一個檔案的版本，讓工作區只需重寫一個檔案。
+    """
+    if not sizes or any(s == 0 for s in sizes):
+        return []
+    combos = [()]
+    for size in sizes:
+        extended = []
+        for i, prefix in enumerate(combos):
+            values = range(size) if i % 2 == 0 else range(size - 1, -1, -1)
+            extended.extend(prefix + (v,) for v in values)
+        combos = extended
+    return combos
+
+
+def pairwise_min_rows(sizes: List[int]) -> int:
+    """
+    pairwise 模式組合數的下限，不需列舉 pair 即可計算：
+    兩個版本數最多的檔案，其所有版本配對都必須各自出現在不同組合中。
+    """
+    if len(sizes) < 3:
+        return math.prod(sizes)
+    a, b = sorted(sizes)[-2:]
+    return a * b
+
+
+def pairwise_order(sizes: List[int]) -> List[Tuple[int, ...]]:
+    """
+    貪婪法產生 All-Pairs 覆蓋組合：任兩個檔案的任兩個版本至少共同出現一次。
+    產生後再以最近鄰排序，讓相鄰組合的差異盡量小。
+    """
+    if not sizes or any(s == 0 for s in sizes):
+        return []
+    n = len(sizes)
+    if n < 3:
+        return cartesian_order(sizes)
+
+    uncovered = set()
+    for i, j in itertools.combinations(range(n), 2):
+        for a in range(sizes[i]):
+            for b in range(sizes[j]):
+                uncovered.add((i, a, j, b))
+
+    combos = []
+    while uncovered:
+        # 以一個尚未覆蓋的 pair 作為種子，其餘欄位逐一挑選覆蓋最多新 pair 的值
+        i, a, j, b = min(uncovered)
+        row = [None] * n
+        row[i], row[j] = a, b
+        for k in range(n):
+            if row[k] is not None:
+                continue
+            best_value, best_gain = 0, -1
+            for v in range(sizes[k]):
+                gain = 0
+                for m in range(n):
+                    if row[m] is None:
+                        continue
+                    key = (m, row[m], k, v) if m < k else (k, v, m, row[m])
+                    if key in uncovered:
+                        gain += 1
+                if gain > best_gain:
+                    best_value, best_gain = v, gain
+            row[k] = best_value
+        for p, q in itertools.combinations(range(n), 2):
+            uncovered.discard((p, row[p], q, row[q]))
+        combos.append(tuple(row))
+
+    # 最近鄰排序 (Hamming 距離)
+    ordered = [combos.pop(0)]
+    while combos:
+        last = ordered[-1]
+        idx = min(range(len(combos)),
+                  key=lambda c: sum(x != y for x, y in zip(last, combos[c])))
+        ordered.append(combos.pop(idx))
+    return ordered
+
+
+class _Workspace:
+    """
+    單一 worker 的實體化工作區。
+    記錄目前每個檔案寫入的版本，切換組合時只重寫有變動的檔案。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.materialized: Dict[str, int] = {}
+        self.writes = 0
+        os.makedirs(root, exist_ok=True)
+
+    def apply(self, selection: Dict[str, int], contents: Dict[int, str]):
+        for rel_path, version_id in selection.items():
+            if self.materialized.get(rel_path) == version_id:
+                continue
+            target = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'w', encoding='utf-8') as f:
+                f.write(contents[version_id])
+            self.materialized[rel_path] = version_id
+            self.writes += 1
+
+
+def _run_combination(workspace: _Workspace, entry_rel: str, timeout: int, limits: dict) -> dict:
+    """在工作區內以資源限制執行進入點，回傳單一組合的結果"""
+    started = time.time()
+    process = None
+    try:
+        process = popen_limited(
+            [sys.executable, os.path.join(workspace.root, entry_rel)],
+            limits,
+            cwd=workspace.root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        stdout, stderr, usage = communicate_with_usage(process, timeout=timeout)
+        stdout = stdout.decode('utf-8', errors='ignore')
+        stderr = stderr.decode('utf-8', errors='ignore')
+        violation = describe_limit_violation(process.returncode)
+        if violation:
+            stderr = f"{stderr}\n{violation}".strip()
+        return {
+            "status": "success" if process.returncode == 0 else "failed",
+            "exit_code": process.returncode,
+            "output": stdout[-OUTPUT_LIMIT:],
+            "error": stderr[-OUTPUT_LIMIT:],
+            "duration": round(time.time() - started, 3),
+            "resource_usage": usage
+        }
+    except subprocess.TimeoutExpired as e:
+        # communicate_with_usage 已終止並回收行程
+        return {
+            "status": "timeout",
+            "exit_code": None,
+            "output": (e.output or b"").decode('utf-8', errors='ignore')[-OUTPUT_LIMIT:],
+            "error": f"執行逾時 (超過 {timeout} 秒)",
+            "duration": round(time.time() - started, 3),
+            "resource_usage": getattr(e, "usage", None)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "exit_code": None,
+            "output": "",
+            "error": str(e),
+            "duration": round(time.time() - started, 3)
+        }
+
+
+def run_simulation_matrix_logic(data: dict) -> dict:
+    """
+    矩陣測試：對每個檔案給定候選版本清單，執行版本組合並回傳結果表格。
+    data:
+        project_path: 專案路徑
+        candidates: {file_path: [version_id, ...]}
+        mode: "cartesian" (完整笛卡兒積) 或 "pairwise" (兩兩覆蓋縮減)
+        max_workers: 並行 worker 數 (上限 MAX_WORKERS)
+        timeout: 單一組合逾時秒數 (上限 MAX_TIMEOUT)
+    參數型別錯誤時拋出 ValueError
+    """
+    project_path = data.get('project_path')
+    candidates = data.get('candidates') or {}
+    mode = data.get('mode', 'cartesian')
+    timeout = max(1, min(_int_param(data, 'timeout', DEFAULT_TIMEOUT), MAX_TIMEOUT))
+    requested_workers = _int_param(data, 'max_workers', min(4, os.cpu_count() or 1))
+    limits = resolve_limits(data.get('limits'))
+
+    if not project_path:
+        return {"status": "error", "message": "未提供專案路徑"}
+    if not candidates:
+        return {"status": "error", "message": "未提供候選版本"}
+    if mode not in ('cartesian', 'pairwise'):
+        return {"status": "error", "message": f"不支援的矩陣模式: {mode}"}
+
+    files = sorted(candidates.keys())
+    version_lists = [list(dict.fromkeys(candidates[f])) for f in files]
+    sizes = [len(v) for v in version_lists]
+    if any(s == 0 for s in sizes):
+        return {"status": "error", "message": "每個檔案至少需要一個候選版本"}
+
+    if mode == 'cartesian' and math.prod(sizes) > MAX_COMBINATIONS:
+        return {
+            "status": "error",
+            "message": f"組合數 {math.prod(sizes)} 超過上限 {MAX_COMBINATIONS}，請減少候選版本或改用 pairwise 模式"
+        }
+
+    if mode == 'pairwise' and pairwise_min_rows(sizes) > MAX_COMBINATIONS:
+        # 在建立 pair 集合之前先排除，避免大量候選版本耗盡記憶體
+        return {
+            "status": "error",
+            "message": f"pairwise 組合數至少 {pairwise_min_rows(sizes)}，超過上限 {MAX_COMBINATIONS}，請減少候選版本"
+        }
+
+    combos = cartesian_order(sizes) if mode == 'cartesian' else pairwise_order(sizes)
+    if len(combos) > MAX_COMBINATIONS:
+        return {
+            "status": "error",
+            "message": f"組合數 {len(combos)} 超過上限 {MAX_COMBINATIONS}，請減少候選版本或改用 pairwise 模式"
+        }
+
+    entry_file = _find_entry(files)
+    if not entry_file:
+        return {"status": "error", "message": "找不到程式進入點 (需包含 main.py, App.py 或 3D Viewer App.py)"}
+
+    # 一次讀出所有候選版本內容，避免每個組合重複查詢資料庫
+    all_ids = sorted({vid for versions in version_lists for vid in versions})
+    conn, _ = get_db(project_path)
+    try:
+        c = conn.cursor()
+        placeholders = ",".join("?" * len(all_ids))
+        c.execute(f"SELECT id, content FROM history WHERE id IN ({placeholders})", all_ids)
+        contents = {row[0]: row[1] for row in c.fetchall()}
+    finally:
+        conn.close()
+
+    missing = [vid for vid in all_ids if vid not in contents]
+    if missing:
+        return {"status": "error", "message": f"找不到版本 ID: {missing}"}
+
+    if 'import streamlit' in contents[version_lists[files.index(entry_file)][0]]:
+        return {"status": "error", "message": "矩陣測試不支援 Streamlit 應用"}
+
+    rel_paths = [_sim_relative_path(f, project_path) for f in files]
+    outside = [f for f, rel in zip(files, rel_paths) if rel is None]
+    if outside:
+        return {"status": "error", "message": f"檔案不在專案目錄內: {outside}"}
+    entry_rel = rel_paths[files.index(entry_file)]
+
+    workers = max(1, min(requested_workers, MAX_WORKERS, len(combos)))
+
+    # 每次執行使用專案外的獨立工作區：並行矩陣測試互不干擾，也不會觸發預覽的檔案監看
+    matrix_root = tempfile.mkdtemp(prefix="codesynth_matrix_")
+
+    # 連續切塊分配：每個 worker 處理一段相鄰組合，保留 Gray Code 的局部性
+    chunk_size = -(-len(combos) // workers)
+    chunks = [list(range(i, min(i + chunk_size, len(combos))))
+              for i in range(0, len(combos), chunk_size)]
+
+    results: List[dict] = [None] * len(combos)
+    workspaces: List[_Workspace] = []
+
+    def run_chunk(worker_index: int, indices: List[int]):
+        workspace = _Workspace(os.path.join(matrix_root, f"w{worker_index}"))
+        workspaces.append(workspace)
+        for idx in indices:
+            combo = combos[idx]
+            selection = {rel_paths[k]: version_lists[k][combo[k]] for k in range(len(files))}
+            try:
+                workspace.apply(selection, contents)
+                result = _run_combination(workspace, entry_rel, timeout, limits)
+            except Exception as e:
+                result = {"status": "error", "exit_code": None, "output": "",
+                          "error": f"寫入檔案失敗: {e}", "duration": 0}
+            result["index"] = list(combo)
+            result["selection"] = {files[k]: version_lists[k][combo[k]] for k in range(len(files))}
+            results[idx] = result
+
+    logger.info(f"矩陣測試開始: {len(combos)} 組合 ({mode}), {workers} workers")
+    started = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_chunk, i, chunk) for i, chunk in enumerate(chunks)]
+            for future in futures:
+                future.result()
+    finally:
+        shutil.rmtree(matrix_root, ignore_errors=True)
+    elapsed = round(time.time() - started, 3)
+
+    summary = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+
+    log_ai_event(
+        project_path,
+        what_happened=f"用戶執行矩陣測試 ({len(combos)} 組合)",
+        current_status="等待下一步指令",
+        test_result=", ".join(f"{k}: {v}" for k, v in sorted(summary.items())),
+        ai_summary=f"矩陣測試 {mode} 模式，檔案: {', '.join(files)}",
+        next_action="檢視失敗的版本組合"
+    )
+
+    return {
+        "status": "success",
+        "mode": mode,
+        "files": files,
+        "candidates": {files[k]: version_lists[k] for k in range(len(files))},
+        "total": len(combos),
+        "summary": summary,
+        "workers": workers,
+        "files_written": sum(w.writes for w in workspaces),
+        "elapsed": elapsed,
+        "limits": limits,
+        "results": results
+    }
@@ -1,10 +1,45 @@
 import os
+import json
 from pathlib import Path
 from datetime import datetime
 import re
 import asyncio
-import subprocess
 from utils.logger import server_logger # Import logger
+from services.interaction_log_svc import InteractionLogWriter, iter_log_files, log_key, log_size, read_log
+
+# Files assembled into the system prompt, in order
+CONTEXT_FILES = ("SOUL.md", "IDENTITY.md", "MEMORY.md", "USER.md")
+
+# Condensation: per-log byte watermarks, so only new log content is sent to the LLM.
+# Kept under .index/ (git-ignored) so the memory sync does not commit it on every condense
+CONDENSE_STATE_FILE = Path(".index") / "condense_state.json"
+LEGACY_CONDENSE_STATE_FILE = ".condense_state.json"
+CONDENSE_CHUNK_TOKENS = int(os.getenv("CODESYNTH_CONDENSE_CHUNK_TOKENS", "3000"))
+CONDENSE_CONCURRENCY = int(os.getenv("CODESYNTH_CONDENSE_CONCURRENCY", "2"))
+CONDENSE_MIN_CHARS = 100
+_LOG_ENTRY_RE = re.compile(rb"\n\n## \[\d\d:\d\d:\d\d\] User\n")
+_BULLET_RE = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s+(.*\S)\s*$")
+
+CONDENSE_SYSTEM_PROMPT = """
+            You are a Memory Assembler for an AI Assistant.
+            Your job is to read conversation logs and extract key facts to update the User Profile.
+            
+            EXTRACT:
+            1. User Preferences (language, coding style, frameworks)
+            2. Project Key Decisions (architecture, stack)
+            3. Future Context (what to do next)
+            
+            OUTPUT FORMAT:
+            - Return ONLY the new facts in bullet point format.
+            - If nothing important is found, return "NO_UPDATE".
+            - Do not summarize chitchat.
+            """
+
+
+def _normalize_fact(text: str) -> str:
+    """Key used to detect duplicate facts: case, punctuation and spacing are ignored."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
 
 class MemoryManager:
     """
@@ -19,7 +54,17 @@ class MemoryManager:
         else:
             self.root_path = Path.home() / ".gemini" / "code_synth_memory"
         
+        # filename -> ((mtime_ns, size), masked content)
+        self._file_cache = {}
+        # (stat keys of CONTEXT_FILES, assembled system prompt)
+        self._context_cache = None
+        # Serialises condensation runs so a log range is never summarised twice
+        self._condense_lock = asyncio.Lock()
+        
         self.ensure_structure()
+        # Buffered daily log writer; entry offsets are indexed under .index/logs
+        self.log_writer = InteractionLogWriter(
+            self.root_path / "logs", self.root_path / ".index" / "logs", on_flush=self._index_logs)
 
     def ensure_structure(self):
         """Ensures the memory directory and basic files exist."""
@@ -33,39 +78,72 @@ class MemoryManager:
         # We assume default files (SOUL.md etc) are created by setup or manual injection.
         # If they don't exist, we just won't read them (or could create empty ones).
 
-    def _read_file(self, filename: str) -> str:
-        """Reads a markdown file and returns its content. Returns empty string if not found."""
-        file_path = self.root_path / filename
-        if not file_path.exists():
+    def _stat_key(self, filename: str):
+        """(mtime_ns, size) of a memory file, or None if it does not exist."""
+        try:
+            st = os.stat(self.root_path / filename)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_file(self, filename: str, key=None) -> str:
+        """
+        Reads a markdown file and returns its content. Returns empty string if not found.
+        Content is cached until the file's mtime/size changes.
+        """
+        if key is None:
+            key = self._stat_key(filename)
+        if key is None:
             return ""
+        cached = self._file_cache.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
         
+        file_path = self.root_path / filename
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 content = f.read().strip()
                 # Basic security masking (simple regex for API keys)
                 # This is a placeholder for more robust security
                 content = re.sub(r"(sk-[a-zA-Z0-9]{48})", "sk-************************", content)
-                return content
+            self._file_cache[filename] = (key, content)
+            return content
         except Exception as e:
             server_logger.error(f"Error reading {filename}: {e}")
             return ""
 
+    def read_context_files(self):
+        """
+        Returns (stat keys, {filename: content}) for CONTEXT_FILES.
+        The keys change whenever any file changes, so callers can cache derived prompts.
+        """
+        keys = tuple(self._stat_key(name) for name in CONTEXT_FILES)
+        contents = {name: self._read_file(name, key) for name, key in zip(CONTEXT_FILES, keys)}
+        return keys, contents
+
     def get_system_context(self) -> str:
         """
         Assembles the System Prompt from memory files.
         Order: SOUL -> IDENTITY -> MEMORY -> USER
+        Rebuilt only when one of the files changes; otherwise this is four stat calls.
         """
+        keys = tuple(self._stat_key(name) for name in CONTEXT_FILES)
+        cached = self._context_cache
+        if cached and cached[0] == keys:
+            return cached[1]
+        soul_key, identity_key, memory_key, user_key = keys
+        
         parts = []
         
-        soul = self._read_file("SOUL.md")
+        soul = self._read_file("SOUL.md", soul_key)
         if soul:
             parts.append(f"[SOUL - CORE INSTRUCTIONS]\n{soul}")
             
-        identity = self._read_file("IDENTITY.md")
+        identity = self._read_file("IDENTITY.md", identity_key)
         if identity:
             parts.append(f"[IDENTITY - PERSONA]\n{identity}")
             
-        memory = self._read_file("MEMORY.md")
+        memory = self._read_file("MEMORY.md", memory_key)
         if memory:
             # Simple truncation for Project Memory to save tokens (Tier L2)
             lines = memory.split('\n')
@@ -73,11 +151,13 @@ class MemoryManager:
                 memory = '\n'.join(lines[:100]) + "\n... (truncated)"
             parts.append(f"[PROJECT KNOWLEDGE]\n{memory}")
             
-        user = self._read_file("USER.md")
+        user = self._read_file("USER.md", user_key)
         if user:
             parts.append(f"[USER PROFILE]\n{user}")
             
-        return "\n\n".join(parts)
+        context = "\n\n".join(parts)
+        self._context_cache = (keys, context)
+        return context
 
     def get_raw_memory(self) -> dict:
         """
@@ -93,123 +173,195 @@ class MemoryManager:
     def log_interaction(self, user_query: str, ai_response: str):
         """
         Logs the interaction to daily markdown log.
+        The entry is buffered and written by the log writer (see services/interaction_log_svc.py).
         """
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            log_file = self.root_path / "logs" / f"{today}.md"
-            
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            
-            entry = f"\n\n## [{timestamp}] User\n{user_query}\n\n## [{timestamp}] Assistant\n{ai_response}\n"
-            
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(entry)
+            self.log_writer.append(user_query, ai_response)
         except Exception as e:
             server_logger.error(f"Error logging interaction: {e}")
 
-    async def condense_memory(self):
+    def _index_logs(self, log_files: list):
+        """Indexes freshly written entries for /api/ai/search."""
+        # Imported here to avoid a cycle
+        from services.retrieval_svc import retrieval_index
+        for log_file in log_files:
+            retrieval_index.index_log_file(log_file)
+
+    def _load_condense_state(self) -> dict:
+        """{log filename: byte offset already condensed}"""
+        path = self.root_path / CONDENSE_STATE_FILE
+        if not path.exists():
+            # State written by older versions in the memory root
+            path = self.root_path / LEGACY_CONDENSE_STATE_FILE
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_condense_state(self, state: dict):
+        path = self.root_path / CONDENSE_STATE_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        gitignore = path.parent / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text("*\n", encoding="utf-8")
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+        legacy = self.root_path / LEGACY_CONDENSE_STATE_FILE
+        if legacy.exists():
+            legacy.unlink()
+
+    def _pending_log_chunks(self, state: dict) -> list:
+        """
+        Splits log content past each watermark into chunks of whole entries,
+        each at most CONDENSE_CHUNK_TOKENS. Returns [(log name, end offset, text)]
+        in file order, so a log's watermark can advance chunk by chunk.
+        """
+        from services.context_svc import estimate_tokens
+
+        chunks = []
+        for log_file in iter_log_files(self.root_path / "logs"):
+            name = log_key(log_file)
+            offset = state.get(name, 0)
+            size = log_size(log_file)
+            if size <= offset:
+                continue
+            data = read_log(log_file, offset, size)
+
+            # Entry boundaries (relative to offset); a chunk never splits an entry.
+            # The writer's offset index avoids scanning; older logs fall back to the regex
+            indexed = self.log_writer.entry_offsets(name)
+            if indexed is not None:
+                starts = [o - offset for o in indexed if offset <= o < size]
+            else:
+                starts = [m.start() for m in _LOG_ENTRY_RE.finditer(data)]
+            if not starts or starts[0] != 0:
+                starts.insert(0, 0)
+            bounds = starts[1:] + [len(data)]
+
+            parts, tokens, chunk_start = [], 0, 0
+            for start, end in zip(starts, bounds):
+                entry = data[start:end].decode("utf-8", errors="replace")
+                cost = estimate_tokens(entry)
+                if parts and tokens + cost > CONDENSE_CHUNK_TOKENS:
+                    chunks.append((name, offset + start, "".join(parts)))
+                    parts, tokens = [], 0
+                if cost > CONDENSE_CHUNK_TOKENS:
+                    # A single oversized entry: keep its beginning
+                    entry = entry[:CONDENSE_CHUNK_TOKENS * 2] + "\n... (truncated)"
+                    cost = CONDENSE_CHUNK_TOKENS
+                parts.append(entry)
+                tokens += cost
+            chunks.append((name, offset + len(data), "".join(parts)))
+        return chunks
+
+    def _existing_facts(self) -> set:
+        user = self._read_file("USER.md")
+        facts = set()
+        for line in user.splitlines():
+            m = _BULLET_RE.match(line)
+            if m:
+                facts.add(_normalize_fact(m.group(1)))
+        return facts
+
+    async def condense_memory(self) -> dict:
         """
         [Advanced] Triggers memory condensation.
-        Reads today's logs, invokes LLM to extract key points, and updates USER.md.
+        Only log content past each file's watermark is processed. It is split into
+        token-bounded chunks that are summarised concurrently (at most
+        CONDENSE_CONCURRENCY at a time); the extracted facts are de-duplicated
+        against USER.md before being appended.
         """
-        try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            log_file = self.root_path / "logs" / f"{today}.md"
-            
-            if not log_file.exists():
-                server_logger.info("No logs to condense for today.")
-                return
+        async with self._condense_lock:
+            try:
+                return await self._condense()
+            except Exception as e:
+                server_logger.error(f"Error condensing memory: {e}")
+                return {"chunks": 0, "facts": 0, "error": str(e)}
 
-            with open(log_file, "r", encoding="utf-8") as f:
-                logs_content = f.read()
+    async def _condense(self) -> dict:
+        # Buffered entries must be on disk before reading past the watermarks
+        await asyncio.to_thread(self.log_writer.flush)
+        state = self._load_condense_state()
+        chunks = self._pending_log_chunks(state)
+        if sum(len(text) for _, _, text in chunks) < CONDENSE_MIN_CHARS:
+            # Too little new content; leave it for the next run
+            server_logger.info("No new logs to condense.")
+            return {"chunks": 0, "facts": 0}
 
-            if len(logs_content) < 100:
-                server_logger.info("Logs too short to condense.")
-                return
+        # Avoid circular imports by importing inside method
+        from services.llm_client import llm_client
+        from services.llm_scheduler import BACKGROUND
 
-            # Avoid circular imports by importing inside method
-            from services.llm_client import llm_client
+        semaphore = asyncio.Semaphore(max(1, CONDENSE_CONCURRENCY))
 
-            system_prompt = """
-            You are a Memory Assembler for an AI Assistant.
-            Your job is to read conversation logs and extract key facts to update the User Profile.
-            
-            EXTRACT:
-            1. User Preferences (language, coding style, frameworks)
-            2. Project Key Decisions (architecture, stack)
-            3. Future Context (what to do next)
-            
-            OUTPUT FORMAT:
-            - Return ONLY the new facts in bullet point format.
-            - If nothing important is found, return "NO_UPDATE".
-            - Do not summarize chitchat.
-            """
+        async def summarise(text: str) -> str:
+            user_prompt = f"Analyze these logs and extract key memory updates:\n\n{text}"
+            async with semaphore:
+                # Interactive requests are served ahead of condensation
+                return await llm_client.generate_async(user_prompt, system=CONDENSE_SYSTEM_PROMPT,
+                                                       priority=BACKGROUND)
 
-            user_prompt = f"Analyze these logs and extract key memory updates:\n\n{logs_content}"
-            
-            server_logger.info("🧠 MemoryManager: Condensing memory...")
-            # Use async generation to prevent blocking
-            summary = await llm_client.generate_async(user_prompt, system=system_prompt)
-            
-            if "NO_UPDATE" in summary or not summary.strip():
-                server_logger.info("🧠 MemoryManager: No important updates found.")
-                return
+        server_logger.info(f"🧠 MemoryManager: Condensing memory ({len(chunks)} chunk(s))...")
+        summaries = await asyncio.gather(*(summarise(text) for _, _, text in chunks),
+                                         return_exceptions=True)
 
-            # Append summary to USER.md
+        # Merge facts in log order; a watermark only advances past consecutive
+        # successful chunks, so failed ones are retried next time
+        known = self._existing_facts()
+        facts = []
+        failed_logs = set()
+        new_state = dict(state)
+        for (log_name, end_offset, _), summary in zip(chunks, summaries):
+            if log_name in failed_logs:
+                continue
+            if isinstance(summary, Exception) or not summary.strip():
+                # generate_async returns "" when Ollama is unreachable
+                failed_logs.add(log_name)
+                continue
+            new_state[log_name] = end_offset
+            if "NO_UPDATE" in summary:
+                continue
+            lines = [line.strip() for line in summary.splitlines() if line.strip()]
+            bullets = [m.group(1) for m in map(_BULLET_RE.match, lines) if m]
+            # Prefer the bullet points; fall back to plain lines if the model ignored the format
+            for fact in bullets or lines:
+                key = _normalize_fact(fact)
+                if not key or key in known:
+                    continue
+                known.add(key)
+                facts.append(fact)
+
+        if facts:
             user_md = self.root_path / "USER.md"
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-            
-            update_entry = f"\n\n### Learned from {today} (at {timestamp})\n{summary}\n"
-            
+            days = sorted({name[:10] for name, _, _ in chunks if new_state.get(name) != state.get(name)})
+            bullets = "\n".join(f"- {fact}" for fact in facts)
+            update_entry = f"\n\n### Learned from {', '.join(days)} (at {timestamp})\n{bullets}\n"
             with open(user_md, "a", encoding="utf-8") as f:
                 f.write(update_entry)
-                
-            server_logger.info(f"🧠 MemoryManager: Updated USER.md with new insights:\n{summary}")
+            server_logger.info(f"🧠 MemoryManager: Updated USER.md with new insights:\n{bullets}")
 
-        except Exception as e:
-            server_logger.error(f"Error condensing memory: {e}")
+            from services.memory_sync_svc import memory_sync
+            memory_sync.notify()
+        else:
+            server_logger.info("🧠 MemoryManager: No important updates found.")
 
-    async def sync_memory(self):
+        if new_state != state:
+            self._save_condense_state(new_state)
+        if failed_logs:
+            server_logger.warning(f"🧠 MemoryManager: Condensation incomplete for {sorted(failed_logs)}, will retry.")
+        return {"chunks": len(chunks), "facts": len(facts), "failed_logs": sorted(failed_logs)}
+
+    async def sync_memory(self) -> dict:
         """
-        Syncs the memory repository with remote git using asyncio subprocess.
+        Syncs the memory repository with remote git right away.
+        Routine syncing is debounced in the background (see services/memory_sync_svc.py).
         """
-        try:
-            # Check if git is initialized
-            if not (self.root_path / ".git").exists():
-                return
-
-            async def run_git_async(args):
-                process = await asyncio.create_subprocess_exec(
-                    "git", *args,
-                    cwd=str(self.root_path),
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await process.communicate()
-                if process.returncode != 0:
-                    raise Exception(f"Git command failed: {stderr.decode()}")
-                return stdout.decode()
-
-            # 1. Pull
-            await run_git_async(["pull"])
-            
-            # 2. Add
-            await run_git_async(["add", "."])
-            
-            # 3. Commit
-            status = await run_git_async(["status", "--porcelain"])
-            if status.strip():
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                await run_git_async(["commit", "-m", f"Auto-sync: {timestamp}"])
-                
-                # 4. Push
-                await run_git_async(["push"])
-                server_logger.info(f"Memory synced at {timestamp}")
-            else:
-                pass
-                
-        except Exception as e:
-            server_logger.error(f"Sync failed: {e}")
+        from services.memory_sync_svc import memory_sync
+        return await asyncio.to_thread(memory_sync.sync_now)
 
 # Singleton instance
 memory_manager = MemoryManager()
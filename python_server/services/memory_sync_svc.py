@@ -0,0 +1,194 @@
+import os
+import time
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from utils.logger import server_logger as logger
+from services.memory_manager import memory_manager
+
+# 距第一筆未同步變更多久後同步 (秒)，或累積多少筆互動後提早同步
+SYNC_INTERVAL = float(os.getenv("CODESYNTH_MEMORY_SYNC_INTERVAL", "60"))
+SYNC_MAX_PENDING = int(os.getenv("CODESYNTH_MEMORY_SYNC_MAX_PENDING", "20"))
+# 遠端無法連線時的指數退避 (秒)
+BACKOFF_BASE = 30.0
+BACKOFF_MAX = 30 * 60.0
+GIT_TIMEOUT = 60
+
+
+class GitError(Exception):
+    pass
+
+
+class MemorySyncScheduler:
+    """
+    memory repo 的背景 git 同步。
+    notify() 只記錄有變更並喚醒背景執行緒，實際的 add / commit / pull / push
+    以 debounce 合併成一次 commit；遠端失敗時本機 commit 保留，並以指數退避重試 push。
+    """
+
+    def __init__(self, root_path: Path, interval: float = SYNC_INTERVAL, max_pending: int = SYNC_MAX_PENDING):
+        self.root_path = Path(root_path)
+        self.interval = interval
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()  # 背景同步與手動同步不可同時執行 git
+        self._thread = None
+        self._stopping = False
+
+        self._pending = 0
+        self._first_pending_at = None
+        self._unpushed = False
+        self._failures = 0
+        self._backoff_until = 0.0
+        self._syncing = False
+        self._last_attempt_at = None
+        self._last_success_at = None
+        self._last_error = None
+
+    @property
+    def enabled(self) -> bool:
+        return (self.root_path / ".git").exists()
+
+    def _ensure_started(self):
+        # 呼叫端已持有 self._cond
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="memory-sync", daemon=True)
+            self._thread.start()
+
+    def notify(self, count: int = 1):
+        """記錄 memory 有新變更；不執行任何 I/O"""
+        with self._cond:
+            if self._stopping:
+                return
+            self._pending += count
+            if self._first_pending_at is None:
+                self._first_pending_at = time.time()
+            self._ensure_started()
+            self._cond.notify()
+
+    def _due_at(self):
+        """下次應同步的時間；沒有待同步的變更時回傳 None"""
+        if not self._pending and not self._unpushed:
+            return None
+        if self._pending >= self.max_pending:
+            due = time.time()
+        elif self._pending:
+            due = self._first_pending_at + self.interval
+        else:
+            # 只剩未 push 的 commit：等退避時間
+            due = self._backoff_until
+        return max(due, self._backoff_until)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    due = self._due_at()
+                    now = time.time()
+                    if due is not None and due <= now:
+                        break
+                    self._cond.wait(None if due is None else due - now)
+            self._sync()
+
+    def _git(self, *args) -> str:
+        try:
+            result = subprocess.run(
+                ["git", *args], cwd=str(self.root_path),
+                capture_output=True, text=True, timeout=GIT_TIMEOUT,
+                # 沒有憑證時直接失敗，不要在背景等待輸入
+                env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+            )
+        except subprocess.TimeoutExpired:
+            raise GitError(f"git {args[0]} timed out")
+        if result.returncode != 0:
+            raise GitError(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def _sync(self) -> bool:
+        with self._sync_lock:
+            with self._cond:
+                pending = self._pending
+                self._pending = 0
+                self._first_pending_at = None
+                self._syncing = True
+                self._last_attempt_at = time.time()
+            try:
+                if not self.enabled:
+                    with self._cond:
+                        self._unpushed = False
+                    return True
+
+                # 1. 先在本機 commit (離線時變更也不會遺失)
+                self._git("add", "-A")
+                if self._git("status", "--porcelain").strip():
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    self._git("commit", "-m", f"Auto-sync: {timestamp}")
+                    with self._cond:
+                        self._unpushed = True
+
+                # 2. 與遠端同步
+                if self._git("remote").strip():
+                    self._git("pull", "--no-edit")
+                    if self._unpushed:
+                        self._git("push")
+                with self._cond:
+                    self._unpushed = False
+                    self._failures = 0
+                    self._backoff_until = 0.0
+                    self._last_success_at = time.time()
+                    self._last_error = None
+                logger.info(f"Memory synced ({pending} change(s))")
+                return True
+            except Exception as e:
+                with self._cond:
+                    self._failures += 1
+                    delay = min(BACKOFF_BASE * 2 ** (self._failures - 1), BACKOFF_MAX)
+                    self._backoff_until = time.time() + delay
+                    self._last_error = str(e)
+                    if not self._unpushed:
+                        # commit 之前就失敗：保留待同步計數，下次重試
+                        self._pending += pending
+                        if self._pending and self._first_pending_at is None:
+                            self._first_pending_at = time.time()
+                logger.warning(f"Memory sync failed (retry in {delay:.0f}s): {e}")
+                return False
+            finally:
+                with self._cond:
+                    self._syncing = False
+
+    def sync_now(self) -> dict:
+        """立即同步 (忽略 debounce 與退避)，回傳同步狀態"""
+        self._sync()
+        return self.status()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "syncing": self._syncing,
+                "pending_changes": self._pending,
+                "unpushed_commits": self._unpushed,
+                "consecutive_failures": self._failures,
+                "last_attempt_at": self._last_attempt_at,
+                "last_success_at": self._last_success_at,
+                "last_error": self._last_error,
+                "next_sync_at": self._due_at(),
+            }
+
+    def stop(self, timeout: float = GIT_TIMEOUT):
+        """關閉前把尚未同步的變更 commit (並嘗試 push)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+            has_changes = self._pending > 0 or self._unpushed
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        if has_changes:
+            self._sync()
+
+
+memory_sync = MemorySyncScheduler(memory_manager.root_path)
@@ -0,0 +1,174 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Optional
+from utils.logger import server_logger as logger
+from services.memory_manager import memory_manager
+
+SESSION_TTL = int(os.getenv("CODESYNTH_PREVIEW_SESSION_TTL", str(3600 * 24)))  # 閒置逾時 (秒)
+MAX_SESSIONS = int(os.getenv("CODESYNTH_PREVIEW_MAX_SESSIONS", "32"))
+PERSIST_SESSIONS = os.getenv("CODESYNTH_PREVIEW_PERSIST_SESSIONS", "1") != "0"
+PERSIST_INTERVAL = 600  # 存取時間最多每 10 分鐘寫回資料庫一次
+# 持久化使用伺服器自己的資料庫 (與 LLM 快取同在 .index/)，不在被預覽的資料夾建立檔案
+SESSION_DB_PATH = memory_manager.root_path / ".index" / "preview_sessions.db"
+
+
+class PreviewSessionStore:
+    """
+    預覽 Session 儲存區。
+    OrderedDict 依最後存取時間排序 (滑動逾時)，過期項目必定集中在開頭，
+    清理與 LRU 淘汰皆為 O(1) 攤銷；同一專案共用一個 Session。
+    啟用持久化時 Session 依專案路徑記錄在 db_path，伺服器重啟後重新 init 會取回相同 session_id。
+    """
+
+    def __init__(self, ttl: int = SESSION_TTL, max_sessions: int = MAX_SESSIONS,
+                 persist: bool = PERSIST_SESSIONS, db_path: Path = SESSION_DB_PATH):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.persist = persist
+        self.db_path = Path(db_path)
+        # session_id -> { path, key, created_at, last_access, persisted_at }
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        # realpath(project_path) -> session_id
+        self._by_project: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _remove(self, session_id: str) -> Dict:
+        session = self._sessions.pop(session_id)
+        if self._by_project.get(session["key"]) == session_id:
+            del self._by_project[session["key"]]
+        return session
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["last_access"] <= self.ttl:
+                break
+            self._remove(session_id)
+            logger.info(f"預覽 Session 過期: {session_id}")
+
+    def _touch(self, session_id: str, now: float) -> bool:
+        """更新存取時間，回傳是否需要寫回資料庫"""
+        session = self._sessions[session_id]
+        session["last_access"] = now
+        self._sessions.move_to_end(session_id)
+        if self.persist and now - session["persisted_at"] > PERSIST_INTERVAL:
+            session["persisted_at"] = now
+            return True
+        return False
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if session_id not in self._sessions:
+                return None
+            needs_persist = self._touch(session_id, now)
+            session = dict(self._sessions[session_id])
+        if needs_persist:
+            self._save(session["path"], session_id, session["created_at"], now)
+        return session
+
+    def get_or_create(self, project_path: str) -> str:
+        """回傳專案既有的 Session，沒有時從資料庫取回或建立新的"""
+        key = os.path.realpath(project_path)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session_id = self._by_project.get(key)
+            if session_id:
+                needs_persist = self._touch(session_id, now)
+                created_at = self._sessions[session_id]["created_at"]
+            else:
+                needs_persist = False
+        if session_id:
+            if needs_persist:
+                self._save(project_path, session_id, created_at, now)
+            return session_id
+
+        restored = self._load(project_path, now) if self.persist else None
+        with self._lock:
+            # 讀取資料庫期間可能已有其他請求建立
+            session_id = self._by_project.get(key)
+            if session_id:
+                self._touch(session_id, now)
+                return session_id
+
+            session_id, created_at = restored or (str(uuid.uuid4()), now)
+            self._sessions[session_id] = {
+                "path": project_path,
+                "key": key,
+                "created_at": created_at,
+                "last_access": now,
+                "persisted_at": now,
+            }
+            self._by_project[key] = session_id
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = next(iter(self._sessions.items()))
+                self._remove(evicted_id)
+                logger.info(f"預覽 Session 數量已達上限，淘汰: {evicted_id}")
+
+        if restored:
+            logger.info(f"恢復預覽 Session: {session_id} -> {project_path}")
+        else:
+            logger.info(f"建立預覽 Session: {session_id} -> {project_path}")
+        if self.persist:
+            self._save(project_path, session_id, created_at, now)
+        return session_id
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 只是快取性質的狀態，不需要進入 memory repo 的 git 同步
+        gitignore = self.db_path.parent / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text("*\n", encoding="utf-8")
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("""CREATE TABLE IF NOT EXISTS preview_sessions
+                        (project_key TEXT PRIMARY KEY, session_id TEXT,
+                         created_at REAL, last_access REAL)""")
+        return conn
+
+    def _load(self, project_path: str, now: float):
+        """取回專案尚未過期的 Session，回傳 (session_id, created_at) 或 None"""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT session_id, created_at, last_access FROM preview_sessions WHERE project_key = ?",
+                    (os.path.realpath(project_path),)
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"讀取預覽 Session 失敗: {e}")
+            return None
+        if row and now - row[2] <= self.ttl:
+            return row[0], row[1]
+        return None
+
+    def _save(self, project_path: str, session_id: str, created_at: float, last_access: float):
+        try:
+            conn = self._connect()
+            try:
+                # 每個專案只保留一筆，順便清除過期的記錄
+                conn.execute(
+                    "INSERT OR REPLACE INTO preview_sessions (project_key, session_id, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (os.path.realpath(project_path), session_id, created_at, last_access),
+                )
+                conn.execute("DELETE FROM preview_sessions WHERE last_access < ?", (last_access - self.ttl,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"儲存預覽 Session 失敗: {e}")
+
+
+preview_sessions = PreviewSessionStore()
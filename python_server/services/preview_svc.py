@@ -1,15 +1,40 @@
 import os
-import uuid
-import time
-from typing import Dict
-from fastapi.responses import FileResponse, HTMLResponse
+import html
+import stat
+import tempfile
+import threading
+import mimetypes
+from typing import Dict, List
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from fastapi import HTTPException
 from utils.security import validate_project_path, validate_file_path
+from utils.cache import LRUCache
+from utils.http_cache import (
+    stat_etag, content_etag, validator_headers, is_not_modified, not_modified_response
+)
+from utils.compression import (
+    negotiate_encoding, is_compressible, find_sidecar, get_compressed, encoded_etag,
+    MIN_COMPRESS_SIZE, MAX_COMPRESS_SIZE
+)
+from utils.http_range import (
+    parse_range_header, if_range_matches, range_not_satisfiable_response,
+    RangeFileResponse, RangeNotSatisfiable
+)
+from utils.html_index import get_index, annotate
 from utils.logger import server_logger as logger
+from services.preview_session_store import preview_sessions
+from services.snapshot_svc import save_snapshot
 
-# session_id -> { path: project_path, created_at: timestamp }
-PREVIEW_SESSIONS: Dict[str, Dict] = {}
-SESSION_TTL = 3600 * 24  # 24 hours
+# 已注入編輯器腳本的 HTML 快取: (path, mtime_ns, size) -> (html bytes, etag)
+INJECTED_HTML_CACHE = LRUCache(max_entries=64, max_bytes=16 * 1024 * 1024,
+                               sizeof=lambda entry: len(entry[0]))
+
+# 視覺化編輯的暫存檔副檔名 (檔案監看需忽略)
+EDIT_TEMP_SUFFIX = ".cs-tmp"
+
+# 同一檔案的編輯依序進行: full_path -> Lock
+_EDIT_LOCKS: Dict[str, threading.Lock] = {}
+_EDIT_LOCKS_GUARD = threading.Lock()
 
 WELCOME_HTML = """
 <!DOCTYPE html>
@@ -36,16 +61,45 @@ WELCOME_HTML = """
             若您不熟悉程式碼，請使用 <b>CodeSynth Cockpit</b> 面板中的<br>
             <b>「精靈 (Wizard)」</b> 功能來快速建立您的第一個專案。
         </p>
-        <p style="color: #858585; font-size: 0.9em;">(建立完成後，請點擊上方重新整理按鈕以預覽您的作品)</p>
+        <p style="color: #858585; font-size: 0.9em;">(建立完成後，預覽會自動重新整理)</p>
     </div>
+    <script>
+        // 檔案變更時自動重新整理 (即時預覽)
+        if (window.EventSource) {
+            const sessionId = window.location.pathname.split('/')[3];
+            const source = new EventSource(`/api/preview/${sessionId}/_codesynth/events`);
+            source.addEventListener('change', () => window.location.reload());
+        }
+    </script>
 </body>
 </html>
 """
 
+WELCOME_ETAG = content_etag(WELCOME_HTML)
+
 EDITOR_JS = """
 (function() {
     console.log("[CodeSynth] Visual Editor Active");
     
+    // 本頁最近一次由視覺化編輯寫入的時間，用於忽略自己觸發的檔案變更
+    let lastSelfSave = 0;
+    
+    // 頁面載入時的檔案版本，寫入時供伺服器檢查檔案是否已被其他來源修改
+    const scriptEl = document.currentScript;
+    let baseVersion = scriptEl ? scriptEl.dataset.csVersion : null;
+    
+    // url: /api/preview/{guid}/{file.html}
+    // parts: ["", "api", "preview", "{guid}", "{file.html}"]
+    const pathParts = window.location.pathname.split('/');
+    const sessionId = pathParts[3];
+    const currentFile = pathParts.slice(4).join('/') || 'index.html';
+    
+    // 待儲存的修改：同一元素多次修改合併為一筆，停止編輯一段時間後批次送出
+    const SAVE_DEBOUNCE_MS = 500;
+    const pendingEdits = new Map();  // element -> { element, original, newText }
+    let flushTimer = null;
+    let inflight = null;
+    
     // 定義可編輯的元素選擇器
     const EDITABLE_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'span', 'li', 'a', 'button', 'td', 'th', 'div'];
     
@@ -89,7 +143,7 @@ EDITOR_JS = """
                     const oldText = this.dataset.original;
                     
                     if (newText !== oldText) {
-                        saveChange(oldText, newText, this);
+                        queueChange(oldText, newText, this);
                     }
                 });
                 
@@ -104,169 +158,485 @@ EDITOR_JS = """
         });
     }
 
-    async function saveChange(original, newText, element) {
+    function queueChange(original, newText, element) {
+        const existing = pendingEdits.get(element);
+        pendingEdits.set(element, {
+            element: element,
+            // 合併時保留第一次修改前的文字，伺服器以此確認內容
+            original: existing ? existing.original : original,
+            newText: newText
+        });
+        element.dataset.original = newText;
         element.classList.add('cs-saving');
+        clearTimeout(flushTimer);
+        flushTimer = setTimeout(flushEdits, SAVE_DEBOUNCE_MS);
+    }
+    
+    function takePending() {
+        const entries = Array.from(pendingEdits.values());
+        pendingEdits.clear();
+        return entries;
+    }
+    
+    function buildPayload(entries) {
+        // data-cs-id 由伺服器注入，為元素在原始碼中的穩定定位；
+        // 執行期間動態產生的元素沒有 data-cs-id，改用舊的文字比對
+        return JSON.stringify({
+            edits: entries.map(entry => {
+                const csId = entry.element.dataset.csId;
+                return {
+                    file_path: currentFile,
+                    original_text: entry.original,
+                    new_text: entry.newText,
+                    cs_id: csId !== undefined ? parseInt(csId, 10) : null,
+                    base_version: csId !== undefined ? baseVersion : null
+                };
+            })
+        });
+    }
+    
+    async function flushEdits() {
+        flushTimer = null;
+        // 一次只送出一批，後一批需帶著前一批回傳的新版本
+        while (inflight) await inflight;
+        if (pendingEdits.size === 0) return;
+        inflight = sendEdits(takePending());
+        try {
+            await inflight;
+        } finally {
+            inflight = null;
+        }
+    }
+    
+    function revert(entries) {
+        entries.forEach(entry => {
+            entry.element.textContent = entry.original;
+            entry.element.dataset.original = entry.original;
+        });
+    }
+    
+    async function sendEdits(entries) {
         showToast("Saving...");
+        lastSelfSave = Date.now();
         
         try {
-            // 從 URL 推測 Session ID (需後端配合注入或從 path 解析)
-            // 當前 URL: /api/preview/{session_id}/{path...}
-            const pathParts = window.location.pathname.split('/');
-            // url: /api/preview/{guid}/{file.html}
-            // parts: ["", "api", "preview", "{guid}", "{file.html}"]
-            const sessionId = pathParts[3]; 
-            const filePath = pathParts.slice(4).join('/') || 'index.html';
-            
-            const resp = await fetch(`/api/preview/${sessionId}/update`, {
+            const resp = await fetch(`/api/preview/${sessionId}/batch_update`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    file_path: filePath,
-                    original_text: original,
-                    new_text: newText
-                })
+                body: buildPayload(entries)
             });
             
-            if (resp.ok) {
-                const data = await resp.json();
-                showToast("Saved!");
-                element.dataset.original = newText; // update original
-            } else {
+            if (!resp.ok) {
                 const err = await resp.json();
                 showToast("Save Failed: " + err.detail, true);
-                element.textContent = original; // Revert
+                revert(entries);
+                return;
+            }
+            
+            const data = await resp.json();
+            const result = (data.results || [])[0] || {};
+            lastSelfSave = Date.now();
+            if (result.status === 'success') {
+                if (result.version) baseVersion = result.version;
+                showToast(entries.length > 1 ? `Saved ${entries.length} edits!` : "Saved!");
+            } else if (result.status === 'conflict' && entries.some(e => e.element.dataset.csId !== undefined)) {
+                // 檔案已被其他來源修改，重新載入取得最新內容與定位
+                showToast("File changed on disk, reloading...", true);
+                setTimeout(() => window.location.reload(), 1000);
+            } else {
+                showToast("Save Failed: " + result.detail, true);
+                revert(entries);
             }
         } catch (e) {
             showToast("Network Error", true);
-            element.textContent = original;
+            revert(entries);
         } finally {
-            element.classList.remove('cs-saving');
+            entries.forEach(entry => entry.element.classList.remove('cs-saving'));
         }
     }
     
+    // 離開頁面時以 sendBeacon 送出尚未儲存的修改
+    window.addEventListener('pagehide', function() {
+        if (pendingEdits.size === 0 || !navigator.sendBeacon) return;
+        clearTimeout(flushTimer);
+        const blob = new Blob([buildPayload(takePending())], { type: 'application/json' });
+        navigator.sendBeacon(`/api/preview/${sessionId}/batch_update`, blob);
+    });
+    
+    // 即時預覽：以 SSE 接收檔案變更通知
+    function initLiveReload() {
+        if (!window.EventSource) return;
+        const source = new EventSource(`/api/preview/${sessionId}/_codesynth/events`);
+        
+        source.addEventListener('change', function(e) {
+            const paths = JSON.parse(e.data).paths || [];
+            // 視覺化編輯剛寫入本頁所造成的變更不需重新載入
+            const external = paths.filter(p => !(p === currentFile && Date.now() - lastSelfSave < 2000));
+            if (external.length === 0) return;
+            
+            // 僅 CSS 變更時直接替換樣式表，不重新載入頁面
+            if (external.every(p => p.toLowerCase().endsWith('.css')) && swapStylesheets(external)) {
+                showToast("CSS updated");
+                return;
+            }
+            window.location.reload();
+        });
+    }
+    
+    function swapStylesheets(paths) {
+        const links = document.querySelectorAll('link[rel="stylesheet"]');
+        const swapped = new Set();
+        links.forEach(link => {
+            const url = new URL(link.href, window.location.href);
+            // url: /api/preview/{guid}/{file.css}
+            const rel = url.pathname.split('/').slice(4).join('/');
+            if (paths.includes(rel)) {
+                url.searchParams.set('cs_v', Date.now());
+                link.href = url.toString();
+                swapped.add(rel);
+            }
+        });
+        // 有變更的 CSS 未被 <link> 直接引用 (例如 @import) 時改為整頁重新載入
+        return swapped.size === paths.length;
+    }
+    
     // 延遲執行以確保 DOM Ready
     if (document.readyState === 'loading') {
         document.addEventListener('DOMContentLoaded', initEditor);
     } else {
         initEditor();
     }
+    initLiveReload();
 })();
 """
 
+def _file_version(st: os.stat_result) -> str:
+    """視覺化編輯的樂觀鎖版本，由 mtime_ns 與大小組成"""
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _inject_editor_script(content: str, version: str) -> str:
+    """注入腳本 (簡單附加在 body 結束前)"""
+    injection = f'<script data-cs-version="{version}">{EDITOR_JS}</script>'
+    if '</body>' in content:
+        return content.replace('</body>', injection + '</body>', 1)
+    return content + injection
+
+
+def _get_injected_html(full_path: str, st: os.stat_result):
+    """
+    取得注入後的 HTML 與其 ETag；檔案未變更 (mtime/size 相同) 時直接使用快取
+    ETag 取自注入後內容的雜湊，編輯器腳本更新時也會跟著改變
+    可編輯元素會加上 data-cs-id，與 _apply_edits 使用的位置索引一致
+    """
+    key = (full_path, st.st_mtime_ns, st.st_size)
+    entry = INJECTED_HTML_CACHE.get(key)
+    if entry is None:
+        # newline='' 保留原始換行，索引位置才能與寫回時一致
+        with open(full_path, 'r', encoding='utf-8', newline='') as f:
+            source = f.read()
+        annotated = annotate(source, get_index(key, source))
+        content = _inject_editor_script(annotated, _file_version(st)).encode('utf-8')
+        entry = (content, content_etag(content))
+        INJECTED_HTML_CACHE.put(key, entry)
+    return entry
+
+
+def _edit_lock(full_path: str) -> threading.Lock:
+    with _EDIT_LOCKS_GUARD:
+        lock = _EDIT_LOCKS.get(full_path)
+        if lock is None:
+            lock = _EDIT_LOCKS[full_path] = threading.Lock()
+        return lock
+
+
+def _atomic_write(full_path: str, content: str, mode: int):
+    """寫入同目錄的暫存檔後以 os.replace 取代，避免讀到寫一半的檔案"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix=EDIT_TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        os.chmod(tmp_path, stat.S_IMODE(mode))
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _body_response(load, size: int, media_type: str, etag: str, last_modified: float,
+                   cache_key: tuple, encoding: str, request_headers):
+    """
+    可壓縮內容的回應：協商到編碼時回傳快取的壓縮版本，並處理條件式請求
+    load() 只在需要原始位元組時才呼叫 (壓縮快取未命中或不壓縮時)
+    """
+    if encoding and size >= MIN_COMPRESS_SIZE:
+        etag = encoded_etag(etag, encoding)
+        headers = validator_headers(etag, last_modified)
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+        if is_not_modified(request_headers, etag, last_modified):
+            return not_modified_response(headers)
+        body = get_compressed(cache_key, encoding, load)
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    headers = validator_headers(etag, last_modified)
+    headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request_headers, etag, last_modified):
+        return not_modified_response(headers)
+    return Response(content=load(), media_type=media_type, headers=headers)
+
+
 class PreviewService:
     # ... create_session 保持不變 ...
     
-    def update_file_content(self, session_id: str, file_path: str, original_text: str, new_text: str):
-        """更新檔案內容 (簡單文字替換)"""
-        session = PREVIEW_SESSIONS.get(session_id)
+    def update_file_content(self, session_id: str, file_path: str, original_text: str, new_text: str,
+                            cs_id: int = None, base_version: str = None):
+        """
+        更新檔案內容
+        有 cs_id 時依位置索引直接替換該元素的文字；否則退回簡單文字替換 (動態產生的元素)
+        """
+        session = preview_sessions.get(session_id)
         if not session:
             logger.warning(f"更新無效 Session: {session_id}")
             raise HTTPException(status_code=404, detail="Session expired")
-            
-        project_root = session['path']
-        full_path = os.path.join(project_root, file_path)
-        
-        # 安全性: `validate_file_path`
-        if not os.path.exists(full_path):
-             raise HTTPException(status_code=404, detail="File not found")
-             
+
+        edits = [{"cs_id": cs_id, "original_text": original_text, "new_text": new_text}]
+        return self._apply_edits(session['path'], file_path, edits, base_version)
+
+    def batch_update(self, session_id: str, edits: List[Dict]):
+        """
+        批次套用視覺化編輯：依檔案分組，每個檔案只讀寫一次
+        單一檔案內的修改全部成功或全部不套用；各檔案結果分別回報
+        """
+        session = preview_sessions.get(session_id)
+        if not session:
+            logger.warning(f"更新無效 Session: {session_id}")
+            raise HTTPException(status_code=404, detail="Session expired")
+
+        by_file: Dict[str, List[Dict]] = {}
+        for edit in edits:
+            by_file.setdefault(edit["file_path"], []).append(edit)
+
+        results = []
+        for file_path, file_edits in by_file.items():
+            base_version = next((e["base_version"] for e in file_edits if e.get("base_version")), None)
+            try:
+                result = self._apply_edits(session['path'], file_path, file_edits, base_version)
+                results.append({"file_path": file_path, **result})
+            except HTTPException as e:
+                results.append({
+                    "file_path": file_path,
+                    "status": "conflict" if e.status_code == 409 else "error",
+                    "detail": e.detail,
+                })
+
+        succeeded = sum(1 for r in results if r["status"] == "success")
+        if succeeded == len(results):
+            status = "success"
+        elif succeeded:
+            status = "partial"
+        else:
+            status = "error"
+        return {"status": status, "results": results}
+
+    def _resolve_path(self, project_root: str, file_path: str) -> str:
+        """驗證相對路徑並確認未逃逸出專案目錄"""
         try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            if original_text not in content:
-                raise HTTPException(status_code=409, detail="Original text not found (file may have changed)")
-                
-            # 只替換第一個出現的匹配項，避免誤傷
-            new_content = content.replace(original_text, new_text, 1)
-            
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
-                
-            logger.info(f"Visual Edit Updated: {file_path}")
-            return {"status": "success"}
-            
-        except Exception as e:
-            logger.error(f"Visual Edit Error: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+            validate_file_path(file_path)
+        except ValueError as e:
+            logger.warning(f"非法檔案路徑請求: {file_path} ({e})")
+            raise HTTPException(status_code=403, detail="Invalid file path")
+
+        full_path = os.path.join(project_root, file_path)
+        resolved_path = os.path.realpath(full_path)
+        resolved_root = os.path.realpath(project_root)
+        if not resolved_path.startswith(resolved_root):
+            logger.warning(f"路徑逃逸攔截: {full_path}")
+            raise HTTPException(status_code=403, detail="Access denied")
+        return full_path
+
+    def _apply_edits(self, project_root: str, file_path: str, edits: List[Dict], base_version: str = None):
+        """
+        將多個文字修改一次套用到同一檔案：
+        檢查版本 -> 依 data-cs-id 由位置索引取得元素範圍並由後往前替換
+        -> 沒有 cs_id 的修改依序做文字替換 -> 原子寫入 -> 記錄快照
+        """
+        full_path = self._resolve_path(project_root, file_path)
+
+        with _edit_lock(full_path):
+            try:
+                with open(full_path, 'r', encoding='utf-8', newline='') as f:
+                    st = os.fstat(f.fileno())
+                    source = f.read()
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="File not found")
+
+            if base_version and base_version != _file_version(st):
+                raise HTTPException(status_code=409, detail="File changed since the page was loaded")
+
+            index = get_index((full_path, st.st_mtime_ns, st.st_size), source)
+            crlf = "\r\n" in source
+
+            # 同一元素的多次修改只保留最後一次
+            splices = {}
+            text_edits = []
+            for edit in edits:
+                cs_id = edit.get("cs_id")
+                if cs_id is None:
+                    text_edits.append(edit)
+                    continue
+                if not 0 <= cs_id < len(index):
+                    raise HTTPException(status_code=409, detail=f"Element {cs_id} not found (file may have changed)")
+                el = index[cs_id]
+                original = edit.get("original_text")
+                if original is not None and cs_id not in splices:
+                    # 瀏覽器的 textContent 已解碼實體且換行正規化為 \n
+                    current = html.unescape(source[el.content_start:el.content_end]).replace("\r\n", "\n")
+                    if current != original:
+                        raise HTTPException(status_code=409, detail="Original text not found (file may have changed)")
+                new_text = html.escape(edit["new_text"], quote=False)
+                if crlf:
+                    new_text = new_text.replace("\n", "\r\n")
+                splices[cs_id] = (el.content_start, el.content_end, new_text)
+
+            parts = []
+            last = len(source)
+            for start, end, text in sorted(splices.values(), reverse=True):
+                parts.append(source[end:last])
+                parts.append(text)
+                last = start
+            parts.append(source[:last])
+            new_source = "".join(reversed(parts))
+
+            # 動態產生的元素：只替換第一個出現的匹配項，避免誤傷
+            for edit in text_edits:
+                original, new_text = edit["original_text"], edit["new_text"]
+                if crlf:
+                    original = original.replace("\n", "\r\n")
+                    new_text = new_text.replace("\n", "\r\n")
+                if original not in new_source:
+                    raise HTTPException(status_code=409, detail="Original text not found (file may have changed)")
+                new_source = new_source.replace(original, new_text, 1)
+
+            try:
+                _atomic_write(full_path, new_source, st.st_mode)
+                new_version = _file_version(os.stat(full_path))
+            except OSError as e:
+                logger.error(f"Visual Edit Error: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+
+        logger.info(f"Visual Edit Updated: {file_path} ({len(splices) + len(text_edits)} 處)")
+        snapshot = save_snapshot({
+            "project_path": project_root,
+            "file_path": file_path.replace("\\", "/"),
+            "content": new_source,
+            "trigger": "visual_edit",
+        })
+        return {"status": "success", "version": new_version, "version_id": snapshot.get("version_id")}
+
+    def get_session_path(self, session_id: str) -> str:
+        """取得 Session 對應的專案路徑"""
+        session = preview_sessions.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session expired or invalid")
+        return session['path']
 
     def create_session(self, project_path: str) -> str:
         """建立預覽 Session，返回 session_id"""
         try:
             validate_project_path(project_path)
             
-            # 清理過期 Sessions
-            current_time = time.time()
-            expired = [sid for sid, data in PREVIEW_SESSIONS.items() 
-                      if current_time - data['created_at'] > SESSION_TTL]
-            for sid in expired:
-                del PREVIEW_SESSIONS[sid]
-            
-            # 產生新 Session
-            session_id = str(uuid.uuid4())
-            PREVIEW_SESSIONS[session_id] = {
-                "path": project_path,
-                "created_at": current_time
-            }
-            logger.info(f"建立預覽 Session: {session_id} -> {project_path}")
+            # 同一專案沿用既有 Session (含伺服器重啟前的記錄)
+            session_id = preview_sessions.get_or_create(project_path)
             return session_id
             
         except ValueError as e:
             logger.warning(f"建立預覽失敗 (路徑無效): {e}")
             raise HTTPException(status_code=400, detail=str(e))
 
-    def get_file_response(self, session_id: str, file_path: str):
-        """取得 Session 對應專案的檔案"""
-        session = PREVIEW_SESSIONS.get(session_id)
+    def get_file_response(self, session_id: str, file_path: str, request_headers=None):
+        """
+        取得 Session 對應專案的檔案
+        request_headers: 用於 If-None-Match / If-Modified-Since 條件式請求，符合時回傳 304
+        """
+        session = preview_sessions.get(session_id)
         if not session:
             logger.warning(f"存取無效 Session: {session_id}")
             raise HTTPException(status_code=404, detail="Session expired or invalid")
             
-        project_root = session['path']
-        
-        # 安全驗證 relative path
-        try:
-            validate_file_path(file_path)
-        except ValueError as e:
-            logger.warning(f"非法檔案路徑請求: {file_path} ({e})")
-            raise HTTPException(status_code=403, detail="Invalid file path")
-            
-        # 組合並檢查最終路徑
-        full_path = os.path.join(project_root, file_path)
-        resolved_path = os.path.realpath(full_path)
-        resolved_root = os.path.realpath(project_root)
-        
-        if not resolved_path.startswith(resolved_root):
-             logger.warning(f"路徑逃逸攔截: {full_path}")
-             raise HTTPException(status_code=403, detail="Access denied")
+        # 安全驗證 relative path 並檢查最終路徑
+        full_path = self._resolve_path(session['path'], file_path)
              
-        if not os.path.exists(full_path):
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
             # UX-01: 若請求的是 index.html 但檔案不存在，返回引導頁面
             if file_path.endswith("index.html"):
-                 return HTMLResponse(content=WELCOME_HTML, status_code=200)
+                 headers = validator_headers(WELCOME_ETAG)
+                 if is_not_modified(request_headers, WELCOME_ETAG):
+                     return not_modified_response(headers)
+                 return HTMLResponse(content=WELCOME_HTML, status_code=200, headers=headers)
 
             raise HTTPException(status_code=404, detail="File not found")
             
-        if not os.path.isfile(full_path):
+        if not stat.S_ISREG(st.st_mode):
              raise HTTPException(status_code=404, detail="Not a file")
 
-        # VIZ-01: HTML 檔案注入視覺化編輯器腳本
+        encoding = negotiate_encoding(request_headers.get("accept-encoding")) if request_headers else None
+        stat_key = (full_path, st.st_mtime_ns, st.st_size)
+
+        # VIZ-01: HTML 檔案注入視覺化編輯器腳本 (依 mtime/size 快取注入結果)
         if full_path.lower().endswith('.html'):
             try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # 注入腳本 (簡單附加在 body 結束前)
-                injection = f'<script>{EDITOR_JS}</script>'
-                if '</body>' in content:
-                    content = content.replace('</body>', injection + '</body>', 1)
-                else:
-                    content += injection
-                    
-                return HTMLResponse(content=content)
+                content, etag = _get_injected_html(full_path, st)
+                return _body_response(lambda: content, len(content), "text/html; charset=utf-8", etag,
+                                      st.st_mtime, stat_key + ("injected",), encoding, request_headers)
             except Exception as e:
                 logger.error(f"Failed to inject editor script: {e}")
                 # Fallback to normal file response
-                return FileResponse(full_path)
 
-        return FileResponse(full_path)
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        compressible = is_compressible(media_type)
+        etag = stat_etag(st)
+
+        # Range 請求 (影音、大型資料檔)：回傳未壓縮的部分內容 206 / 416
+        range_header = request_headers.get("range") if request_headers else None
+        if range_header and if_range_matches(request_headers, etag, st.st_mtime):
+            headers = validator_headers(etag, st.st_mtime)
+            try:
+                ranges = parse_range_header(range_header, st.st_size)
+            except RangeNotSatisfiable:
+                return range_not_satisfiable_response(st.st_size, headers)
+            if ranges:
+                return RangeFileResponse(full_path, st, ranges, media_type, headers)
+
+        if encoding and compressible:
+            # 優先使用預先壓縮的旁車檔案 (file.br / file.gz)
+            sidecar = find_sidecar(full_path, st, encoding)
+            if sidecar:
+                sidecar_path, sidecar_st = sidecar
+                sidecar_etag = encoded_etag(stat_etag(sidecar_st), encoding)
+                headers = validator_headers(sidecar_etag, st.st_mtime)
+                headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+                if is_not_modified(request_headers, sidecar_etag, st.st_mtime):
+                    return not_modified_response(headers)
+                return FileResponse(sidecar_path, stat_result=sidecar_st, media_type=media_type, headers=headers)
+
+            # 即時壓縮並依檔案 stat 快取
+            if MIN_COMPRESS_SIZE <= st.st_size <= MAX_COMPRESS_SIZE:
+                return _body_response(lambda: _read_bytes(full_path), st.st_size, media_type, etag,
+                                      st.st_mtime, stat_key, encoding, request_headers)
+
+        headers = validator_headers(etag, st.st_mtime)
+        if compressible:
+            headers["Vary"] = "Accept-Encoding"
+        if is_not_modified(request_headers, etag, st.st_mtime):
+            return not_modified_response(headers)
+        return RangeFileResponse(full_path, st, None, media_type, headers)
@@ -0,0 +1,164 @@
+import os
+import asyncio
+import json
+from typing import Dict, Set
+from utils.logger import server_logger as logger
+
+# inotify/FSEvents/ReadDirectoryChangesW 監看 (選用)，未安裝時改用輪詢
+try:
+    from watchfiles import awatch
+    WATCHFILES_AVAILABLE = True
+except ImportError:
+    WATCHFILES_AVAILABLE = False
+
+POLL_INTERVAL = 0.5  # 輪詢模式的掃描間隔 (秒)
+DEBOUNCE = 0.05      # 合併短時間內的多次變更
+
+# 不需觸發重新整理的目錄與檔案
+IGNORED_DIRS = {".git", "node_modules", "__pycache__", "_sim_temp", "_sim_matrix", "screenshots", ".vscode"}
+# 以此開頭的目錄也略過 (例如 _sim_matrix_ab12cd 這類暫存工作區)
+IGNORED_DIR_PREFIXES = ("_sim_temp", "_sim_matrix")
+IGNORED_SUFFIXES = (".db", ".db-journal", ".db-wal", ".db-shm", ".pyc", ".swp", ".cs-tmp", "~")
+
+
+def _is_ignored_dir(name: str) -> bool:
+    return name in IGNORED_DIRS or name.startswith(IGNORED_DIR_PREFIXES)
+
+
+def _is_ignored(rel_path: str) -> bool:
+    parts = rel_path.replace("\\", "/").split("/")
+    if any(_is_ignored_dir(p) for p in parts[:-1]):
+        return True
+    return parts[-1].endswith(IGNORED_SUFFIXES)
+
+
+def _scan(root: str) -> Dict[str, int]:
+    """輪詢模式：記錄所有檔案的 mtime_ns"""
+    snapshot = {}
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not _is_ignored_dir(entry.name):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        try:
+                            snapshot[entry.path] = entry.stat().st_mtime_ns
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+    return snapshot
+
+
+class ProjectWatcher:
+    """
+    監看單一專案目錄，將變更的相對路徑廣播給所有訂閱者 (asyncio.Queue)。
+    第一個訂閱者加入時啟動，最後一個離開時停止。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self._task = None
+        self._stop = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=64)
+        self.subscribers.add(queue)
+        if self._task is None:
+            self._stop = asyncio.Event()
+            runner = self._run_watchfiles if WATCHFILES_AVAILABLE else self._run_polling
+            self._task = asyncio.create_task(runner())
+            logger.info(f"開始監看預覽目錄 ({'watchfiles' if WATCHFILES_AVAILABLE else 'polling'}): {self.root}")
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._task is not None:
+            self._stop.set()
+            self._task = None
+            logger.info(f"停止監看預覽目錄: {self.root}")
+
+    def _broadcast(self, changed: Set[str]):
+        # 目錄本身的變更不需通知，其下的檔案變更會另外回報
+        rel_paths = sorted(
+            p for p in (os.path.relpath(c, self.root).replace("\\", "/")
+                        for c in changed if not os.path.isdir(c))
+            if not _is_ignored(p)
+        )
+        if not rel_paths:
+            return
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(rel_paths)
+            except asyncio.QueueFull:
+                # 訂閱端消化太慢時丟棄最舊的通知
+                queue.get_nowait()
+                queue.put_nowait(rel_paths)
+
+    async def _run_watchfiles(self):
+        try:
+            async for changes in awatch(self.root, stop_event=self._stop, debounce=int(DEBOUNCE * 1000)):
+                self._broadcast({path for _, path in changes})
+        except Exception as e:
+            logger.error(f"檔案監看失敗: {e}")
+
+    async def _run_polling(self):
+        previous = await asyncio.to_thread(_scan, self.root)
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=POLL_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+            current = await asyncio.to_thread(_scan, self.root)
+            changed = {p for p, m in current.items() if previous.get(p) != m}
+            changed.update(p for p in previous if p not in current)
+            previous = current
+            if changed:
+                self._broadcast(changed)
+
+
+class PreviewWatchService:
+    """依專案路徑共用 ProjectWatcher，提供 SSE 事件串流"""
+
+    def __init__(self):
+        self.watchers: Dict[str, ProjectWatcher] = {}
+
+    def _watcher(self, project_path: str) -> ProjectWatcher:
+        key = os.path.realpath(project_path)
+        watcher = self.watchers.get(key)
+        if watcher is None:
+            watcher = ProjectWatcher(key)
+            self.watchers[key] = watcher
+        return watcher
+
+    async def event_stream(self, project_path: str, is_disconnected, keepalive: float = 15.0):
+        """
+        Server-Sent Events 產生器：
+        event: change / data: {"paths": [...]}；閒置時送出註解行維持連線
+        """
+        watcher = self._watcher(project_path)
+        queue = watcher.subscribe()
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    paths = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps({'paths': paths})}\n\n"
+        finally:
+            watcher.unsubscribe(queue)
+            if not watcher.subscribers:
+                self.watchers.pop(watcher.root, None)
+
+
+preview_watch_service = PreviewWatchService()
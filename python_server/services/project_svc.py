@@ -1,21 +1,148 @@
 import os
+import json
+import fnmatch
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from utils.security import validate_project_name
+from utils.file_clone import clone_file
+from utils.template_engine import get_template
 from utils.logger import server_logger as logger
 
+MAX_COPY_WORKERS = 8
+# 模板中不複製的產物 (例如 compileall 產生的快取)
+IGNORED_TEMPLATE_DIRS = {"__pycache__", ".git"}
+IGNORED_TEMPLATE_SUFFIXES = (".pyc", ".pyo")
+
+
+def _walk_files(root: str):
+    """回傳 (目錄相對路徑串列, 檔案相對路徑串列)，路徑一律使用 /"""
+    dirs, files = [], []
+    for current, subdirs, filenames in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if d not in IGNORED_TEMPLATE_DIRS)
+        rel = os.path.relpath(current, root).replace("\\", "/")
+        if rel != ".":
+            dirs.append(rel)
+        for filename in sorted(filenames):
+            if filename.endswith(IGNORED_TEMPLATE_SUFFIXES):
+                continue
+            files.append(filename if rel == "." else f"{rel}/{filename}")
+    return dirs, files
+
+
+class TemplateRegistry:
+    """
+    templates/<id>/template.json + templates/<id>/files/ 的記憶體快取
+    依 templates 目錄、template.json 與 files 目錄的 mtime 判斷是否需要重新載入
+    """
+
+    def __init__(self, templates_dir: str):
+        self.templates_dir = templates_dir
+        self._dir_mtime = None
+        # template_id -> (stat key, template dict)
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _stat_key(self, template_id: str):
+        base = os.path.join(self.templates_dir, template_id)
+        manifest_st = os.stat(os.path.join(base, "template.json"))
+        try:
+            files_mtime = os.stat(os.path.join(base, "files")).st_mtime_ns
+        except OSError:
+            files_mtime = None
+        return (manifest_st.st_mtime_ns, manifest_st.st_size, files_mtime)
+
+    def _load(self, template_id: str) -> Optional[Dict[str, Any]]:
+        base = os.path.join(self.templates_dir, template_id)
+        try:
+            with open(os.path.join(base, "template.json"), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if not isinstance(manifest, dict) or not manifest.get("name"):
+                raise ValueError("template.json 缺少 name")
+        except Exception as e:
+            logger.error(f"載入模板 {template_id} 失敗: {e}")
+            return None
+
+        files_root = os.path.join(base, "files")
+        dirs, files = _walk_files(files_root) if os.path.isdir(files_root) else ([], [])
+        render = manifest.get("render", [])
+        shared = manifest.get("shared", [])
+        return {
+            "id": template_id,
+            "name": manifest["name"],
+            "description": manifest.get("description", ""),
+            "order": manifest.get("order", 100),
+            "root": files_root,
+            "dirs": dirs,
+            # (相對路徑, 是否以範本引擎渲染, 是否為唯讀共用檔案)
+            "files": [
+                (rel, any(fnmatch.fnmatch(rel, pat) for pat in render),
+                 any(fnmatch.fnmatch(rel, pat) for pat in shared))
+                for rel in files
+            ],
+        }
+
+    def _refresh(self):
+        try:
+            dir_mtime = os.stat(self.templates_dir).st_mtime_ns
+        except OSError:
+            self._dir_mtime, self._entries = None, {}
+            return
+        if dir_mtime != self._dir_mtime:
+            ids = sorted(
+                entry.name for entry in os.scandir(self.templates_dir)
+                if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "template.json"))
+            )
+            self._dir_mtime = dir_mtime
+        else:
+            ids = list(self._entries)
+
+        entries = {}
+        for template_id in ids:
+            try:
+                key = self._stat_key(template_id)
+            except OSError:
+                continue
+            cached = self._entries.get(template_id)
+            entries[template_id] = cached if cached and cached[0] == key else (key, self._load(template_id))
+        self._entries = entries
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            templates = [t for _, t in self._entries.values() if t is not None]
+        templates.sort(key=lambda t: (t["order"], t["id"]))
+        return [{"id": t["id"], "name": t["name"], "description": t["description"]} for t in templates]
+
+    def get(self, template_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(template_id)
+        return entry[1] if entry else None
+
+
+_REGISTRIES: Dict[str, TemplateRegistry] = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_template_registry(templates_dir: str) -> TemplateRegistry:
+    key = os.path.realpath(templates_dir)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(key)
+        if registry is None:
+            registry = _REGISTRIES[key] = TemplateRegistry(key)
+        return registry
+
 
 class ProjectService:
     def __init__(self, server_root: str):
         self.server_root = server_root
         self.templates_dir = os.path.join(server_root, "templates")
+        self.registry = get_template_registry(self.templates_dir)
 
     def list_templates(self) -> list:
-        return [
-            {"id": "empty", "name": "空白專案", "description": "一個乾淨的起點"},
-            {"id": "webapp", "name": "Web App", "description": "含 HTML/CSS/JS 的前端專案"},
-            {"id": "python", "name": "Python Starter", "description": "基本 Python 專案結構"}
-        ]
+        return self.registry.list()
 
     def create_project(self, name: str, path: str, template_id: str, skills: List[str] = None) -> dict:
         """建立專案（含路徑驗證）"""
@@ -46,39 +173,68 @@ class ProjectService:
             return {"status": "error", "message": f"建立目錄失敗: {e}"}
 
         # 套用模板
-        self._apply_template(full_path, template_id)
+        try:
+            self._apply_template(full_path, template_id, {"project_name": name})
+        except Exception as e:
+            logger.error(f"套用模板 {template_id} 失敗: {e}")
+            shutil.rmtree(full_path, ignore_errors=True)
+            return {"status": "error", "message": f"套用模板失敗: {e}"}
 
-        # 安裝 skills
+        # 安裝 skills (整批安裝，失敗時不留下半套檔案)
+        warnings = []
         if skills:
             from services.skill_svc import SkillService
             skill_svc = SkillService(self.server_root)
-            for skill_id in skills:
-                try:
-                    skill_svc.install_skill(skill_id, full_path)
-                except Exception as e:
-                    logger.warning(f"安裝技能 {skill_id} 失敗: {e}")
+            result = skill_svc.install_skills(skills, full_path)
+            if result.get("status") == "error":
+                logger.warning(f"安裝技能失敗: {result.get('message')}")
+                warnings.append(f"技能未安裝: {result.get('message')}")
+            else:
+                warnings.extend(result.get("warnings", []))
 
         return {
             "status": "success",
             "message": f"專案 '{name}' 建立完成！",
-            "path": full_path
+            "path": full_path,
+            "warnings": warnings
         }
 
-    def _apply_template(self, project_path: str, template_id: str):
-        if template_id == "webapp":
-            os.makedirs(os.path.join(project_path, "css"), exist_ok=True)
-            os.makedirs(os.path.join(project_path, "js"), exist_ok=True)
-            with open(os.path.join(project_path, "index.html"), 'w', encoding='utf-8') as f:
-                f.write("<!DOCTYPE html>\n<html>\n<head>\n  <title>New Project</title>\n  <link rel='stylesheet' href='css/style.css'>\n</head>\n<body>\n  <h1>Hello, CodeSynth!</h1>\n  <script src='js/app.js'></script>\n</body>\n</html>")
-            with open(os.path.join(project_path, "css", "style.css"), 'w', encoding='utf-8') as f:
-                f.write("body { font-family: sans-serif; margin: 2rem; }")
-            with open(os.path.join(project_path, "js", "app.js"), 'w', encoding='utf-8') as f:
-                f.write("console.log('CodeSynth Project Initialized');")
-
-        elif template_id == "python":
-            with open(os.path.join(project_path, "main.py"), 'w', encoding='utf-8') as f:
-                f.write("# CodeSynth Python Project\n\ndef main():\n    print('Hello, CodeSynth!')\n\nif __name__ == '__main__':\n    main()\n")
-            with open(os.path.join(project_path, "requirements.txt"), 'w', encoding='utf-8') as f:
-                f.write("# Add your dependencies here\n")
-
-        # empty template: 不做任何事
+    def _apply_template(self, project_path: str, template_id: str, context: Dict[str, Any] = None):
+        """
+        將模板檔案建立到專案：先建立目錄，再平行建立檔案
+        render 清單內的檔案以範本引擎渲染，其餘以 reflink / 複製 (shared 檔案可用 hardlink)
+        """
+        template = self.registry.get(template_id)
+        if template is None:
+            logger.warning(f"找不到模板 {template_id}，建立空白專案")
+            return
+        context = context or {}
+        root = template["root"]
+
+        for rel_dir in template["dirs"]:
+            os.makedirs(os.path.join(project_path, rel_dir), exist_ok=True)
+
+        def create(item):
+            rel, render, shared = item
+            src = os.path.join(root, rel)
+            dst = os.path.join(project_path, rel)
+            if not render:
+                return clone_file(src, dst, shared)
+            st = os.stat(src)
+
+            def load():
+                with open(src, 'r', encoding='utf-8') as f:
+                    return f.read()
+
+            content = get_template((f"template:{template_id}", rel, st.st_mtime_ns, st.st_size), load).render(context)
+            with open(dst, 'w', encoding='utf-8') as f:
+                f.write(content)
+            return "render"
+
+        files = template["files"]
+        if not files:
+            return
+        with ThreadPoolExecutor(max_workers=min(MAX_COPY_WORKERS, len(files))) as pool:
+            methods = list(pool.map(create, files))
+        summary = {m: methods.count(m) for m in set(methods)}
+        logger.info(f"套用模板 {template_id}: {len(files)} 個檔案 {summary}")
@@ -1,6 +1,12 @@
 import os
+import re
 import time
-from database.connection import get_db
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+from database.connection import get_db, history_fts_available
 
 def get_dashboard_data_logic(project_path: str) -> dict:
     """
@@ -145,7 +151,7 @@ def get_screenshots_logic(project_path: str, version_id: int) -> dict:
     conn, _ = get_db(project_path)
     try:
         c = conn.cursor()
-        c.execute("""SELECT screenshot_path, error_message, test_status, timestamp 
+        c.execute("""SELECT screenshot_path, error_message, test_status, timestamp, thumbnail_path 
                      FROM screenshots WHERE version_id=?
                      ORDER BY timestamp DESC""", (version_id,))
         rows = c.fetchall()
@@ -155,8 +161,150 @@ def get_screenshots_logic(project_path: str, version_id: int) -> dict:
                 "image_path": r[0],
                 "error": r[1],
                 "status": r[2],
-                "timestamp": r[3]
+                "timestamp": r[3],
+                "thumbnail_path": r[4]
             })
         return {"screenshots": screenshots}
     finally:
         conn.close()
+
+# 搜尋候選版本掃描上限，避免正則在大型歷史中拖慢互動
+SEARCH_MAX_SCAN = 20000
+SEARCH_MAX_LIMIT = 500        # 每頁最多回傳的版本數
+SEARCH_MAX_MATCHES = 100      # 每個版本最多回傳的比對位置
+SEARCH_PREVIEW_CHARS = 120
+
+
+def _required_literals(pattern: str) -> list:
+    """
+    從正則表示式取出「必定出現」的字面字串 (頂層連續的 LITERAL)，
+    作為 FTS 預篩條件；無法判斷時回傳空串列 (改為全表掃描)
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+    runs, current = [], []
+    for op, arg in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(arg))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return [r for r in runs if len(r) >= 3]
+
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _compile_search(query: str, mode: str, case_sensitive: bool):
+    flags = 0 if case_sensitive else re.IGNORECASE
+    if mode == "literal":
+        return re.compile(re.escape(query), flags), [query]
+    if mode == "prefix":
+        # 單字開頭比對 (例如 "get_" 找到 get_db / get_ai_log)
+        return re.compile(r"(?<!\w)" + re.escape(query), flags), [query]
+    if mode == "regex":
+        try:
+            return re.compile(query, flags | re.MULTILINE), _required_literals(query)
+        except re.error as e:
+            raise ValueError(f"正則表示式錯誤: {e}")
+    raise ValueError(f"不支援的搜尋模式: {mode}")
+
+
+def search_history_logic(project_path: str, query: str, mode: str = "literal",
+                         file_path: str = None, feature_tag: str = None, status: str = None,
+                         since: float = None, until: float = None, case_sensitive: bool = False,
+                         before_id: int = None, limit: int = 50, max_matches: int = 10) -> dict:
+    """
+    搜尋所有快照版本的內容，回傳符合的版本與比對位置 (最新的優先)
+    - 以 history_fts (trigram) 預篩候選版本，再以 Python 正則確認並計算 offset
+    - file_path 支援 glob (例如 "src/*.py")；before_id 用於分頁
+    """
+    if not query:
+        raise ValueError("query 不可為空")
+    if not os.path.exists(os.path.join(project_path, "codesynth_history.db")):
+        return {"results": [], "scanned": 0, "truncated": False, "next_before_id": None}
+    pattern, literals = _compile_search(query, mode, case_sensitive)
+
+    conn, _ = get_db(project_path)
+    try:
+        c = conn.cursor()
+        filters, params = [], []
+        # trigram 只能比對 3 個字元以上的片段，較短的查詢直接掃描
+        literals = [lit for lit in literals if len(lit) >= 3]
+        if literals and history_fts_available(c):
+            filters.append("h.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            params.append(" AND ".join(_fts_phrase(lit) for lit in literals))
+        if file_path:
+            filters.append("h.file_path GLOB ?")
+            params.append(file_path)
+        if feature_tag:
+            filters.append("h.feature_tag = ?")
+            params.append(feature_tag)
+        if status:
+            filters.append("COALESCE(h.status, 'pending') = ?")
+            params.append(status)
+        if since is not None:
+            filters.append("h.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            filters.append("h.timestamp <= ?")
+            params.append(until)
+        if before_id is not None:
+            filters.append("h.id < ?")
+            params.append(before_id)
+        where = " WHERE " + " AND ".join(filters) if filters else ""
+
+        c.execute(f"""SELECT h.id, h.file_path, h.timestamp, h.trigger, h.status, h.feature_tag, h.content
+                      FROM history h{where} ORDER BY h.id DESC""", params)
+
+        results, scanned, truncated, last_id = [], 0, False, None
+        for row in c:
+            scanned += 1
+            last_id = row[0]
+            content = row[6] or ""
+            matches = []
+            for m in pattern.finditer(content):
+                if len(matches) >= max_matches:
+                    break
+                line_start = content.rfind("\n", 0, m.start()) + 1
+                line_end = content.find("\n", m.end())
+                line_end = len(content) if line_end == -1 else line_end
+                matches.append({
+                    "offset": m.start(),
+                    "length": m.end() - m.start(),
+                    "line": content.count("\n", 0, m.start()) + 1,
+                    "column": m.start() - line_start,
+                    "preview": content[line_start:line_end][:SEARCH_PREVIEW_CHARS],
+                })
+            if matches:
+                results.append({
+                    "version_id": row[0],
+                    "file_path": row[1],
+                    "timestamp": row[2],
+                    "trigger": row[3],
+                    "status": row[4] if row[4] else "pending",
+                    "feature_tag": row[5],
+                    "matches": matches,
+                })
+                if len(results) >= limit:
+                    truncated = True
+                    break
+            if scanned >= SEARCH_MAX_SCAN:
+                truncated = True
+                break
+
+        return {
+            "results": results,
+            "scanned": scanned,
+            "truncated": truncated,
+            # 繼續搜尋時傳入 before_id
+            "next_before_id": last_id if truncated else None,
+        }
+    finally:
+        conn.close()
@@ -0,0 +1,186 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from utils.logger import server_logger as logger
+from services.memory_manager import memory_manager
+from services.interaction_log_svc import LOG_NAME_RE, iter_log_files, log_key, log_size, read_log
+
+# 互動記錄格式 (MemoryManager.log_interaction)：
+# \n\n## [HH:MM:SS] User\n{query}\n\n## [HH:MM:SS] Assistant\n{response}\n
+_ENTRY_RE = re.compile(r"\n\n## \[(\d\d:\d\d:\d\d)\] User\n(.*?)\n\n## \[\d\d:\d\d:\d\d\] Assistant\n", re.S)
+_TERM_RE = re.compile(r"\w+", re.U)
+
+SNAPSHOT_INDEX_LIMIT = 64 * 1024  # 快照只索引開頭部分
+SNIPPET_TOKENS = 48               # trigram 的 token 約等於一個字元
+
+
+def _fts_tokenizer():
+    """回傳可用的 FTS5 tokenizer；trigram 可做子字串與中文搜尋，沒有 FTS5 時回傳 None"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE t USING fts5(x, tokenize='{tokenizer}')")
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        return None
+    finally:
+        conn.close()
+
+
+class RetrievalIndex:
+    """
+    記憶與專案歷程的全文索引，存於 memory 根目錄的 .index/retrieval.db。
+    有 FTS5 時以 bm25 排序，否則退回 LIKE 搜尋。
+    互動記錄依每個 log 檔已索引的位元組位置增量加入。
+    """
+
+    def __init__(self, root_path: Path):
+        self.index_dir = Path(root_path) / ".index"
+        self.db_path = self.index_dir / "retrieval.db"
+        self.tokenizer = _fts_tokenizer()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # 索引可重建，不需要進入 memory 的 git 同步
+        gitignore = self.index_dir / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text("*\n", encoding="utf-8")
+
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if self.tokenizer:
+            conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+                                content, kind UNINDEXED, source UNINDEXED, ref UNINDEXED,
+                                project UNINDEXED, timestamp UNINDEXED,
+                                tokenize='{self.tokenizer}')""")
+        else:
+            conn.execute("""CREATE TABLE IF NOT EXISTS docs
+                            (content TEXT, kind TEXT, source TEXT, ref TEXT,
+                             project TEXT, timestamp REAL)""")
+        # 每個 log 檔已索引到的位元組位置
+        conn.execute("""CREATE TABLE IF NOT EXISTS indexed_files
+                        (path TEXT PRIMARY KEY, offset INTEGER)""")
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def add(self, kind: str, content: str, source: str = "", ref="", project: str = "",
+            timestamp: float = None):
+        self.add_many([(kind, content, source, ref)], project, timestamp)
+
+    def add_many(self, docs: list, project: str = "", timestamp: float = None):
+        """docs: [(kind, content, source, ref)]，同一個 transaction 寫入"""
+        rows = [
+            (content, kind, source, str(ref), project or "", timestamp or datetime.now().timestamp())
+            for kind, content, source, ref in docs if content
+        ]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.executemany(
+                    "INSERT INTO docs (content, kind, source, ref, project, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"寫入檢索索引失敗: {e}")
+
+    def index_log_file(self, log_file: Path):
+        """把 log 分段中尚未索引的互動加入索引 (由上次的位元組位置接續讀取，支援 .gz)"""
+        match = LOG_NAME_RE.match(log_file.name)
+        if not match:
+            return
+        name = log_key(log_file)
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT offset FROM indexed_files WHERE path = ?", (name,)).fetchone()
+                offset = row[0] if row else 0
+                size = log_size(log_file)
+                if size <= offset:
+                    return
+                chunk = read_log(log_file, offset, size).decode("utf-8", errors="replace")
+
+                day = match.group(1)
+                entries = list(_ENTRY_RE.finditer(chunk))
+                for i, m in enumerate(entries):
+                    end = entries[i + 1].start() if i + 1 < len(entries) else len(chunk)
+                    query = m.group(2).strip()
+                    response = chunk[m.end():end].strip()
+                    ts = datetime.strptime(f"{day} {m.group(1)}", "%Y-%m-%d %H:%M:%S").timestamp()
+                    conn.execute(
+                        "INSERT INTO docs (content, kind, source, ref, project, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                        (f"{query}\n{response}", "interaction", name, m.group(1), "", ts),
+                    )
+                conn.execute("INSERT OR REPLACE INTO indexed_files (path, offset) VALUES (?, ?)",
+                             (name, size))
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"索引互動記錄失敗 ({log_file.name}): {e}")
+
+    def sync_logs(self, logs_dir: Path):
+        """補上尚未索引的 log 檔 (例如啟用索引前就存在的記錄)"""
+        for log_file in iter_log_files(logs_dir):
+            self.index_log_file(log_file)
+
+    def _match_query(self, query: str):
+        """將自然語言查詢轉為 FTS5 OR 查詢；trigram 需要至少 3 個字元的詞"""
+        min_len = 3 if self.tokenizer == "trigram" else 1
+        terms = [t for t in _TERM_RE.findall(query) if len(t) >= min_len]
+        if not terms:
+            return None
+        return " OR ".join('"' + t.replace('"', '""') + '"' for t in dict.fromkeys(terms))
+
+    def search(self, query: str, kinds=None, project: str = None, limit: int = 10) -> list:
+        query = (query or "").strip()
+        if not query:
+            return []
+        filters, params = [], []
+        if kinds:
+            filters.append(f"kind IN ({', '.join('?' * len(kinds))})")
+            params.extend(kinds)
+        if project:
+            filters.append("(project = ? OR project = '')")
+            params.append(project)
+        where = "".join(f" AND {f}" for f in filters)
+
+        with self._lock:
+            conn = self._connect()
+            match = self._match_query(query) if self.tokenizer else None
+            if match:
+                sql = (f"SELECT kind, source, ref, project, timestamp, "
+                       f"snippet(docs, 0, '[', ']', '…', {SNIPPET_TOKENS}), bm25(docs) "
+                       f"FROM docs WHERE docs MATCH ?{where} ORDER BY bm25(docs) LIMIT ?")
+                rows = conn.execute(sql, [match] + params + [limit]).fetchall()
+            else:
+                # 沒有 FTS5 或查詢太短：子字串比對，最新的優先
+                escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                sql = (f"SELECT kind, source, ref, project, timestamp, substr(content, 1, 200), 0 "
+                       f"FROM docs WHERE content LIKE ? ESCAPE '\\'{where} ORDER BY timestamp DESC LIMIT ?")
+                rows = conn.execute(sql, [f"%{escaped}%"] + params + [limit]).fetchall()
+
+        return [
+            {"kind": r[0], "source": r[1], "ref": r[2], "project": r[3] or None,
+             "timestamp": r[4], "snippet": r[5], "score": r[6]}
+            for r in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+retrieval_index = RetrievalIndex(memory_manager.root_path)
@@ -4,7 +4,10 @@ import sys
 import platform
 import subprocess
 from database.connection import get_db
-from utils.screenshot import take_screenshot
+from utils.screenshot import capture_screenshot_async, get_display_env
+from utils.process_limits import (
+    resolve_limits, popen_limited, communicate_with_usage, describe_limit_violation
+)
 from utils.logger import server_logger as logger
 from .ai_svc import log_ai_event
 
@@ -13,12 +16,13 @@ def start_simulation_logic(data: dict) -> dict:
     執行測試模擬：
     1. 從資料庫提取選定版本的程式碼
     2. 建立臨時執行環境 _sim_temp
-    3. 執行 main.py
-    4. 返回執行結果
+    3. 以資源限制 (CPU 秒數、記憶體、開啟檔案數、行程數) 執行 main.py
+    4. 返回執行結果與資源使用量
     """
     try:
         project_path = data.get('project_path')
         selection = data.get('selection', {})  # {file_path: version_id}
+        limit_overrides = data.get('limits') or {}
         
         print(f"[*] Simulation Requested for Project: {project_path}")
         print(f"   Selection: {selection}")
@@ -153,20 +157,25 @@ def start_simulation_logic(data: dict) -> dict:
                 except Exception as e:
                     logger.warning(f"複製 {launcher_name} 失敗: {e}")
 
+        # 無顯示器主機使用虛擬顯示器時，讓模擬程式在其中繪製以便截圖
+        sim_env = get_display_env()
+
         try:
             # 決定執行模式
             if is_streamlit and os.path.exists(launcher_path):
                 print("   [desktop] Launching via Desktop_Launcher.py")
                 
                 # 1. 背景啟動 Streamlit
+                # 互動式視窗不設 CPU 秒數上限，其餘限制照常套用
+                limits = resolve_limits(limit_overrides, allow_cpu=False)
                 streamlit_cmd = [sys.executable, "-m", "streamlit", "run", main_file, "--server.headless=true", "--server.port=8501"]
-                server_proc = subprocess.Popen(streamlit_cmd, cwd=sim_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                server_proc = popen_limited(streamlit_cmd, limits, cwd=sim_dir, env=sim_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                 
                 # 2. 啟動 Desktop Launcher (會等待直到視窗關閉)
                 launcher_cmd = [sys.executable, launcher_path]
-                process = subprocess.Popen(launcher_cmd, cwd=sim_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                process = popen_limited(launcher_cmd, limits, cwd=sim_dir, env=sim_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                 
-                stdout_output, stderr_output = process.communicate() # Blocking wait
+                stdout_output, stderr_output, usage = communicate_with_usage(process) # Blocking wait
                 
                 # 3. 清理 Streamlit
                 server_proc.kill()
@@ -183,7 +192,8 @@ def start_simulation_logic(data: dict) -> dict:
                     error_message="",
                     screenshot_path="",
                     ai_summary=f"Desktop App 啟動並執行完畢。",
-                    next_action="無"
+                    next_action="無",
+                    resource_usage=usage
                 )
 
                 # Desktop 模式執行結束後，不需要回傳 app_url 給前端開啟瀏覽器
@@ -193,7 +203,9 @@ def start_simulation_logic(data: dict) -> dict:
                     "output": stdout,
                     "error": stderr if stderr else "",
                     "exit_code": process.returncode,
-                    "files": files_written
+                    "files": files_written,
+                    "resource_usage": usage,
+                    "limits": limits
                 }
 
             else:
@@ -203,33 +215,53 @@ def start_simulation_logic(data: dict) -> dict:
                     print(f"   [~] Streamlit app detected. Using 'streamlit run'...")
                     cmd = [sys.executable, "-m", "streamlit", "run", main_file, "--server.headless=true", "--browser.serverAddress=localhost"]
 
-                process = subprocess.Popen(
+                limits = resolve_limits(limit_overrides, allow_cpu=not is_streamlit)
+                process = popen_limited(
                     cmd,
+                    limits,
                     cwd=sim_dir,
+                    env=sim_env,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
                     text=False 
                 )
                 
                 wait_time = 5 if is_streamlit else 30
-                stdout_output, stderr_output = process.communicate(timeout=wait_time)
+                # Streamlit 逾時代表伺服器持續執行 (預期行為)，不終止行程
+                stdout_output, stderr_output, usage = communicate_with_usage(
+                    process, timeout=wait_time, kill_on_timeout=not is_streamlit
+                )
                 stdout = stdout_output.decode('utf-8', errors='ignore')
                 stderr = stderr_output.decode('utf-8', errors='ignore')
                 
                 if process.returncode == 0:
+                    log_ai_event(
+                        project_path,
+                        what_happened="用戶執行測試成功",
+                        current_status="等待下一步指令",
+                        test_result="成功",
+                        ai_summary=f"測試執行成功，耗時 {usage.get('wall_time')} 秒。",
+                        next_action="無",
+                        resource_usage=usage
+                    )
                     return {
                         "status": "success",
                         "message": "執行成功",
                         "output": stdout,
                         "error": stderr if stderr else "",
                         "exit_code": 0,
-                        "files": files_written
+                        "files": files_written,
+                        "resource_usage": usage,
+                        "limits": limits
                     }
                 else:
                     error_msg = f"執行失敗 (Exit Code: {process.returncode})"
+                    violation = describe_limit_violation(process.returncode)
+                    if violation:
+                        error_msg += f"：{violation}"
                     
                     # ⭐ 測試失敗時自動截圖
-                    screenshot_path = take_screenshot(
+                    screenshot_path = capture_screenshot_async(
                         project_path,
                         version_id=main_version_id,
                         file_path='main.py',
@@ -247,7 +279,8 @@ def start_simulation_logic(data: dict) -> dict:
                         error_message=stderr or stdout or error_msg,
                         screenshot_path=screenshot_path,
                         ai_summary=f"測試執行失敗：{error_msg}。已自動截圖保存問題畫面。",
-                        next_action="建議查看錯誤訊息或截圖，修正代碼後重新測試"
+                        next_action="建議查看錯誤訊息或截圖，修正代碼後重新測試",
+                        resource_usage=usage
                     )
                     
                     return {
@@ -257,10 +290,12 @@ def start_simulation_logic(data: dict) -> dict:
                         "error": stderr,
                         "exit_code": process.returncode,
                         "files": files_written,
-                        "screenshot": screenshot_path  # 返回截圖路徑
+                        "screenshot": screenshot_path,  # 返回截圖路徑
+                        "resource_usage": usage,
+                        "limits": limits
                     }
         
-        except subprocess.TimeoutExpired:
+        except subprocess.TimeoutExpired as e:
             
             # If Streamlit, this is expected behavior (Server kept running)
             if is_streamlit:
@@ -272,14 +307,15 @@ def start_simulation_logic(data: dict) -> dict:
                     "app_url": "http://localhost:8501",
                     "error": "",
                     "exit_code": 0,
-                    "files": files_written
+                    "files": files_written,
+                    "limits": limits
                 }
 
-            process.kill()
+            # communicate_with_usage 已終止並回收行程
             error_msg = "執行逾時 (超過 30 秒)"
             
             # ⭐ 超時也截圖
-            screenshot_path = take_screenshot(
+            screenshot_path = capture_screenshot_async(
                 project_path,
                 version_id=main_version_id,
                 file_path='main.py',
@@ -291,16 +327,18 @@ def start_simulation_logic(data: dict) -> dict:
             return {
                 "status": "timeout",
                 "message": error_msg,
-                "output": "",
+                "output": (e.output or b"").decode('utf-8', errors='ignore'),
                 "error": "Process killed due to timeout",
                 "files": files_written,
-                "screenshot": screenshot_path
+                "screenshot": screenshot_path,
+                "resource_usage": getattr(e, "usage", None),
+                "limits": limits
             }
         except Exception as e:
             error_msg = f"執行過程發生錯誤: {str(e)}"
             
             # ⭐ 錯誤也截圖
-            screenshot_path = take_screenshot(
+            screenshot_path = capture_screenshot_async(
                 project_path,
                 version_id=main_version_id if main_version_id else 0,
                 file_path='main.py',
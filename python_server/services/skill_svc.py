@@ -1,112 +1,413 @@
 import os
+import copy
 import shutil
 import json
+import filecmp
 import logging
-from typing import List, Dict, Any
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from utils.template_engine import get_template, TemplateError
 
 # Configure logger
 logger = logging.getLogger("SkillService")
 
+INJECTION_POSITIONS = ("append", "prepend")
+MAX_IO_WORKERS = 8
+
+
+class SkillManifestError(ValueError):
+    """Raised when a skill.json does not describe an installable skill."""
+
+
+def validate_manifest(skill_path: str, manifest: Any) -> Dict[str, Any]:
+    """Checks a manifest's structure and source files; returns it unchanged when valid."""
+    if not isinstance(manifest, dict):
+        raise SkillManifestError("manifest must be a JSON object")
+    if not isinstance(manifest.get('name'), str) or not manifest['name'].strip():
+        raise SkillManifestError("'name' is required")
+
+    files = manifest.get('files', [])
+    if not isinstance(files, list):
+        raise SkillManifestError("'files' must be a list")
+    for i, file_def in enumerate(files):
+        if not isinstance(file_def, dict):
+            raise SkillManifestError(f"files[{i}] must be an object")
+        src_rel, dest_rel = file_def.get('source'), file_def.get('destination')
+        if not isinstance(src_rel, str) or not isinstance(dest_rel, str) or not src_rel or not dest_rel:
+            raise SkillManifestError(f"files[{i}] needs 'source' and 'destination'")
+        if _escapes(dest_rel):
+            raise SkillManifestError(f"files[{i}] destination escapes the project: {dest_rel}")
+        if not isinstance(file_def.get('render', True), bool):
+            raise SkillManifestError(f"files[{i}] 'render' must be true or false")
+        if not os.path.isfile(os.path.join(skill_path, src_rel)):
+            raise SkillManifestError(f"files[{i}] source not found: {src_rel}")
+
+    injections = manifest.get('injections', [])
+    if not isinstance(injections, list):
+        raise SkillManifestError("'injections' must be a list")
+    for i, inject in enumerate(injections):
+        if not isinstance(inject, dict):
+            raise SkillManifestError(f"injections[{i}] must be an object")
+        if not isinstance(inject.get('target'), str) or not isinstance(inject.get('content'), str):
+            raise SkillManifestError(f"injections[{i}] needs 'target' and 'content'")
+        if _escapes(inject['target']):
+            raise SkillManifestError(f"injections[{i}] target escapes the project: {inject['target']}")
+        if inject.get('position', 'append') not in INJECTION_POSITIONS:
+            raise SkillManifestError(f"injections[{i}] position must be one of {INJECTION_POSITIONS}")
+
+    params = manifest.get('params', {})
+    if not isinstance(params, dict) or not all(isinstance(spec, dict) for spec in params.values()):
+        raise SkillManifestError("'params' must map parameter names to objects")
+
+    return manifest
+
+
+def _escapes(rel_path: str) -> bool:
+    return os.path.isabs(rel_path) or os.path.normpath(rel_path).startswith('..')
+
+
+def _effective_params(manifest: Dict[str, Any], provided: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Manifest defaults overridden by the caller's values."""
+    params = {name: spec.get('default') for name, spec in manifest.get('params', {}).items()}
+    params.update({k: v for k, v in (provided or {}).items() if v is not None})
+    return params
+
+
+def _render_source(skill_id: str, src_file: str, params: Dict[str, Any]) -> str:
+    st = os.stat(src_file)
+
+    def load():
+        with open(src_file, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    template = get_template((skill_id, src_file, st.st_mtime_ns, st.st_size), load)
+    return template.render(params)
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _makedirs(path: str) -> List[str]:
+    """os.makedirs that reports which directories it created (outermost first)."""
+    created = []
+    current = path
+    while current and not os.path.isdir(current):
+        created.append(current)
+        current = os.path.dirname(current)
+    os.makedirs(path, exist_ok=True)
+    return list(reversed(created))
+
+
+class SkillInstallPlan:
+    """
+    Everything a set of skills will write, computed before the project is touched.
+    writes maps a project-relative path to either rendered text or a source file to copy.
+    """
+
+    def __init__(self, project_path: str):
+        self.project_path = project_path
+        self.skills: List[Dict[str, Any]] = []
+        # dest_rel -> {"skill": id, "source": path or None, "content": str or None}
+        self.writes: Dict[str, Dict[str, Any]] = {}
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+
+
+class SkillRegistry:
+    """
+    Process-wide cache of skill manifests for one skills directory.
+    The directory mtime tells us when skills are added or removed; each
+    manifest is re-read only when its own mtime/size changes.
+    """
+
+    def __init__(self, skills_dir: str):
+        self.skills_dir = skills_dir
+        self._dir_mtime: Optional[int] = None
+        # skill_id -> (manifest stat key, manifest or None, error or None)
+        self._entries: Dict[str, Tuple[Tuple[int, int], Optional[Dict[str, Any]], Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _scan_ids(self) -> List[str]:
+        ids = []
+        with os.scandir(self.skills_dir) as it:
+            for entry in it:
+                if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "skill.json")):
+                    ids.append(entry.name)
+        return sorted(ids)
+
+    def _load(self, skill_id: str, stat_key: Tuple[int, int]):
+        skill_path = os.path.join(self.skills_dir, skill_id)
+        try:
+            with open(os.path.join(skill_path, "skill.json"), 'r', encoding='utf-8') as f:
+                manifest = validate_manifest(skill_path, json.load(f))
+            # Add internal ID based on folder name
+            manifest['id'] = skill_id
+            return stat_key, manifest, None
+        except Exception as e:
+            logger.error(f"Failed to load skill manifest for {skill_id}: {e}")
+            return stat_key, None, str(e)
+
+    def _refresh(self):
+        """Revalidates against the filesystem; callers must hold the lock."""
+        try:
+            dir_mtime = os.stat(self.skills_dir).st_mtime_ns
+        except OSError:
+            self._dir_mtime, self._entries = None, {}
+            return
+
+        ids = self._scan_ids() if dir_mtime != self._dir_mtime else list(self._entries)
+        self._dir_mtime = dir_mtime
+
+        entries = {}
+        for skill_id in ids:
+            try:
+                st = os.stat(os.path.join(self.skills_dir, skill_id, "skill.json"))
+            except OSError:
+                continue
+            stat_key = (st.st_mtime_ns, st.st_size)
+            cached = self._entries.get(skill_id)
+            entries[skill_id] = cached if cached and cached[0] == stat_key else self._load(skill_id, stat_key)
+        self._entries = entries
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return [copy.deepcopy(m) for _, m, _ in self._entries.values() if m is not None]
+
+    def get(self, skill_id: str) -> Dict[str, Any]:
+        """Returns a copy of a valid manifest; raises KeyError / SkillManifestError otherwise."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(skill_id)
+        if entry is None:
+            raise KeyError(skill_id)
+        _, manifest, error = entry
+        if manifest is None:
+            raise SkillManifestError(error)
+        return copy.deepcopy(manifest)
+
+
+_REGISTRIES: Dict[str, SkillRegistry] = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_skill_registry(skills_dir: str) -> SkillRegistry:
+    key = os.path.realpath(skills_dir)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(key)
+        if registry is None:
+            registry = _REGISTRIES[key] = SkillRegistry(key)
+        return registry
+
+
 class SkillService:
     def __init__(self, server_root: str):
         self.server_root = server_root
         self.skills_dir = os.path.join(server_root, "skills")
+        self.registry = get_skill_registry(self.skills_dir)
 
     def list_skills(self) -> List[Dict[str, Any]]:
-        """Scans the skills directory for valid skill packages."""
-        skills = []
-        if not os.path.exists(self.skills_dir):
-            return skills
-
-        for item in os.listdir(self.skills_dir):
-            item_path = os.path.join(self.skills_dir, item)
-            manifest_path = os.path.join(item_path, "skill.json")
-            
-            if os.path.isdir(item_path) and os.path.exists(manifest_path):
-                try:
-                    with open(manifest_path, 'r', encoding='utf-8') as f:
-                        manifest = json.load(f)
-                        # Add internal ID based on folder name
-                        manifest['id'] = item 
-                        skills.append(manifest)
-                except Exception as e:
-                    logger.error(f"Failed to load skill manifest for {item}: {e}")
-        
-        return skills
-
-    def install_skill(self, skill_id: str, project_path: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Lists valid skill packages from the shared registry."""
+        return self.registry.list()
+
+    def install_skill(self, skill_id: str, project_path: str, params: Dict[str, Any] = None,
+                      overwrite: bool = False) -> Dict[str, Any]:
         """Installs a skill into the target project."""
-        if params is None:
-            params = {}
-        skill_path = os.path.join(self.skills_dir, skill_id)
-        manifest_path = os.path.join(skill_path, "skill.json")
+        return self.install_skills([skill_id], project_path, {skill_id: params or {}}, overwrite)
 
-        if not os.path.exists(skill_path):
-            return {"status": "error", "message": f"Skill '{skill_id}' not found."}
+    def install_skills(self, skill_ids: List[str], project_path: str,
+                       params: Dict[str, Dict[str, Any]] = None, overwrite: bool = False) -> Dict[str, Any]:
+        """
+        Installs several skills as one transaction: plan every write, stop on any
+        error or conflict, then stage and rename into place with rollback.
+        params maps skill id -> parameter values.
+        """
+        plan = self.plan_install(skill_ids, project_path, params, overwrite)
+        if plan.errors:
+            for error in plan.errors:
+                logger.error(f"Skill install aborted: {error}")
+            return {"status": "error", "message": "; ".join(plan.errors), "errors": plan.errors}
 
         try:
-            with open(manifest_path, 'r', encoding='utf-8') as f:
-                manifest = json.load(f)
-
-            # 1. Copy Files
-            files = manifest.get('files', [])
-            for file_def in files:
-                src_rel = file_def.get('source')
-                dest_rel = file_def.get('destination')
-                
-                if not src_rel or not dest_rel:
+            self._commit(plan)
+        except Exception as e:
+            logger.error(f"Failed to install skills {skill_ids}: {e}")
+            return {"status": "error", "message": f"Install rolled back: {e}", "errors": [str(e)]}
+
+        names = [m['name'] for m in plan.skills]
+        if len(names) == 1:
+            message = f"Skill '{names[0]}' installed successfully."
+        else:
+            message = f"{len(names)} skills installed successfully: {', '.join(names)}."
+        return {
+            "status": "success",
+            "message": message,
+            "installed": [m['id'] for m in plan.skills],
+            "files": sorted(plan.writes),
+            "warnings": plan.warnings,
+        }
+
+    def plan_install(self, skill_ids: List[str], project_path: str,
+                     params: Dict[str, Dict[str, Any]] = None, overwrite: bool = False) -> SkillInstallPlan:
+        """Computes all file writes and injections without modifying the project."""
+        params = params or {}
+        plan = SkillInstallPlan(project_path)
+        injections: Dict[str, List[Tuple[str, str, str, Dict[str, Any]]]] = {}
+        renders = []
+
+        # 1. Resolve manifests and claim destinations
+        for skill_id in dict.fromkeys(skill_ids):
+            try:
+                manifest = self.registry.get(skill_id)
+            except KeyError:
+                plan.errors.append(f"Skill '{skill_id}' not found.")
+                continue
+            except SkillManifestError as e:
+                plan.errors.append(f"Skill '{skill_id}' has an invalid manifest: {e}")
+                continue
+            plan.skills.append(manifest)
+            skill_params = _effective_params(manifest, params.get(skill_id))
+            skill_path = os.path.join(self.skills_dir, skill_id)
+
+            for file_def in manifest.get('files', []):
+                dest_rel = os.path.normpath(file_def['destination'])
+                owner = plan.writes.get(dest_rel)
+                if owner:
+                    plan.errors.append(f"Conflict: '{dest_rel}' is provided by both '{owner['skill']}' and '{skill_id}'.")
                     continue
+                write = {"skill": skill_id, "source": os.path.join(skill_path, file_def['source']), "content": None}
+                plan.writes[dest_rel] = write
+                if file_def.get('render', True):
+                    renders.append((dest_rel, write, skill_params))
 
-                src_file = os.path.join(skill_path, src_rel)
-                dest_file = os.path.join(project_path, dest_rel)
-
-                # SECURITY CHECK: Prevent Path Traversal
-                # Ensure dest_file is actually inside project_path
-                abs_project_path = os.path.abspath(project_path)
-                abs_dest_file = os.path.abspath(dest_file)
-                if not abs_dest_file.startswith(abs_project_path):
-                     logger.warning(f"Blocked path traversal attempt: {dest_rel}")
-                     continue
-
-                # Create destination directory if needed
-                os.makedirs(os.path.dirname(dest_file), exist_ok=True)
-
-                # Read source/template
-                with open(src_file, 'r', encoding='utf-8') as sf:
-                    content = sf.read()
-
-                # Simple Template Replacement (replace {{param}} with value)
-                for key, value in params.items():
-                    content = content.replace(f"{{{{{key}}}}}", str(value))
-
-                # Write to destination
-                with open(dest_file, 'w', encoding='utf-8') as df:
-                    df.write(content)
-                
-                logger.info(f"Installed file: {dest_file}")
-
-            # 2. Injection (Basic Append for now)
-            # In a real implementation, we would use AST parsing for Python/JS
-            injections = manifest.get('injections', [])
-            for inject in injections:
-                target_file_rel = inject.get('target')
-                content_to_inject = inject.get('content')
-                position = inject.get('position', 'append') # 'append', 'prepend'
-                
-                target_file = os.path.join(project_path, target_file_rel)
-                if os.path.exists(target_file):
-                    with open(target_file, 'r+', encoding='utf-8') as tf:
-                        existing_content = tf.read()
-                        if content_to_inject not in existing_content:
-                            if position == 'append':
-                                tf.write("\n" + content_to_inject + "\n")
-                            elif position == 'prepend':
-                                tf.seek(0)
-                                tf.write(content_to_inject + "\n" + existing_content)
-                            logger.info(f"Injected code into: {target_file}")
-
-            return {"status": "success", "message": f"Skill '{manifest['name']}' installed successfully."}
+            for inject in manifest.get('injections', []):
+                target_rel = os.path.normpath(inject['target'])
+                injections.setdefault(target_rel, []).append(
+                    (skill_id, inject.get('position', 'append'), inject['content'], skill_params))
 
-        except Exception as e:
-            logger.error(f"Failed to install skill {skill_id}: {e}")
-            return {"status": "error", "message": str(e)}
+        if plan.errors:
+            return plan
+
+        # 2. Render templates and read existing files concurrently
+        def render(job):
+            dest_rel, write, skill_params = job
+            try:
+                write['content'] = _render_source(write['skill'], write['source'], skill_params)
+            except (TemplateError, UnicodeDecodeError) as e:
+                return f"Skill '{write['skill']}' file '{dest_rel}': {e}"
+            return None
+
+        targets = list(injections)
+        with ThreadPoolExecutor(max_workers=MAX_IO_WORKERS) as pool:
+            render_errors = [err for err in pool.map(render, renders) if err]
+            existing = dict(zip(targets, pool.map(
+                lambda rel: _read_text(os.path.join(project_path, rel)), targets)))
+        plan.errors.extend(render_errors)
+        if plan.errors:
+            return plan
+
+        # 3. Conflicts with files already in the project (identical content is a no-op)
+        for dest_rel, write in list(plan.writes.items()):
+            dest = os.path.join(project_path, dest_rel)
+            if not os.path.exists(dest):
+                continue
+            if write['content'] is not None:
+                unchanged = _read_text(dest) == write['content']
+            else:
+                unchanged = filecmp.cmp(write['source'], dest, shallow=False)
+            if unchanged:
+                del plan.writes[dest_rel]
+            elif not overwrite:
+                plan.errors.append(f"Conflict: '{dest_rel}' already exists in the project.")
+
+        # 4. Injections: one read-modify-write per target, in skill order
+        # In a real implementation, we would use AST parsing for Python/JS
+        for target_rel, items in injections.items():
+            write = plan.writes.get(target_rel)
+            if write is not None and write['content'] is None:
+                plan.errors.append(f"Cannot inject into '{target_rel}': it is copied without rendering.")
+                continue
+            content = write['content'] if write is not None else existing[target_rel]
+            if content is None:
+                plan.warnings.append(f"Injection target '{target_rel}' not found; skipped.")
+                continue
+
+            original = content
+            for skill_id, position, template_src, skill_params in items:
+                try:
+                    snippet = get_template((skill_id, "injection", template_src),
+                                           lambda: template_src).render(skill_params)
+                except TemplateError as e:
+                    plan.errors.append(f"Skill '{skill_id}' injection into '{target_rel}': {e}")
+                    continue
+                if snippet in content:
+                    continue
+                if position == 'append':
+                    content = content + "\n" + snippet + "\n"
+                else:
+                    content = snippet + "\n" + content
+            if content != original:
+                plan.writes[target_rel] = {"skill": items[-1][0], "source": None, "content": content}
+
+        return plan
+
+    def _commit(self, plan: SkillInstallPlan):
+        """Writes everything to a staging directory, then renames into place; rolls back on failure."""
+        if not plan.writes:
+            return
+        project_path = plan.project_path
+        staging = tempfile.mkdtemp(prefix=".codesynth_staging_", dir=project_path)
+        new_dir = os.path.join(staging, "new")
+        old_dir = os.path.join(staging, "old")
+
+        def stage(item):
+            dest_rel, write = item
+            staged = os.path.join(new_dir, dest_rel)
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            if write['content'] is not None:
+                with open(staged, 'w', encoding='utf-8') as f:
+                    f.write(write['content'])
+            else:
+                shutil.copyfile(write['source'], staged)
+
+        done: List[Tuple[str, Optional[str]]] = []
+        created_dirs: List[str] = []
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_IO_WORKERS) as pool:
+                list(pool.map(stage, plan.writes.items()))
+
+            for dest_rel in sorted(plan.writes):
+                dest = os.path.join(project_path, dest_rel)
+                created_dirs.extend(_makedirs(os.path.dirname(dest)))
+                backup = None
+                if os.path.exists(dest):
+                    backup = os.path.join(old_dir, dest_rel)
+                    os.makedirs(os.path.dirname(backup), exist_ok=True)
+                    os.replace(dest, backup)
+                done.append((dest, backup))
+                os.replace(os.path.join(new_dir, dest_rel), dest)
+                logger.info(f"Installed file: {dest}")
+        except Exception:
+            for dest, backup in reversed(done):
+                try:
+                    if backup:
+                        os.replace(backup, dest)
+                    elif os.path.exists(dest):
+                        os.remove(dest)
+                except OSError as e:
+                    logger.error(f"Rollback failed for {dest}: {e}")
+            for directory in reversed(created_dirs):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+            raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
@@ -1,8 +1,10 @@
+import os
 import time
 import sqlite3
 from database.connection import get_db
 from utils.security import validate_project_path, validate_file_path
 from .ai_svc import log_ai_event
+from .retrieval_svc import retrieval_index, SNAPSHOT_INDEX_LIMIT
 from utils.logger import server_logger # Import logger
 
 def save_snapshot(request_data: dict) -> dict:
@@ -18,7 +20,9 @@ def save_snapshot(request_data: dict) -> dict:
         
         # 1. 驗證專案路徑
         try:
-            project_path = validate_project_path(req_project_path)
+            # validate_project_path 只回傳 True，路徑本身沿用請求值
+            validate_project_path(req_project_path)
+            project_path = req_project_path
         except ValueError as e:
             server_logger.error(f"專案路徑驗證失敗: {e}")
             return {"status": "error", "message": f"專案路徑無效: {str(e)}"}
@@ -28,7 +32,8 @@ def save_snapshot(request_data: dict) -> dict:
         
         # 2. 驗證檔案路徑
         try:
-            file_path = validate_file_path(req_file_path)
+            validate_file_path(req_file_path)
+            file_path = req_file_path
         except ValueError as e:
             server_logger.error(f"檔案路徑驗證失敗: {e}")
             return {"status": "error", "message": f"檔案路徑無效: {str(e)}"}
@@ -95,7 +100,12 @@ def save_snapshot(request_data: dict) -> dict:
                 server_logger.error(f"插入資料庫失敗: {type(e).__name__}: {e}")
                 raise
         
-        # 6. 記錄 AI 事件（非關鍵，失敗不影響主流程）
+        # 6. 加入全文檢索索引 (只索引開頭部分)
+        retrieval_index.add("snapshot", f"{file_path}\n{req_content[:SNAPSHOT_INDEX_LIMIT]}",
+                            source=file_path, ref=version_id,
+                            project=os.path.realpath(project_path))
+
+        # 7. 記錄 AI 事件（非關鍵，失敗不影響主流程）
         try:
             # 只有當真的產生新版本時才記錄
             log_ai_event(
@@ -137,7 +147,8 @@ def batch_save_snapshot(request_data: dict) -> dict:
     """批次保存多個檔案快照"""
     conn = None
     try:
-        project_path = validate_project_path(request_data['project_path'])
+        project_path = request_data['project_path']
+        validate_project_path(project_path)
         snapshots = request_data.get('snapshots', [])
         
         if not snapshots:
@@ -149,11 +160,13 @@ def batch_save_snapshot(request_data: dict) -> dict:
         success_count = 0
         skipped_count = 0
         errors = []
+        indexed = []
         MAX_SIZE = 10 * 1024 * 1024  # 10MB
         
         for snapshot in snapshots:
             try:
-                file_path = validate_file_path(snapshot['file_path'])
+                file_path = snapshot['file_path']
+                validate_file_path(file_path)
                 content = snapshot['content']
                 trigger = snapshot.get('trigger', 'Batch Scan')
                 
@@ -188,6 +201,8 @@ def batch_save_snapshot(request_data: dict) -> dict:
                             (file_path, content, timestamp, trigger, status)
                             VALUES (?, ?, ?, ?, 'pending')""",
                          (file_path, content, time.time(), trigger))
+                indexed.append(("snapshot", f"{file_path}\n{content[:SNAPSHOT_INDEX_LIMIT]}",
+                                file_path, c.lastrowid))
                 
                 success_count += 1
                 
@@ -203,6 +218,7 @@ def batch_save_snapshot(request_data: dict) -> dict:
                 })
         
         conn.commit()
+        retrieval_index.add_many(indexed, project=os.path.realpath(project_path))
         
         return {
             'status': 'ok',
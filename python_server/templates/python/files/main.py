@@ -0,0 +1,7 @@
+# CodeSynth Python Project
+
+def main():
+    print('Hello, CodeSynth!')
+
+if __name__ == '__main__':
+    main()
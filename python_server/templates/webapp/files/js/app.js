@@ -0,0 +1 @@
+console.log('CodeSynth Project Initialized');
\ No newline at end of file
@@ -1,11 +1,19 @@
 import sys
 import os
+import asyncio
 
 # Add current dir to path to import services
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from services.llm_client import llm_client
 
+async def _generate(prompt: str) -> str:
+    # Goes through llm_scheduler like every other generation (no cache: always hit Ollama)
+    try:
+        return await llm_client.generate_async(prompt, use_cache=False)
+    finally:
+        await llm_client.aclose()
+
 def test_ollama():
     print("==========================================")
     print(f"Testing Connection to: {llm_client.base_url}")
@@ -13,7 +21,7 @@ def test_ollama():
     print("==========================================")
 
     try:
-        response = llm_client.generate("Say 'Hello CodeSynth!' if you can hear me.")
+        response = asyncio.run(_generate("Say 'Hello CodeSynth!' if you can hear me."))
         if response:
             print(f"✅ Connection Successful!")
             print(f"🤖 AI Response: {response}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 伺服器模組以 python_server 為根目錄匯入 (例如 from utils.logger import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from database.connection import get_db
+from services.matrix_svc import _sim_relative_path, run_simulation_matrix_logic
+
+
+def test_sim_relative_path_inside_project(tmp_path):
+    project = str(tmp_path)
+    assert _sim_relative_path(os.path.join(project, "src", "main.py"), project) == os.path.join("src", "main.py")
+    assert _sim_relative_path("src/./main.py", project) == os.path.join("src", "main.py")
+
+
+def test_sim_relative_path_rejects_out_of_tree_paths(tmp_path):
+    project = str(tmp_path / "project")
+    outside = str(tmp_path / "elsewhere" / "main.py")
+    assert _sim_relative_path(outside, project) is None
+    assert _sim_relative_path("../elsewhere/main.py", project) is None
+    assert _sim_relative_path("src/../../main.py", project) is None
+
+
+def test_matrix_rejects_out_of_tree_candidates(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    outside = str(tmp_path / "elsewhere" / "main.py")
+    conn, _ = get_db(str(project))
+    conn.execute("INSERT INTO history (id, file_path, content, timestamp) VALUES (1, ?, ?, 0)",
+                 (outside, "open('pwned', 'w')"))
+    conn.commit()
+    conn.close()
+
+    result = run_simulation_matrix_logic({
+        "project_path": str(project),
+        "candidates": {outside: [1]},
+    })
+
+    assert result["status"] == "error"
+    assert "不在專案目錄內" in result["message"]
+    assert not (tmp_path / "elsewhere").exists()
+
+
+def test_matrix_rejects_non_integer_timeout(tmp_path):
+    with pytest.raises(ValueError):
+        run_simulation_matrix_logic({
+            "project_path": str(tmp_path),
+            "candidates": {"main.py": [1]},
+            "timeout": "soon",
+        })
+
@@ -0,0 +1,22 @@
+import os
+
+from services.preview_watch_svc import _is_ignored, _scan
+
+
+def test_is_ignored_matches_suffixed_workspace_dirs():
+    assert _is_ignored("_sim_matrix/w0/main.py")
+    assert _is_ignored("_sim_matrix_ab12cd/w0/main.py")
+    assert _is_ignored("_sim_temp_1/main.py")
+    assert not _is_ignored("src/_sim_matrix_notes.txt")
+    assert not _is_ignored("src/main.py")
+
+
+def test_scan_skips_suffixed_workspace_dirs(tmp_path):
+    (tmp_path / "index.html").write_text("<html></html>")
+    workspace = tmp_path / "_sim_matrix_ab12cd" / "w0"
+    workspace.mkdir(parents=True)
+    (workspace / "main.py").write_text("print('hi')")
+
+    snapshot = _scan(str(tmp_path))
+
+    assert list(snapshot) == [os.path.join(str(tmp_path), "index.html")]
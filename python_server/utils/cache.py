@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    執行緒安全的有界 LRU 快取。
+    max_entries 限制項目數；max_bytes (選用) 以 sizeof(value) 估算總大小並限制。
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: len(value))
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self._sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            if self.max_bytes and size > self.max_bytes:
+                # 單一項目超過總上限時不快取
+                return
+            if key in self._data:
+                self._total -= self._sizes.pop(key, 0)
+                del self._data[key]
+            self._data[key] = value
+            self._sizes[key] = size
+            self._total += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self._total > self.max_bytes):
+                old_key, _ = self._data.popitem(last=False)
+                self._total -= self._sizes.pop(old_key, 0)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._total -= self._sizes.pop(key, 0)
+            return self._data.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self._total,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import shutil
+import atexit
+import threading
+import subprocess
+import unicodedata
+from html import escape
+from collections import namedtuple
+
+try:
+    import mss
+    MSS_AVAILABLE = True
+except ImportError:
+    MSS_AVAILABLE = False
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# kind: "rgb" (data 為 RGB bytes, size 為 (w, h)) 或 "svg" (data 為 SVG 文字)
+Capture = namedtuple("Capture", ["kind", "data", "size"])
+
+TEXT_MAX_LINES = 60
+TEXT_MAX_COLS = 120
+
+
+# 終端繪製使用的 CJK TrueType 字型 (錯誤訊息多為中文，Pillow 內建字型沒有 CJK 字形)
+# 可用 CODESYNTH_SCREENSHOT_FONT 指定；找不到時改輸出 SVG，由檢視端的字型繪製
+CJK_FONT_CANDIDATES = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "C:\\Windows\\Fonts\\msjh.ttc",
+    "C:\\Windows\\Fonts\\msyh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+)
+
+
+def _display_width(text: str) -> int:
+    """等寬字型下的欄寬：全形 (CJK) 字元佔 2 欄"""
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+
+class CaptureBackend:
+    """截圖後端介面"""
+    name = "base"
+
+    def capture(self, job: dict):
+        raise NotImplementedError
+
+    def display_env(self):
+        """模擬程式需要的額外環境變數 (例如 DISPLAY)，不需要則回傳 None"""
+        return None
+
+    def stop(self):
+        pass
+
+
+class MssBackend(CaptureBackend):
+    """實體螢幕截圖 (需要可用的顯示器)"""
+    name = "mss"
+
+    def __init__(self, display: str = None):
+        self.display = display
+
+    def capture(self, job: dict):
+        kwargs = {"display": self.display} if self.display else {}
+        with mss.mss(**kwargs) as sct:
+            if not sct.monitors:
+                return None
+            # sct.monitors[0] is all monitors combined, sct.monitors[1] is the first one
+            shot = sct.grab(sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0])
+            return Capture("rgb", shot.rgb, shot.size)
+
+
+class XvfbBackend(MssBackend):
+    """
+    無顯示器的 Linux 主機：啟動一個 Xvfb 虛擬 framebuffer，
+    模擬程式透過 DISPLAY 在其中繪製視窗，截圖時改抓虛擬螢幕。
+    """
+    name = "xvfb"
+
+    def __init__(self, screen: str = "1280x800x24"):
+        super().__init__()
+        self.screen = screen
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                return
+            for number in range(99, 120):
+                if os.path.exists(f"/tmp/.X11-unix/X{number}") or os.path.exists(f"/tmp/.X{number}-lock"):
+                    continue
+                display = f":{number}"
+                self._proc = subprocess.Popen(
+                    ["Xvfb", display, "-screen", "0", self.screen, "-nolisten", "tcp"],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                # 等待 X socket 建立
+                deadline = time.time() + 3
+                while time.time() < deadline:
+                    if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                        self.display = display
+                        return
+                    if self._proc.poll() is not None:
+                        break
+                    time.sleep(0.05)
+                self._proc.kill()
+            raise RuntimeError("無法啟動 Xvfb 虛擬顯示器")
+
+    def display_env(self):
+        self._start()
+        return {"DISPLAY": self.display}
+
+    def capture(self, job: dict):
+        self._start()
+        return super().capture(job)
+
+    def stop(self):
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                self._proc.terminate()
+            self._proc = None
+
+
+class TerminalRenderBackend(CaptureBackend):
+    """
+    將模擬程式的終端輸出 (錯誤訊息) 繪製成圖片。
+    有 Pillow 與 CJK 字型時輸出點陣圖，否則輸出 SVG，不需要任何顯示器。
+    """
+    name = "text"
+    font_size = 14
+
+    def __init__(self):
+        self.font = self._load_font() if PIL_AVAILABLE else None
+
+    def _load_font(self):
+        configured = os.getenv("CODESYNTH_SCREENSHOT_FONT")
+        for path in ([configured] if configured else []) + list(CJK_FONT_CANDIDATES):
+            if not os.path.exists(path):
+                continue
+            try:
+                return ImageFont.truetype(path, self.font_size)
+            except OSError as e:
+                print(f"[WARNING] 無法載入字型 {path}: {e}")
+        return None
+
+    @staticmethod
+    def _lines(text: str):
+        lines = []
+        for raw in (text or "").splitlines() or [""]:
+            raw = raw.expandtabs(4)
+            while len(raw) > TEXT_MAX_COLS:
+                lines.append(raw[:TEXT_MAX_COLS])
+                raw = raw[TEXT_MAX_COLS:]
+            lines.append(raw)
+        return lines[-TEXT_MAX_LINES:]
+
+    def capture(self, job: dict):
+        lines = self._lines(job.get("error_msg") or "")
+        if self.font is not None:
+            line_height = self.font_size + 4
+            text_width = max(self.font.getlength(l) for l in lines)
+            width = 16 + int(max(text_width, 40 * self.font_size / 2))
+            height = 16 + line_height * len(lines)
+            image = Image.new("RGB", (width, height), (30, 30, 30))
+            draw = ImageDraw.Draw(image)
+            for i, line in enumerate(lines):
+                draw.text((8, 8 + i * line_height), line, fill=(212, 212, 212), font=self.font)
+            return Capture("rgb", image.tobytes(), image.size)
+
+        line_height, char_width = 16, 8
+        width = 16 + char_width * max(40, max(_display_width(l) for l in lines))
+        height = 16 + line_height * len(lines)
+        tspans = "".join(
+            f'<tspan x="8" dy="{line_height}">{escape(line) or " "}</tspan>' for line in lines
+        )
+        svg = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">'
+            f'<rect width="100%" height="100%" fill="#1e1e1e"/>'
+            f'<text y="4" font-family="monospace" font-size="13" fill="#d4d4d4" '
+            f'xml:space="preserve">{tspans}</text></svg>'
+        )
+        return Capture("svg", svg, (width, height))
+
+
+def has_display() -> bool:
+    """Windows / macOS 一律視為有顯示器；Linux 依 DISPLAY / WAYLAND_DISPLAY 判斷"""
+    if not sys.platform.startswith("linux"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name: str):
+    if name == "mss" and MSS_AVAILABLE:
+        return MssBackend()
+    if name == "xvfb" and MSS_AVAILABLE and shutil.which("Xvfb"):
+        return XvfbBackend()
+    if name == "text":
+        return TerminalRenderBackend()
+    return None
+
+
+def get_backend() -> CaptureBackend:
+    """
+    取得截圖後端 (僅在第一次呼叫時偵測)。
+    CODESYNTH_SCREENSHOT_BACKEND = auto | mss | xvfb | text
+    auto: 有顯示器用 mss，無顯示器但有 Xvfb 用 xvfb，否則改為繪製終端輸出。
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            choice = os.getenv("CODESYNTH_SCREENSHOT_BACKEND", "auto").lower()
+            if choice == "auto":
+                order = ["mss", "xvfb", "text"] if has_display() else ["xvfb", "text"]
+            else:
+                order = [choice, "text"]
+            for name in order:
+                _backend = _create_backend(name)
+                if _backend:
+                    break
+            print(f"[INFO] 截圖後端: {_backend.name}")
+            atexit.register(_backend.stop)
+        return _backend
+
+
+def fallback_backend(failed: CaptureBackend) -> CaptureBackend:
+    """目前後端截圖失敗時改用終端輸出繪製，之後不再重試失敗的後端"""
+    global _backend
+    with _backend_lock:
+        if _backend is failed and failed.name != "text":
+            failed.stop()
+            _backend = TerminalRenderBackend()
+            print(f"[WARNING] 截圖後端 {failed.name} 失敗，改用 {_backend.name}")
+        return _backend
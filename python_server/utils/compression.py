@@ -0,0 +1,109 @@
+import os
+import gzip
+from utils.cache import LRUCache
+
+# brotli 為選用套件，未安裝時只提供 gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MIN_COMPRESS_SIZE = 1024               # 太小的檔案壓縮效益不大
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024    # 超過此大小不做即時壓縮
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_PREFIXES = ("text/",)
+COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/xml",
+    "application/wasm", "image/svg+xml", "application/manifest+json",
+}
+
+# 預先壓縮的旁車檔案 (例如 app.js.br / app.js.gz)
+SIDECAR_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# 壓縮結果快取: (path, mtime_ns, size, encoding) -> bytes
+COMPRESSED_CACHE = LRUCache(max_entries=256, max_bytes=32 * 1024 * 1024)
+
+
+def supported_encodings() -> list:
+    return ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str):
+    """
+    解析 Accept-Encoding (含 q 值)，回傳伺服器支援且用戶端偏好的編碼；
+    沒有可用編碼時回傳 None (identity)
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        fields = part.strip().split(";")
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        # 同分時依 supported_encodings 的順序 (br 優先)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(media_type: str) -> bool:
+    if not media_type:
+        return False
+    media_type = media_type.split(";")[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_PREFIXES) or media_type in COMPRESSIBLE_TYPES
+
+
+def find_sidecar(full_path: str, st: os.stat_result, encoding: str):
+    """找出比原始檔案新的預先壓縮檔，回傳 (path, stat) 或 None"""
+    suffix = SIDECAR_SUFFIXES.get(encoding)
+    if not suffix:
+        return None
+    sidecar = full_path + suffix
+    try:
+        sidecar_st = os.stat(sidecar)
+    except OSError:
+        return None
+    if sidecar_st.st_mtime_ns < st.st_mtime_ns:
+        return None
+    return sidecar, sidecar_st
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 讓輸出固定，相同內容得到相同位元組
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def get_compressed(key: tuple, encoding: str, load) -> bytes:
+    """
+    取得壓縮後內容；key 需包含檔案的 mtime/size，load() 於快取未命中時提供原始位元組
+    """
+    cache_key = key + (encoding,)
+    body = COMPRESSED_CACHE.get(cache_key)
+    if body is None:
+        body = compress(load(), encoding)
+        COMPRESSED_CACHE.put(cache_key, body)
+    return body
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """不同編碼的表示需要不同的 ETag"""
+    return f'{etag[:-1]}-{encoding}"'
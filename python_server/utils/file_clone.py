@@ -0,0 +1,54 @@
+import os
+import shutil
+import threading
+
+# Linux 的 FICLONE ioctl (btrfs / xfs / bcachefs 等支援 reflink 的檔案系統)
+try:
+    import fcntl
+    FICLONE = 0x40049409
+except ImportError:
+    fcntl = None
+
+# (來源 st_dev, 目的 st_dev) -> 是否支援 reflink，避免每個檔案都重試失敗的 ioctl
+_REFLINK_SUPPORT = {}
+_REFLINK_LOCK = threading.Lock()
+
+
+def _reflink(src: str, dst: str, devices: tuple) -> bool:
+    if fcntl is None or _REFLINK_SUPPORT.get(devices) is False:
+        return False
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            with _REFLINK_LOCK:
+                _REFLINK_SUPPORT[devices] = False
+            return False
+    with _REFLINK_LOCK:
+        _REFLINK_SUPPORT[devices] = True
+    return True
+
+
+def clone_file(src: str, dst: str, shared: bool = False) -> str:
+    """
+    以最省成本的方式建立檔案副本，回傳使用的方法：
+    shared=True (唯讀共用檔案) 時優先 hardlink；其餘依序嘗試 reflink (copy-on-write) 與一般複製。
+    hardlink 會與來源共用內容，只能用於不會被修改的檔案 (例如 vendored 函式庫)。
+    """
+    src_dev = os.stat(src).st_dev
+    dst_dev = os.stat(os.path.dirname(dst) or ".").st_dev
+
+    if shared and src_dev == dst_dev:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+
+    if _reflink(src, dst, (src_dev, dst_dev)):
+        shutil.copymode(src, dst)
+        return "reflink"
+
+    shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+    return "copy"
@@ -0,0 +1,107 @@
+from html.parser import HTMLParser
+from utils.cache import LRUCache
+
+# 與 EDITOR_JS 相同的可編輯標籤
+EDITABLE_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "p", "span", "li", "a", "button", "td", "th", "div"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+}
+
+# 位置索引快取: (path, mtime_ns, size) -> [EditableElement]
+HTML_INDEX_CACHE = LRUCache(max_entries=64)
+
+
+class EditableElement:
+    """可編輯的葉節點元素；offset 皆為原始碼中的字元位置"""
+    __slots__ = ("tag", "tag_start", "name_end", "content_start", "content_end")
+
+    def __init__(self, tag, tag_start, name_end, content_start, content_end):
+        self.tag = tag
+        self.tag_start = tag_start          # '<' 的位置
+        self.name_end = name_end            # 標籤名稱之後，用於插入 data-cs-id
+        self.content_start = content_start  # 開始標籤結束處
+        self.content_end = content_end      # 結束標籤開始處
+
+
+class _IndexParser(HTMLParser):
+    """
+    找出 EDITABLE_TAGS 中沒有子元素且含有文字的元素。
+    遇到未對應的結束標籤時往上找最近的同名元素，與瀏覽器的容錯行為大致相同。
+    """
+
+    def __init__(self, source: str):
+        super().__init__(convert_charrefs=True)
+        self.source = source
+        self.line_starts = [0]
+        pos = source.find("\n")
+        while pos != -1:
+            self.line_starts.append(pos + 1)
+            pos = source.find("\n", pos + 1)
+        self.stack = []  # [tag, tag_start, name_end, content_start, has_child, has_text]
+        self.elements = []
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self.line_starts[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        if self.stack:
+            self.stack[-1][4] = True
+        if tag in VOID_TAGS:
+            return
+        start = self._offset()
+        raw = self.get_starttag_text() or ""
+        self.stack.append([tag, start, start + 1 + len(tag), start + len(raw), False, False])
+
+    def handle_startendtag(self, tag, attrs):
+        if self.stack:
+            self.stack[-1][4] = True
+
+    def handle_data(self, data):
+        if self.stack and data.strip():
+            self.stack[-1][5] = True
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                break
+        else:
+            return
+        end = self._offset()
+        # 中間未關閉的元素一併視為結束 (無法確定範圍，不列入索引)
+        del self.stack[i + 1:]
+        name, tag_start, name_end, content_start, has_child, has_text = self.stack.pop()
+        if name in EDITABLE_TAGS and not has_child and has_text:
+            self.elements.append(EditableElement(name, tag_start, name_end, content_start, end))
+
+
+def build_index(source: str) -> list:
+    """回傳依文件順序排列的可編輯元素；順序編號即為 data-cs-id"""
+    parser = _IndexParser(source)
+    parser.feed(source)
+    parser.close()
+    parser.elements.sort(key=lambda el: el.tag_start)
+    return parser.elements
+
+
+def get_index(key: tuple, source: str) -> list:
+    """key 需包含檔案的 mtime/size，內容未變更時沿用已解析的索引"""
+    index = HTML_INDEX_CACHE.get(key)
+    if index is None:
+        index = build_index(source)
+        HTML_INDEX_CACHE.put(key, index)
+    return index
+
+
+def annotate(source: str, index: list) -> str:
+    """在每個可編輯元素的開始標籤加上 data-cs-id，供編輯器回傳定位"""
+    parts = []
+    last = 0
+    for cs_id, el in enumerate(index):
+        parts.append(source[last:el.name_end])
+        parts.append(f' data-cs-id="{cs_id}"')
+        last = el.name_end
+    parts.append(source[last:])
+    return "".join(parts)
+
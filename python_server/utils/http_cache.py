@@ -0,0 +1,63 @@
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi.responses import Response
+
+# 預覽回應的 Cache-Control；預設 no-cache = 可快取但每次需以 ETag 重新驗證
+PREVIEW_CACHE_CONTROL = os.getenv("CODESYNTH_PREVIEW_CACHE_CONTROL", "no-cache")
+
+
+def stat_etag(st: os.stat_result) -> str:
+    """由檔案 mtime_ns 與大小產生 ETag (原始檔案使用)"""
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def content_etag(content) -> str:
+    """由內容雜湊產生強 ETag (注入後的 HTML 等動態內容使用)"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return f'"{hashlib.sha1(content).hexdigest()[:32]}"'
+
+
+def validator_headers(etag: str, last_modified: float = None, cache_control: str = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control or PREVIEW_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request_headers, etag: str, last_modified: float = None) -> bool:
+    """
+    依 RFC 9110 判斷條件式請求：
+    有 If-None-Match 時只比對 ETag (弱比較)，否則才看 If-Modified-Since。
+    """
+    if request_headers is None:
+        return False
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        bare = etag[2:] if etag.startswith("W/") else etag
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == bare:
+                return True
+        return False
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP 日期只精確到秒
+        return int(last_modified) <= since
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    """304 回應只帶驗證相關標頭，不含 body"""
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,166 @@
+import os
+import asyncio
+import uuid
+from email.utils import parsedate_to_datetime
+from fastapi.responses import Response
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16  # 過多片段視為濫用，合併後仍超過則回 416
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: str, size: int):
+    """
+    解析 Range: bytes=... 標頭，回傳排序並合併後的 [(start, end)] (end 含)。
+    格式不符時回傳 None (忽略 Range，回傳完整內容)；
+    所有片段都超出檔案範圍時拋出 RangeNotSatisfiable。
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_s, sep, end_s = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                # bytes=-N：最後 N 個位元組
+                length = int(end_s)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(start_s)
+                end = int(end_s) if end_s else None
+                if start < 0 or (end is not None and end < start):
+                    return None
+                if start >= size:
+                    continue
+                end = size - 1 if end is None else min(end, size - 1)
+        except ValueError:
+            return None
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        raise RangeNotSatisfiable()
+    return merged
+
+
+def if_range_matches(request_headers, etag: str, last_modified: float) -> bool:
+    """If-Range 不存在或與目前版本相符時才可回傳部分內容"""
+    if_range = request_headers.get("if-range") if request_headers else None
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range 需使用強比較
+        return if_range == etag
+    try:
+        return int(last_modified) == int(parsedate_to_datetime(if_range).timestamp())
+    except (TypeError, ValueError):
+        return False
+
+
+def range_not_satisfiable_response(size: int, headers: dict = None) -> Response:
+    merged = dict(headers or {})
+    merged["Content-Range"] = f"bytes */{size}"
+    return Response(status_code=416, headers=merged)
+
+
+class RangeFileResponse(Response):
+    """
+    檔案回應，支援單一 / 多重 Range (206) 與完整內容 (200)。
+    ASGI 伺服器提供 http.response.zerocopy 擴充時以 sendfile 傳送，否則分塊讀取。
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, ranges=None,
+                 media_type: str = None, headers: dict = None):
+        super().__init__(content=None, status_code=206 if ranges else 200,
+                         headers=headers, media_type=None)
+        self.path = path
+        self.size = stat_result.st_size
+        self.file_media_type = media_type or "application/octet-stream"
+        self.headers["accept-ranges"] = "bytes"
+
+        if not ranges:
+            self.parts = [(0, self.size - 1, b"")] if self.size else []
+            self.trailer = b""
+            self.headers["content-type"] = self.file_media_type
+            self.headers["content-length"] = str(self.size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.parts = [(start, end, b"")]
+            self.trailer = b""
+            self.headers["content-type"] = self.file_media_type
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            boundary = uuid.uuid4().hex
+            self.parts = [
+                (start, end, (
+                    f"--{boundary}\r\nContent-Type: {self.file_media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+                ).encode("latin-1"))
+                for start, end in ranges
+            ]
+            # 每段內容後接 CRLF，最後以結尾 boundary 結束
+            self.trailer = f"--{boundary}--\r\n".encode("latin-1")
+            length = sum(len(h) + (e - s + 1) + 2 for s, e, h in self.parts) + len(self.trailer)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            self.headers["content-length"] = str(length)
+        self.multipart = bool(ranges) and len(ranges) > 1
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+
+        with open(self.path, "rb") as f:
+            for start, end, part_header in self.parts:
+                if part_header:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": f,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                else:
+                    await asyncio.to_thread(f.seek, start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if self.multipart:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+
+        await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
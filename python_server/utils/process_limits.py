@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import signal
+import threading
+import subprocess
+
+# 資源限制僅支援 POSIX 平台 (Windows 上無 resource / wait4)
+try:
+    import resource
+    RLIMITS_AVAILABLE = hasattr(os, "wait4")
+except ImportError:
+    resource = None
+    RLIMITS_AVAILABLE = False
+
+# 預設限制，可用環境變數覆寫
+DEFAULT_LIMITS = {
+    "cpu_seconds": int(os.getenv("CODESYNTH_SIM_CPU_SECONDS", "60")),
+    "memory_mb": int(os.getenv("CODESYNTH_SIM_MEMORY_MB", "2048")),
+    "open_files": int(os.getenv("CODESYNTH_SIM_OPEN_FILES", "256")),
+    "file_size_mb": int(os.getenv("CODESYNTH_SIM_FILE_SIZE_MB", "256")),
+}
+
+
+def resolve_limits(overrides: dict = None, allow_cpu: bool = True) -> dict:
+    """合併預設值與請求覆寫值；值為 0 或 None 代表不限制"""
+    limits = dict(DEFAULT_LIMITS)
+    for key, value in (overrides or {}).items():
+        if key in limits:
+            limits[key] = value
+    if not allow_cpu:
+        # 長駐的伺服器型應用 (如 Streamlit) 不設 CPU 秒數上限
+        limits["cpu_seconds"] = None
+    return limits
+
+
+# 在子行程中套用 rlimit 後 exec 目標程式的小型 wrapper。
+# 不使用 preexec_fn：伺服器與矩陣測試皆為多執行緒，fork 後在子行程執行 Python 程式碼可能死結
+_LIMIT_WRAPPER = (
+    "import os, sys, json, resource\n"
+    "for rlimit, soft, hard in json.loads(sys.argv[1]):\n"
+    "    try:\n"
+    "        cur_hard = resource.getrlimit(rlimit)[1]\n"
+    "        if cur_hard != resource.RLIM_INFINITY:\n"
+    "            soft, hard = min(soft, cur_hard), min(hard, cur_hard)\n"
+    "        resource.setrlimit(rlimit, (soft, hard))\n"
+    "    except (ValueError, OSError):\n"
+    "        pass\n"
+    "os.execv(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def _build_rlimits(limits: dict) -> list:
+    """將限制設定轉為 [(rlimit, soft, hard)]"""
+    if not RLIMITS_AVAILABLE:
+        return []
+
+    # 不設 RLIMIT_NPROC：它計算的是同一使用者的所有行程，而非此子行程樹
+    table = []
+    if limits.get("cpu_seconds"):
+        # soft limit 觸發 SIGXCPU，hard limit 多給 1 秒後 SIGKILL
+        table.append((resource.RLIMIT_CPU, limits["cpu_seconds"], limits["cpu_seconds"] + 1))
+    if limits.get("memory_mb"):
+        size = limits["memory_mb"] * 1024 * 1024
+        table.append((resource.RLIMIT_AS, size, size))
+    if limits.get("open_files"):
+        table.append((resource.RLIMIT_NOFILE, limits["open_files"], limits["open_files"]))
+    if limits.get("file_size_mb"):
+        size = limits["file_size_mb"] * 1024 * 1024
+        table.append((resource.RLIMIT_FSIZE, size, size))
+    return table
+
+
+def popen_limited(cmd, limits: dict = None, **kwargs) -> subprocess.Popen:
+    """以資源限制啟動子行程 (經由 exec wrapper)；非 POSIX 平台則等同 subprocess.Popen"""
+    table = _build_rlimits(limits) if limits else []
+    if not table:
+        return subprocess.Popen(cmd, **kwargs)
+
+    cmd = list(cmd)
+    program = cmd[0]
+    if os.sep not in program:
+        env = kwargs.get("env")
+        path = (env if env is not None else os.environ).get("PATH", os.defpath)
+        program = shutil.which(program, path=path)
+        if program is None:
+            # 與 subprocess.Popen 找不到執行檔時的行為一致
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cmd[0])
+
+    wrapper = [sys.executable, "-I", "-S", "-c", _LIMIT_WRAPPER, json.dumps(table), program, *cmd[1:]]
+    return subprocess.Popen(wrapper, **kwargs)
+
+
+def _usage_from_rusage(ru, wall_time: float) -> dict:
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    max_rss_kb = ru.ru_maxrss // 1024 if sys.platform == "darwin" else ru.ru_maxrss
+    return {
+        "user_time": round(ru.ru_utime, 3),
+        "sys_time": round(ru.ru_stime, 3),
+        "max_rss_kb": max_rss_kb,
+        "wall_time": round(wall_time, 3),
+    }
+
+
+def communicate_with_usage(process: subprocess.Popen, timeout: float = None, kill_on_timeout: bool = True):
+    """
+    等同 process.communicate(timeout)，但額外回傳該子行程的資源使用量。
+    使用 os.wait4 取得單一子行程的 rusage，避免並行執行時 RUSAGE_CHILDREN 互相干擾。
+    回傳 (stdout, stderr, usage)。
+    逾時時拋出 subprocess.TimeoutExpired：預設先終止並回收子行程，
+    例外的 output / stderr 為已讀到的輸出，usage 屬性為資源使用量；
+    kill_on_timeout=False 時行程保持執行 (usage 為 None)。
+    """
+    started = time.time()
+
+    if not RLIMITS_AVAILABLE:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            if kill_on_timeout:
+                process.kill()
+                e.output, e.stderr = process.communicate()
+                e.usage = {"wall_time": round(time.time() - started, 3), "timed_out": True}
+            else:
+                e.usage = None
+            raise
+        return stdout, stderr, {"wall_time": round(time.time() - started, 3)}
+
+    streams = {}
+
+    def drain(name, stream):
+        streams[name] = stream.read() if stream else b""
+
+    readers = [
+        threading.Thread(target=drain, args=("stdout", process.stdout), daemon=True),
+        threading.Thread(target=drain, args=("stderr", process.stderr), daemon=True),
+    ]
+    for t in readers:
+        t.start()
+
+    waited = {}
+
+    def reap():
+        try:
+            _, status, ru = os.wait4(process.pid, 0)
+            waited["status"] = status
+            waited["rusage"] = ru
+        except ChildProcessError:
+            pass
+
+    reaper = threading.Thread(target=reap, daemon=True)
+    reaper.start()
+    reaper.join(timeout)
+    timed_out = reaper.is_alive()
+    if timed_out:
+        if not kill_on_timeout:
+            error = subprocess.TimeoutExpired(process.args, timeout)
+            error.usage = None
+            raise error
+        # 終止後由 reaper 回收 (不留下 zombie)，並取得至今的資源使用量
+        # 直接送出訊號：Popen.kill() 會先 poll()，可能搶先回收而遺失 rusage
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        reaper.join()
+
+    for t in readers:
+        # 子行程已結束；孫行程若仍持有 pipe 則不再等待
+        t.join(None if not timed_out else 1.0)
+
+    wall_time = time.time() - started
+    if "status" in waited:
+        process.returncode = os.waitstatus_to_exitcode(waited["status"])
+        usage = _usage_from_rusage(waited["rusage"], wall_time)
+    else:
+        process.wait()
+        usage = {"wall_time": round(wall_time, 3)}
+    stdout, stderr = streams.get("stdout", b""), streams.get("stderr", b"")
+
+    if timed_out:
+        usage["timed_out"] = True
+        error = subprocess.TimeoutExpired(process.args, timeout, output=stdout, stderr=stderr)
+        error.usage = usage
+        raise error
+    return stdout, stderr, usage
+
+
+def describe_limit_violation(returncode: int) -> str:
+    """將被訊號終止的結束碼轉為資源限制說明，無關則回傳空字串"""
+    if returncode is None or returncode >= 0:
+        return ""
+    sig = -returncode
+    if sig == getattr(signal, "SIGXCPU", None):
+        return "超過 CPU 時間限制"
+    if sig == getattr(signal, "SIGXFSZ", None):
+        return "超過檔案大小限制"
+    if sig == signal.SIGKILL:
+        return "行程被強制終止 (可能超過 CPU 或記憶體限制)"
+    return ""
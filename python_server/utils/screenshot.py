@@ -1,7 +1,12 @@
 import os
+import math
 import time
+import queue
+import threading
 from datetime import datetime
 
+from utils.capture_backends import get_backend, fallback_backend
+
 # 截圖功能
 try:
     import mss
@@ -9,51 +14,279 @@ try:
     MSS_AVAILABLE = True
 except ImportError:
     MSS_AVAILABLE = False
-    print("[WARNING] mss 未安裝，截圖功能將無法使用。請執行：pip install mss")
+    print("[WARNING] mss 未安裝，將改用終端輸出繪製截圖。請執行：pip install mss")
 
-def take_screenshot(project_path, version_id, file_path, error_msg, status, db_connection_factory=None):
+# 影像縮放與壓縮 (選用)，未安裝時改用 mss 的 PNG 輸出
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# 儲存設定，可用環境變數覆寫
+SCREENSHOT_MAX_WIDTH = int(os.getenv("CODESYNTH_SCREENSHOT_MAX_WIDTH", "1280"))
+THUMBNAIL_WIDTH = int(os.getenv("CODESYNTH_SCREENSHOT_THUMB_WIDTH", "320"))
+SCREENSHOT_FORMAT = os.getenv("CODESYNTH_SCREENSHOT_FORMAT", "webp").lower()  # webp | jpeg | png
+SCREENSHOT_QUALITY = int(os.getenv("CODESYNTH_SCREENSHOT_QUALITY", "70"))
+SCREENSHOT_KEEP_PER_VERSION = int(os.getenv("CODESYNTH_SCREENSHOT_KEEP", "5"))
+
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "jpg": "jpg", "png": "png"}
+
+
+def _output_extension(capture=None) -> str:
+    """依實際截圖結果決定副檔名：SVG 截圖輸出 .svg，點陣截圖依設定格式 (無 Pillow 時為 PNG)"""
+    if capture is not None and capture.kind == "svg":
+        return "svg"
+    if not PIL_AVAILABLE:
+        return "png"
+    return _EXTENSIONS.get(SCREENSHOT_FORMAT, "webp")
+
+
+def _downscale_rgb(rgb: bytes, size: tuple, max_width: int):
     """
-    測試失敗時自動截圖
-    注意：db_connection_factory 是一個函數，調用後返回 (conn, db_path)
+    以整數倍取樣縮小 RGB 原始資料 (無 Pillow 時使用)。
+    使用 slice 指派逐列抽樣，避免逐像素的 Python 迴圈。
+    """
+    width, height = size
+    factor = math.ceil(width / max_width) if max_width else 1
+    if factor <= 1:
+        return rgb, size
+
+    new_w, new_h = width // factor, height // factor
+    row_bytes = width * 3
+    span = new_w * factor * 3
+    out = bytearray(new_w * new_h * 3)
+    for y in range(new_h):
+        start = y * factor * row_bytes
+        row = rgb[start:start + span]
+        o = y * new_w * 3
+        out[o:o + new_w * 3:3] = row[0::3 * factor]
+        out[o + 1:o + new_w * 3:3] = row[1::3 * factor]
+        out[o + 2:o + new_w * 3:3] = row[2::3 * factor]
+    return bytes(out), (new_w, new_h)
+
+
+def _save_image(rgb: bytes, size: tuple, max_width: int, output_path: str):
+    """縮放至 max_width 以內並以精簡格式寫入"""
+    if PIL_AVAILABLE:
+        image = Image.frombytes("RGB", size, rgb)
+        if max_width and image.width > max_width:
+            ratio = max_width / image.width
+            image = image.resize((max_width, max(1, int(image.height * ratio))), Image.BILINEAR, reducing_gap=2.0)
+        ext = _output_extension()
+        if ext == "png":
+            image.save(output_path, format="PNG", optimize=True)
+        else:
+            image.save(output_path, format="WEBP" if ext == "webp" else "JPEG",
+                       quality=SCREENSHOT_QUALITY)
+    else:
+        data, scaled_size = _downscale_rgb(rgb, size, max_width)
+        mss.tools.to_png(data, scaled_size, level=9, output=output_path)
+
+
+def _save_svg(svg: str, size: tuple, max_width: int, output_path: str):
+    """SVG 以 viewBox 縮放，只需改寫外框尺寸"""
+    width, height = size
+    if max_width and width > max_width:
+        scaled = f'width="{max_width}" height="{max(1, int(height * max_width / width))}"'
+        svg = svg.replace(f'width="{width}" height="{height}"', scaled, 1)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(svg)
+
+
+def get_display_env():
+    """
+    模擬程式的執行環境：若使用虛擬顯示器 (Xvfb)，回傳帶 DISPLAY 的 os.environ 副本；
+    否則回傳 None (沿用目前環境)
+    """
+    try:
+        extra = get_backend().display_env()
+    except Exception as e:
+        print(f"[WARNING] 虛擬顯示器啟動失敗: {e}")
+        return None
+    if not extra:
+        return None
+    env = dict(os.environ)
+    env.update(extra)
+    return env
+
+
+def _plan_paths(project_path, version_id, ext):
+    """決定截圖與縮圖的輸出路徑"""
+    screenshots_dir = os.path.join(project_path, "screenshots")
+    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    screenshot_path = os.path.join(screenshots_dir, f"error_{timestamp_str}_{version_id}.{ext}")
+    thumbnail_path = os.path.join(screenshots_dir, "thumbs", f"error_{timestamp_str}_{version_id}.{ext}")
+    return screenshot_path, thumbnail_path
+
+
+def _prune_old_captures(cursor, version_id):
+    """保留策略：每個版本只保留最新 SCREENSHOT_KEEP_PER_VERSION 張截圖"""
+    if SCREENSHOT_KEEP_PER_VERSION <= 0:
+        return
+    cursor.execute("""SELECT id, screenshot_path, thumbnail_path FROM screenshots
+                      WHERE version_id=? ORDER BY timestamp DESC
+                      LIMIT -1 OFFSET ?""", (version_id, SCREENSHOT_KEEP_PER_VERSION))
+    stale = cursor.fetchall()
+    for row_id, image_path, thumb_path in stale:
+        for path in (image_path, thumb_path):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"[WARNING] 刪除舊截圖失敗: {e}")
+        cursor.execute("DELETE FROM screenshots WHERE id=?", (row_id,))
+
+
+def _grab(job: dict):
+    """
+    擷取畫面 (失敗時改用備援後端)，並依實際的截圖格式決定輸出路徑。
+    只做擷取，縮放、寫檔與資料庫寫入交給 _store；找不到可截取的螢幕時回傳 None
     """
-    if not MSS_AVAILABLE:
-        print("[WARNING] 截圖功能不可用：mss 未安裝")
+    backend = get_backend()
+    try:
+        capture = backend.capture(job)
+    except Exception as e:
+        print(f"[WARNING] 截圖後端 {backend.name} 失敗: {e}")
+        backend = fallback_backend(backend)
+        capture = backend.capture(job)
+    if capture is None:
+        print("[WARNING] 找不到可截取的螢幕")
         return None
-    
+
+    job["capture"] = capture
+    job["screenshot_path"], job["thumbnail_path"] = _plan_paths(
+        job["project_path"], job["version_id"], _output_extension(capture))
+    return job
+
+
+def _store(job: dict):
+    """縮放、寫檔、寫入資料庫與清理舊截圖"""
+    project_path = job["project_path"]
+    capture = job["capture"]
+
     try:
-        # 建立截圖目錄
-        screenshots_dir = os.path.join(project_path, "screenshots")
-        os.makedirs(screenshots_dir, exist_ok=True)
-        
-        # 生成檔名
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"error_{timestamp_str}_{version_id}.png"
-        screenshot_path = os.path.join(screenshots_dir, filename)
-        
-        # 截圖
-        with mss.mss() as sct:
-            # 截取主螢幕
-            if sct.monitors:
-                 # sct.monitors[0] is all monitors combined, sct.monitors[1] is the first one
-                screenshot = sct.grab(sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0])
-                # 保存
-                mss.tools.to_png(screenshot.rgb, screenshot.size, output=screenshot_path)
-        
+        screenshot_path = job["screenshot_path"]
+        thumbnail_path = job["thumbnail_path"]
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+
+        if capture.kind == "svg":
+            _save_svg(capture.data, capture.size, SCREENSHOT_MAX_WIDTH, screenshot_path)
+            _save_svg(capture.data, capture.size, THUMBNAIL_WIDTH, thumbnail_path)
+        else:
+            _save_image(capture.data, capture.size, SCREENSHOT_MAX_WIDTH, screenshot_path)
+            _save_image(capture.data, capture.size, THUMBNAIL_WIDTH, thumbnail_path)
+
         # 保存到資料庫 (如果提供了 DB Factory)
+        db_connection_factory = job.get("db_connection_factory")
         if db_connection_factory:
             conn, _ = db_connection_factory(project_path)
-            c = conn.cursor()
-            c.execute("""INSERT INTO screenshots 
-                         (version_id, file_path, screenshot_path, 
-                          error_message, timestamp, test_status)
-                         VALUES (?, ?, ?, ?, ?, ?)""",
-                      (version_id, file_path, screenshot_path, 
-                       error_msg, time.time(), status))
-            conn.commit()
-            conn.close()
-        
+            try:
+                c = conn.cursor()
+                c.execute("""INSERT INTO screenshots
+                             (version_id, file_path, screenshot_path, thumbnail_path,
+                              error_message, timestamp, test_status)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                          (job["version_id"], job["file_path"], screenshot_path, thumbnail_path,
+                           job["error_msg"], job["timestamp"], job["status"]))
+                _prune_old_captures(c, job["version_id"])
+                conn.commit()
+            finally:
+                conn.close()
+
         print(f"📸 已自動截圖: {screenshot_path}")
         return screenshot_path
     except Exception as e:
         print(f"❌ 截圖失敗: {e}")
         return None
+
+
+class ScreenshotWorker:
+    """
+    背景截圖 worker。
+    模擬請求只擷取畫面並取得最終路徑，縮放、壓縮與資料庫寫入在背景執行緒完成。
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="screenshot-worker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                _store(job)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, job: dict) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            print("[WARNING] 截圖佇列已滿，略過本次截圖")
+            return False
+
+    def stop(self, timeout: float = 5.0):
+        """關閉前處理完佇列中的截圖"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+screenshot_worker = ScreenshotWorker()
+
+
+def _build_job(project_path, version_id, file_path, error_msg, status, db_connection_factory):
+    return {
+        "project_path": project_path,
+        "version_id": version_id,
+        "file_path": file_path,
+        "error_msg": error_msg,
+        "status": status,
+        "timestamp": time.time(),
+        "db_connection_factory": db_connection_factory,
+    }
+
+
+def _grab_job(project_path, version_id, file_path, error_msg, status, db_connection_factory):
+    try:
+        return _grab(_build_job(project_path, version_id, file_path, error_msg, status, db_connection_factory))
+    except Exception as e:
+        print(f"❌ 截圖失敗: {e}")
+        return None
+
+
+def capture_screenshot_async(project_path, version_id, file_path, error_msg, status, db_connection_factory=None):
+    """
+    測試失敗時立即擷取畫面，縮放、寫檔與資料庫寫入排入背景；
+    返回最終的截圖路徑 (檔案稍後才會寫入)
+    注意：db_connection_factory 是一個函數，調用後返回 (conn, db_path)
+    """
+    job = _grab_job(project_path, version_id, file_path, error_msg, status, db_connection_factory)
+    if job is None or not screenshot_worker.submit(job):
+        return None
+    return job["screenshot_path"]
+
+
+def take_screenshot(project_path, version_id, file_path, error_msg, status, db_connection_factory=None):
+    """
+    測試失敗時自動截圖 (同步版本，完成後才返回)
+    注意：db_connection_factory 是一個函數，調用後返回 (conn, db_path)
+    """
+    job = _grab_job(project_path, version_id, file_path, error_msg, status, db_connection_factory)
+    return _store(job) if job is not None else None
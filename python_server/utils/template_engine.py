@@ -0,0 +1,143 @@
+import re
+import html
+from utils.cache import LRUCache
+
+# 技能範本語法：
+#   {{ name }}                     參數值，缺少且無預設值時拋出 MissingParameterError
+#   {{ name | default:"文字" }}    缺少時使用預設值
+#   {{ name | html }}              HTML 跳脫
+#   {% if name %}...{% else %}...{% endif %}   ({% if not name %} 亦可)
+_TOKEN_RE = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}", re.S)
+_NAME_RE = re.compile(r"\s*([A-Za-z_]\w*)\s*")
+_FILTER_RE = re.compile(r'\|\s*(\w+)\s*(?::\s*"((?:[^"\\]|\\.)*)")?\s*')
+_IF_RE = re.compile(r"if\s+(not\s+)?([A-Za-z_]\w*)$")
+
+# 已編譯範本快取: 呼叫端提供含來源 mtime 的 key
+TEMPLATE_CACHE = LRUCache(max_entries=256)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class MissingParameterError(TemplateError):
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        super().__init__(f"Missing parameter(s): {', '.join(self.names)}")
+
+
+class Template:
+    """
+    編譯後的範本：節點串列，渲染時單次走訪
+    節點: ("text", str) / ("var", name, default, escape) / ("if", name, negate, then_nodes, else_nodes)
+    """
+
+    def __init__(self, nodes: list, required: set):
+        self.nodes = nodes
+        # 不在條件區塊內且沒有預設值的參數，可在渲染前一次檢查
+        self.required = required
+
+    def render(self, params: dict) -> str:
+        missing = [name for name in self.required if params.get(name) is None]
+        if missing:
+            raise MissingParameterError(missing)
+        out = []
+        _render(self.nodes, params, out)
+        return "".join(out)
+
+
+def _render(nodes: list, params: dict, out: list):
+    for node in nodes:
+        kind = node[0]
+        if kind == "text":
+            out.append(node[1])
+        elif kind == "var":
+            _, name, default, escape = node
+            value = params.get(name)
+            if value is None:
+                if default is None:
+                    raise MissingParameterError([name])
+                value = default
+            value = str(value)
+            out.append(html.escape(value) if escape else value)
+        else:
+            _, name, negate, then_nodes, else_nodes = node
+            if bool(params.get(name)) != negate:
+                _render(then_nodes, params, out)
+            else:
+                _render(else_nodes, params, out)
+
+
+def _parse_var(expr: str, line: int):
+    m = _NAME_RE.match(expr)
+    if not m:
+        raise TemplateError(f"line {line}: invalid expression '{{{{{expr}}}}}'")
+    name, default, escape = m.group(1), None, False
+    pos = m.end()
+    while pos < len(expr):
+        f = _FILTER_RE.match(expr, pos)
+        if not f:
+            raise TemplateError(f"line {line}: invalid expression '{{{{{expr}}}}}'")
+        filter_name, arg = f.group(1), f.group(2)
+        if filter_name == "default" and arg is not None:
+            default = re.sub(r"\\(.)", r"\1", arg)
+        elif filter_name == "html" and arg is None:
+            escape = True
+        else:
+            raise TemplateError(f"line {line}: unknown filter '{filter_name}'")
+        pos = f.end()
+    return ("var", name, default, escape)
+
+
+def compile_template(source: str) -> Template:
+    root = []
+    required = set()
+    # [(目前節點串列, if 節點, 是否已進入 else)]
+    stack = [(root, None, False)]
+    pos = 0
+    for m in _TOKEN_RE.finditer(source):
+        nodes = stack[-1][0]
+        if m.start() > pos:
+            nodes.append(("text", source[pos:m.start()]))
+        pos = m.end()
+        line = source.count("\n", 0, m.start()) + 1
+
+        if m.group(1) is not None:
+            node = _parse_var(m.group(1), line)
+            if node[2] is None and len(stack) == 1:
+                required.add(node[1])
+            nodes.append(node)
+            continue
+
+        tag = m.group(2).strip()
+        if_match = _IF_RE.match(tag)
+        if if_match:
+            node = ("if", if_match.group(2), bool(if_match.group(1)), [], [])
+            nodes.append(node)
+            stack.append((node[3], node, False))
+        elif tag == "else":
+            _, node, in_else = stack[-1]
+            if node is None or in_else:
+                raise TemplateError(f"line {line}: unexpected {{% else %}}")
+            stack[-1] = (node[4], node, True)
+        elif tag == "endif":
+            if len(stack) == 1:
+                raise TemplateError(f"line {line}: unexpected {{% endif %}}")
+            stack.pop()
+        else:
+            raise TemplateError(f"line {line}: unknown tag '{{% {tag} %}}'")
+
+    if len(stack) > 1:
+        raise TemplateError("unclosed {% if %} block")
+    if pos < len(source):
+        root.append(("text", source[pos:]))
+    return Template(root, required)
+
+
+def get_template(key: tuple, load) -> Template:
+    """key 需包含來源的 mtime (或內容本身)；load() 於快取未命中時提供範本原始碼"""
+    template = TEMPLATE_CACHE.get(key)
+    if template is None:
+        template = compile_template(load())
+        TEMPLATE_CACHE.put(key, template)
+    return template
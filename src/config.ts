@@ -19,6 +19,7 @@ export const API = {
     AI_CONTEXT: `${SERVER_URL}/api/ai/context`,
     AI_MEMORY: `${SERVER_URL}/api/ai/memory`,
     AI_CONDENSE: `${SERVER_URL}/api/ai/condense_memory`,
+    AI_KEEPALIVE: `${SERVER_URL}/api/ai/keepalive`,
     STAGE_CREATE: `${SERVER_URL}/api/stage/create`,
     STAGE_LIST: `${SERVER_URL}/api/stage/list`,
     STAGE_ITEMS: `${SERVER_URL}/api/stage/items`,
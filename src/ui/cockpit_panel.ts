@@ -5,12 +5,16 @@ import axios from 'axios';
 import { getCockpitHTML } from './html_templates';
 import { API, SERVER_URL } from '../config';
 
+/** 控制台開啟期間，定期通知後端保持本機模型載入 (毫秒) */
+const MODEL_KEEPALIVE_INTERVAL = 5 * 60 * 1000;
+
 export class CockpitPanel {
     public static currentPanel: CockpitPanel | undefined;
     private readonly _panel: vscode.WebviewPanel;
     private readonly _extensionUri: vscode.Uri;
     private _projectPath: string;
     private _disposables: vscode.Disposable[] = [];
+    private _keepAliveTimer: NodeJS.Timeout | undefined;
     public versionSelection: Map<string, number> = new Map();
 
     private constructor(panel: vscode.WebviewPanel, extensionUri: vscode.Uri, projectPath: string) {
@@ -25,6 +29,16 @@ export class CockpitPanel {
         // This happens when the user closes the panel or when the panel is closed programmatically
         this._panel.onDidDispose(() => this.dispose(), null, this._disposables);
 
+        // Keep the local model warm only while the cockpit is visible
+        this._startModelKeepAlive();
+        this._panel.onDidChangeViewState(e => {
+            if (e.webviewPanel.visible) {
+                this._startModelKeepAlive();
+            } else {
+                this._stopModelKeepAlive();
+            }
+        }, null, this._disposables);
+
         // Handle messages from the webview
         this._panel.webview.onDidReceiveMessage(
             message => this._handleMessage(message),
@@ -65,6 +79,7 @@ export class CockpitPanel {
 
     public dispose() {
         CockpitPanel.currentPanel = undefined;
+        this._stopModelKeepAlive();
 
         // Clean up our resources
         this._panel.dispose();
@@ -77,6 +92,27 @@ export class CockpitPanel {
         }
     }
 
+    private _startModelKeepAlive() {
+        if (this._keepAliveTimer) {
+            return;
+        }
+        const ping = () => {
+            axios.post(API.AI_KEEPALIVE).catch(e => {
+                // Ollama 或 server 未啟動時不打擾使用者
+                console.debug(`[CodeSynth] Model keepalive failed: ${e}`);
+            });
+        };
+        ping();
+        this._keepAliveTimer = setInterval(ping, MODEL_KEEPALIVE_INTERVAL);
+    }
+
+    private _stopModelKeepAlive() {
+        if (this._keepAliveTimer) {
+            clearInterval(this._keepAliveTimer);
+            this._keepAliveTimer = undefined;
+        }
+    }
+
     public async refresh() {
         await this._update();
     }